@@ -1,11 +1,16 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import pickle
-import json
-from pathlib import Path
-import plotly.graph_objects as go
-import plotly.express as px
+
+from attributions import ATTRIBUTION_BUDGET_SECONDS, FeatureAttributions
+from cohort_percentiles import PERCENTILES_FILE, load_percentile_tables
+from feature_engineering import build_student_features
+from inference import artifact_version
+from model_bundle import ArtifactLoadError
+from persona import load_persona_model
+from prediction_cache import PredictionCache
+from similar_students import N_SIMILAR, load_similar_students
+from startup import STARTUP, ArtifactWarmer
 
 # Page configuration
 st.set_page_config(
@@ -59,22 +64,168 @@ st.markdown("""
 # Title
 st.markdown('<div class="main-header">🎓 EducationCare Student Success Predictor</div>', unsafe_allow_html=True)
 st.markdown("### Personalized Learning Support & Outcome Prediction")
-st.markdown("---")
 
-# Load model and preprocessors (placeholder - you'll need to save these from your notebook)
+# Load model and preprocessors (saved from the notebook with save_model.py).
+# Keyed on the artifact version, so re-saved artifacts are picked up on the next rerun
+@st.cache_resource(max_entries=1)
+def start_warmup(version):
+    """Start loading the model in a background thread (first script run of the server process)"""
+    # The memory-mapped model_bundle/ if saved, else the individual pickles;
+    # plotly is imported there too, so the first prediction finds it loaded
+    return ArtifactWarmer('.').start()
+
+@st.cache_resource(max_entries=1)
+def load_model(version):
+    """Load the trained model, scaler and encoder behind one batched inference core"""
+    try:
+        # Waits for the warm-up thread if it is still loading
+        return start_warmup(version).result()
+    except ArtifactLoadError as e:
+        st.warning(f"⚠️ Model component '{e.component}' failed to load ({e.cause}). Using demo mode.")
+        return None
+    except ValueError as e:
+        st.warning(f"⚠️ Model artifacts do not match the features ({e}). Using demo mode.")
+        return None
+
+# Nearest past students (KD-tree stored in model_bundle/ by similar_students.py)
+@st.cache_resource(max_entries=1)
+def load_similar_students_finder(version):
+    """Similar-students lookup, or None without a model or a neighbour index"""
+    inference_core = load_model(version)
+    if inference_core is None:
+        return None
+    try:
+        return load_similar_students('.', core=inference_core)
+    except (ArtifactLoadError, ValueError):
+        return None
+
+# Personas from the notebook's UMAP + KMeans clustering (persona.py: no UMAP at serving time)
+@st.cache_resource(max_entries=1)
+def load_personas(version):
+    """Persona lookup, or None if the bundle has no persona model"""
+    try:
+        return load_persona_model('.')
+    except (ArtifactLoadError, ValueError):
+        return None
+
+# TreeSHAP attributions from the loaded tree ensemble (leaf paths are extracted once per model)
+@st.cache_resource(max_entries=1)
+def load_attributions(version):
+    """Per-prediction feature attributions, or None without a model the compiled engine explains"""
+    inference_core = load_model(version)
+    if inference_core is None:
+        return None
+    try:
+        return FeatureAttributions(inference_core)
+    except ValueError:
+        return None
+
+def predict_and_explain(features, inference_core, explainer):
+    """Outcome probabilities plus, when available, each feature's attribution per outcome"""
+    result = {'probabilities': inference_core.predict_proba_frame(features).iloc[0].to_dict(),
+              'attributions': None, 'attribution_unit': None}
+    if explainer is not None:
+        values = explainer.explain(features, budget_seconds=ATTRIBUTION_BUDGET_SECONDS)[0]
+        result['attributions'] = {outcome: dict(zip(explainer.features, values[:, k]))
+                                  for k, outcome in enumerate(inference_core.classes)}
+        result['attribution_unit'] = explainer.output_unit
+    return result
+
+# Labels for the attribution chart (other features show their column name)
+FACTOR_LABELS = {
+    'score': 'Assessment Score',
+    'sum': 'Total Clicks',
+    'count': 'Total Activities',
+    'engagement_cv': 'Engagement Consistency',
+    'activity_diversity': 'Activity Diversity',
+    'submission_timeliness': 'Submission Timeliness',
+    'num_of_prev_attempts': 'Previous Attempts',
+    'learning_pace': 'Learning Pace',
+    'studied_credits': 'Studied Credits',
+    'highest_education': 'Highest Education',
+    'performance_by_registration': 'Performance by Registration',
+}
+
+# Factors shown in the attribution chart
+N_FACTORS = 8
+
+# Predictions shared by every session and rerun (the sidebar inputs are integers or
+# fixed-step sliders already, so the feature vector is keyed as is, unquantized)
+@st.cache_resource
+def prediction_cache():
+    return PredictionCache(max_entries=1024, ttl_seconds=3600)
+
+# Historical cohort as sorted quantile arrays (built by cohort_percentiles.py), not the training frame
 @st.cache_resource
-def load_model():
-    """Load the trained model and preprocessors"""
+def load_cohort_percentiles():
+    """Cohort percentile tables, or None if they have not been built"""
     try:
-        # You'll need to save these from your notebook first
-        # Example: pickle.dump(model, open('model.pkl', 'wb'))
-        model = pickle.load(open('model.pkl', 'rb'))
-        scaler = pickle.load(open('scaler.pkl', 'rb'))
-        encoder = pickle.load(open('encoder.pkl', 'rb'))
-        return model, scaler, encoder
-    except:
-        st.warning("⚠️ Model files not found. Using demo mode.")
-        return None, None, None
+        return load_percentile_tables(PERCENTILES_FILE)
+    except (OSError, KeyError, ValueError):
+        return None
+
+# Features placed against the cohort in "Where This Student Stands"
+COHORT_CONTEXT_FEATURES = {
+    'score': 'Average Score',
+    'sum': 'Total Clicks',
+    'count': 'Total Activities',
+    'engagement_cv': 'Engagement CV',
+    'submission_timeliness': 'Submission Timeliness (days)',
+    'learning_pace': 'Learning Pace (days)',
+}
+
+# Readiness indicator (the model warms up while the form is being filled in)
+model_version = artifact_version('.')
+warmer = start_warmup(model_version)
+if warmer.status == 'loading':
+    st.caption("⏳ Model loading in the background - predictions are available in a moment")
+elif warmer.status == 'ready':
+    st.caption(f"✅ Model ready (loaded in {warmer.seconds:.1f}s)")
+else:
+    st.caption("⚠️ Model unavailable - predictions run in demo mode")
+st.markdown("---")
+
+# Module length used for the form's single student-presentation (longest OULAD presentation)
+FORM_PRESENTATION_LENGTH = 269
+
+def student_records_from_form(student, primary_activity_type, other_activity_types, total_clicks,
+                              activity_count, engagement_consistency, avg_score, total_assessments,
+                              banked_assessments, submission_timeliness, days_between_submissions,
+                              days_since_registration):
+    """
+    Turn the sidebar answers into the student's activity and assessment records.
+
+    The model features are then computed from these records by
+    build_student_features, i.e. with the same code as training.
+    Clicks are split over the activity types used: evenly for a fully
+    consistent student, all on the primary type for a fully variable one.
+    """
+    activity_types = [primary_activity_type] + [t for t in other_activity_types if t != primary_activity_type]
+    n_types = len(activity_types)
+    primary_share = 1 / n_types + (1 - engagement_consistency) * (1 - 1 / n_types)
+    shares = np.full(n_types, (1 - primary_share) / max(n_types - 1, 1))
+    shares[0] = primary_share
+    activity = pd.DataFrame({
+        'activity_type': activity_types,
+        'sum': np.rint(total_clicks * shares).astype(int),
+        'count': np.rint(activity_count * shares).astype(int),
+    })
+
+    n = int(total_assessments)
+    dates = days_between_submissions * np.arange(1, n + 1)
+    assessments = pd.DataFrame({
+        'assessment_type': 'TMA',
+        'date': dates,
+        'weight': 100 / n,
+        'date_submitted': dates + submission_timeliness,
+        'is_banked': (np.arange(n) < banked_assessments).astype(int),
+        'score': avg_score,
+    })
+
+    student = dict(student)
+    student['date_registration'] = dates.mean() - days_since_registration
+    student['module_presentation_length'] = FORM_PRESENTATION_LENGTH
+    return student, activity, assessments
 
 # Cluster interpretations based on your analysis
 CLUSTER_INTERPRETATIONS = {
@@ -223,6 +374,17 @@ with st.sidebar:
         help="Most frequently used activity type"
     )
     
+    other_activity_types = st.multiselect(
+        "Other Activity Types Used",
+        options=["forumng", "homepage", "oucontent", "resource", 
+                 "subpage", "url", "quiz", "page", "dataplus",
+                 "folder", "oucollaborate", "ouelluminate", "glossary",
+                 "dualpane", "externalquiz", "sharedsubpage", "questionnaire",
+                 "htmlactivity", "repeatactivity", "ouwiki"],
+        default=["homepage", "resource"],
+        help="Other activity types the student uses regularly"
+    )
+    
     # Performance Metrics
     st.markdown("### Assessment Performance")
     
@@ -270,12 +432,12 @@ with st.sidebar:
     )
     
     learning_pace = st.slider(
-        "Learning Pace (credits/day)",
+        "Learning Pace (days between submissions)",
         min_value=0.0,
-        max_value=5.0,
-        value=1.0,
-        step=0.1,
-        help="Rate of credit completion"
+        max_value=60.0,
+        value=14.0,
+        step=1.0,
+        help="Typical number of days between two assessment submissions"
     )
     
     engagement_consistency = st.slider(
@@ -293,17 +455,34 @@ col1, col2 = st.columns([2, 1])
 with col1:
     st.markdown("## 📊 Student Profile Summary")
     
-    # Calculate derived features
-    repeat_student = 1 if num_of_prev_attempts > 0 else 0
+    # Form heuristics used by the demo rules and advice below (not model inputs)
     activity_diversity = min(activity_count / 20, 1.0)  # Normalized
-    score_per_weight = avg_score / max(studied_credits, 1)
-    banked_ratio = banked_assessments / max(total_assessments, 1)
-    engagement_cv = 1 - engagement_consistency  # Coefficient of variation (inverse of consistency)
-    
-    # Calculate engagement metrics
-    assessment_engagement = total_clicks / max(total_assessments, 1)
-    module_engagement_rate = total_clicks / max(days_since_registration, 1)
-    weighted_engagement = total_clicks * (1 - engagement_cv)
+    engagement_variability = 1 - engagement_consistency
+    
+    # Model inputs: computed from the student's records with the training feature code
+    student_features = build_student_features(*student_records_from_form(
+        student={
+            'gender': gender,
+            'region': region,
+            'highest_education': highest_education,
+            'imd_band': imd_band,
+            'age_band': age_band,
+            'disability': disability,
+            'num_of_prev_attempts': num_of_prev_attempts,
+            'studied_credits': studied_credits,
+        },
+        primary_activity_type=activity_type,
+        other_activity_types=other_activity_types,
+        total_clicks=total_clicks,
+        activity_count=activity_count,
+        engagement_consistency=engagement_consistency,
+        avg_score=avg_score,
+        total_assessments=total_assessments,
+        banked_assessments=banked_assessments,
+        submission_timeliness=submission_timeliness,
+        days_between_submissions=learning_pace,
+        days_since_registration=days_since_registration,
+    ))
     
     # Display profile in columns
     prof_col1, prof_col2, prof_col3 = st.columns(3)
@@ -320,8 +499,24 @@ with col1:
     
     with prof_col3:
         st.metric("Submission Timeliness", f"{submission_timeliness:.0f} days")
-        st.metric("Learning Pace", f"{learning_pace:.2f}")
-        st.metric("Engagement CV", f"{engagement_cv:.2f}")
+        st.metric("Learning Pace", f"{learning_pace:.0f} days")
+        st.metric("Engagement CV", f"{student_features['engagement_cv'].iloc[0]:.2f}")
+    
+    # Where the student stands against the historical cohort (binary search in the quantile tables)
+    cohort = load_cohort_percentiles()
+    if cohort is not None:
+        with st.expander("📍 Where This Student Stands"):
+            for feature, label in COHORT_CONTEXT_FEATURES.items():
+                value = float(student_features[feature].iloc[0])
+                percentile = cohort.percentile(feature, value)
+                if percentile is None:
+                    continue
+                st.markdown(f"**{label}**: {value:,.2f} (higher than {percentile:.0f}% of past students)")
+                bands = cohort.outcome_bands(feature)
+                if bands:
+                    st.caption("Middle 50% by outcome: " + " · ".join(
+                        f"{outcome} {low:,.2f}–{high:,.2f}" for outcome, (low, _, high) in bands.items()
+                    ))
 
 with col2:
     st.markdown("## 🎯 Quick Stats")
@@ -334,7 +529,7 @@ with col2:
         risk_factors += 1
     if submission_timeliness > 10:
         risk_factors += 1
-    if engagement_cv > 0.7:
+    if engagement_variability > 0.7:
         risk_factors += 1
     if activity_count < 10:
         risk_factors += 1
@@ -355,43 +550,21 @@ predict_button = st.button("🔮 Predict Student Outcome", type="primary", use_c
 if predict_button:
     st.markdown("## 🎯 Prediction Results")
     
-    # Prepare feature vector (matching your notebook's features)
-    # Note: This is a simplified version. You'll need to adjust based on your actual preprocessing
-    
-    features_dict = {
-        'num_of_prev_attempts': num_of_prev_attempts,
-        'repeat_student': repeat_student,
-        'studied_credits': studied_credits,
-        'sum': total_clicks,
-        'count': activity_count,
-        'activity_diversity': activity_diversity,
-        'score': avg_score,
-        'score_per_weight': score_per_weight,
-        'assessment_engagement_score': assessment_engagement,
-        'module_engagement_rate': module_engagement_rate,
-        'weighted_engagement': weighted_engagement,
-        'engagement_trend': 0.0,  # Would need historical data
-        'submission_timeliness': submission_timeliness,
-        'banked_assessment_ratio': banked_ratio,
-        'days_since_registration': days_since_registration,
-        'score_trend': 0.0,  # Would need historical data
-        'score_momentum': 0.0,  # Would need historical data
-        'performance_by_registration': avg_score / max(days_since_registration, 1),
-        'learning_pace': learning_pace,
-        'engagement_cv': engagement_cv,
-    }
+    # Imported here rather than at startup: only needed once a prediction is shown
+    import plotly.graph_objects as go
+    import plotly.express as px
     
-    # Demo prediction (replace with actual model prediction)
-    model, scaler, encoder = load_model()
+    # Feature vector: student_features (computed above like the notebook's features)
+    inference_core = load_model(model_version)
     
-    if model is None:
+    if inference_core is None:
         # Demo mode - rule-based prediction
         st.info("📍 Running in Demo Mode (model files not loaded)")
         
         # Simple rule-based prediction for demo
         prediction_score = (
             (avg_score / 100) * 0.4 +
-            (1 - engagement_cv) * 0.2 +
+            (1 - engagement_variability) * 0.2 +
             (activity_diversity) * 0.15 +
             (1 if submission_timeliness <= 0 else 0) * 0.15 +
             (1 if num_of_prev_attempts == 0 else 0) * 0.1
@@ -410,10 +583,21 @@ if predict_button:
             predicted_outcome = "Withdrawn"
             confidence = 0.68
         
+        # Demo probabilities around the rule-based score
+        probabilities = {
+            "Distinction": max(0, prediction_score - 0.25 + np.random.uniform(-0.05, 0.05)),
+            "Pass": max(0, prediction_score + np.random.uniform(-0.1, 0.1)),
+            "Fail": max(0, 1 - prediction_score + np.random.uniform(-0.1, 0.1)),
+            "Withdrawn": max(0, 1 - prediction_score - 0.2 + np.random.uniform(-0.05, 0.05))
+        }
+        total = sum(probabilities.values())
+        probabilities = {k: v/total for k, v in probabilities.items()}
+        attributions = None
+        
         # Assign to a cluster based on characteristics
         if num_of_prev_attempts > 2:
             cluster_id = 4  # Experienced Repeaters
-        elif avg_score >= 80 and engagement_cv < 0.3:
+        elif avg_score >= 80 and engagement_variability < 0.3:
             cluster_id = 0  # High Achievers
         elif avg_score >= 60 and activity_count > 20:
             cluster_id = 2  # Engaged Achievers
@@ -425,45 +609,39 @@ if predict_button:
             cluster_id = 5  # Fast but Disengaged
     
     else:
-        # Full mode - use actual model (placeholder for now)
+        # Full mode - the form is a batch of one through the batched inference core
         st.info("📍 Model loaded - Using ML predictions")
         
-        # TODO: Add actual model prediction logic here when model files are available
-        # For now, fall back to demo mode logic
-        prediction_score = (
-            (avg_score / 100) * 0.4 +
-            (1 - engagement_cv) * 0.2 +
-            (activity_diversity) * 0.15 +
-            (1 if submission_timeliness <= 0 else 0) * 0.15 +
-            (1 if num_of_prev_attempts == 0 else 0) * 0.1
+        # Probabilities and attributions are cached together, so a cache hit skips both
+        explainer = load_attributions(model_version)
+        prediction = prediction_cache().get_or_compute(
+            student_features,
+            lambda features: predict_and_explain(features, inference_core, explainer),
+            version=model_version,
         )
+        probabilities = prediction['probabilities']
+        attributions = prediction['attributions']
+        attribution_unit = prediction.get('attribution_unit')
+        predicted_outcome = max(probabilities, key=probabilities.get)
+        confidence = probabilities[predicted_outcome]
         
-        if prediction_score >= 0.75:
-            predicted_outcome = "Distinction"
-            confidence = 0.85
-        elif prediction_score >= 0.55:
-            predicted_outcome = "Pass"
-            confidence = 0.78
-        elif prediction_score >= 0.30:
-            predicted_outcome = "Fail"
-            confidence = 0.72
-        else:
-            predicted_outcome = "Withdrawn"
-            confidence = 0.68
-        
-        # Assign cluster
-        if num_of_prev_attempts > 2:
-            cluster_id = 4
-        elif avg_score >= 80 and engagement_cv < 0.3:
-            cluster_id = 0
-        elif avg_score >= 60 and activity_count > 20:
-            cluster_id = 2
-        elif submission_timeliness > 10 or avg_score < 40:
-            cluster_id = 1
-        elif activity_count > 15 and submission_timeliness > 5:
-            cluster_id = 3
-        else:
-            cluster_id = 5
+        # Assign cluster: nearest centroid of the saved clustering, if bundled
+        personas = load_personas(model_version)
+        cluster_id = personas.assign_one(student_features) if personas is not None else None
+        if cluster_id not in CLUSTER_INTERPRETATIONS:
+            # No saved clustering (or a cluster without a persona): same rules as demo mode
+            if num_of_prev_attempts > 2:
+                cluster_id = 4
+            elif avg_score >= 80 and engagement_variability < 0.3:
+                cluster_id = 0
+            elif avg_score >= 60 and activity_count > 20:
+                cluster_id = 2
+            elif submission_timeliness > 10 or avg_score < 40:
+                cluster_id = 1
+            elif activity_count > 15 and submission_timeliness > 5:
+                cluster_id = 3
+            else:
+                cluster_id = 5
     
     # Display prediction
     st.markdown("### 🎓 Predicted Outcome")
@@ -488,7 +666,7 @@ if predict_button:
         color_class = outcome_colors.get(predicted_outcome, "info")
         st.markdown(f"""
         <div class="prediction-box {color_class}-box">
-            <h2>{outcome_icons[predicted_outcome]} {predicted_outcome}</h2>
+            <h2>{outcome_icons.get(predicted_outcome, "📊")} {predicted_outcome}</h2>
             <p style="font-size: 1.2rem;">Confidence: {confidence:.1%}</p>
         </div>
         """, unsafe_allow_html=True)
@@ -550,7 +728,7 @@ if predict_button:
             strengths.append("✅ **Excellent Time Management** - You submit assignments on time or early!")
         if activity_diversity > 0.6:
             strengths.append("✅ **Diverse Learning Approach** - You engage with various learning resources!")
-        if engagement_cv < 0.4:
+        if engagement_variability < 0.4:
             strengths.append("✅ **Consistent Engagement** - You maintain steady participation in the course!")
         if num_of_prev_attempts == 0:
             strengths.append("✅ **First-Time Success Track** - You're tackling this course for the first time!")
@@ -583,7 +761,7 @@ if predict_button:
             improvements.append("   - Participate in discussion forums")
             improvements.append("   - Watch recorded lectures and supplementary materials")
         
-        if engagement_cv > 0.6:
+        if engagement_variability > 0.6:
             improvements.append("🔴 **Engagement Consistency** - Irregular participation detected:")
             improvements.append("   - Establish a regular study schedule")
             improvements.append("   - Dedicate specific times each week to coursework")
@@ -676,17 +854,7 @@ if predict_button:
     # Probability distribution
     st.markdown("### 📊 Outcome Probabilities")
     
-    # Demo probabilities (replace with actual model probabilities)
-    probabilities = {
-        "Distinction": max(0, prediction_score - 0.25 + np.random.uniform(-0.05, 0.05)),
-        "Pass": max(0, prediction_score + np.random.uniform(-0.1, 0.1)),
-        "Fail": max(0, 1 - prediction_score + np.random.uniform(-0.1, 0.1)),
-        "Withdrawn": max(0, 1 - prediction_score - 0.2 + np.random.uniform(-0.05, 0.05))
-    }
-    
-    # Normalize probabilities
-    total = sum(probabilities.values())
-    probabilities = {k: v/total for k, v in probabilities.items()}
+    # probabilities: model predict_proba in full mode, rule-based in demo mode
     
     fig = px.bar(
         x=list(probabilities.keys()),
@@ -704,28 +872,96 @@ if predict_button:
     fig.update_layout(showlegend=False, height=400)
     st.plotly_chart(fig, use_container_width=True)
     
+    # How the most similar past students finished
+    finder = load_similar_students_finder(model_version)
+    if finder is not None:
+        st.markdown("### 👥 Similar Past Students")
+        neighbours = finder.find(student_features, k=N_SIMILAR)
+        outcomes = [n['final_result'] for n in neighbours]
+        st.caption(f"The {len(neighbours)} most similar students in the historical cohort: " + ", ".join(
+            f"{outcomes.count(outcome)} {outcome}" for outcome in dict.fromkeys(outcomes)
+        ))
+        st.dataframe(pd.DataFrame({
+            "Student": [n['id_student'] for n in neighbours],
+            "Outcome": [f"{outcome_icons.get(o, '📊')} {o}" for o in outcomes],
+            "Distance": [round(n['distance'], 2) for n in neighbours],
+        }), hide_index=True, use_container_width=True)
+    
     # Feature importance for this prediction
     st.markdown("### 🔍 Key Factors Influencing This Prediction")
     
-    feature_importance = {
-        "Assessment Score": avg_score / 100 * 0.4,
-        "Engagement Consistency": (1 - engagement_cv) * 0.2,
-        "Activity Diversity": activity_diversity * 0.15,
-        "Submission Timeliness": (1 if submission_timeliness <= 0 else 0.5) * 0.15,
-        "First-Time Student": (1 if num_of_prev_attempts == 0 else 0.5) * 0.1
-    }
-    
-    fig = px.bar(
-        x=list(feature_importance.values()),
-        y=list(feature_importance.keys()),
-        orientation='h',
-        labels={'x': 'Impact Score', 'y': 'Factor'},
-        title='Factors Contributing to Your Prediction',
-        color=list(feature_importance.values()),
-        color_continuous_scale='RdYlGn'
-    )
-    fig.update_layout(showlegend=False, height=350)
-    st.plotly_chart(fig, use_container_width=True)
+    if attributions is not None and not any(np.isnan(v) for v in attributions[predicted_outcome].values()):
+        # TreeSHAP: how much each feature moved this student's output for the predicted outcome -
+        # probability for a forest (shown in percentage points), log-odds for XGBoost / LightGBM
+        effects = attributions[predicted_outcome]
+        top = sorted(effects, key=lambda feature: abs(effects[feature]), reverse=True)[:N_FACTORS][::-1]
+        if attribution_unit == 'probability':
+            scale, axis_label = 100, f'Effect on {predicted_outcome} probability (percentage points)'
+        else:
+            scale, axis_label = 1, f'Effect on {predicted_outcome} log-odds'
+        fig = px.bar(
+            x=[effects[feature] * scale for feature in top],
+            y=[FACTOR_LABELS.get(feature, feature) for feature in top],
+            orientation='h',
+            labels={'x': axis_label, 'y': 'Factor'},
+            title=f'Factors Pushing Towards or Away From {predicted_outcome}',
+            color=[effects[feature] for feature in top],
+            color_continuous_scale='RdYlGn',
+            color_continuous_midpoint=0
+        )
+        fig.update_layout(showlegend=False, coloraxis_showscale=False, height=350)
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption("Computed from the model for this student (TreeSHAP): the effects add up to the "
+                   "difference between this prediction and the average prediction.")
+    else:
+        feature_importance = {
+            "Assessment Score": avg_score / 100 * 0.4,
+            "Engagement Consistency": (1 - engagement_variability) * 0.2,
+            "Activity Diversity": activity_diversity * 0.15,
+            "Submission Timeliness": (1 if submission_timeliness <= 0 else 0.5) * 0.15,
+            "First-Time Student": (1 if num_of_prev_attempts == 0 else 0.5) * 0.1
+        }
+        
+        fig = px.bar(
+            x=list(feature_importance.values()),
+            y=list(feature_importance.keys()),
+            orientation='h',
+            labels={'x': 'Impact Score', 'y': 'Factor'},
+            title='Factors Contributing to Your Prediction',
+            color=list(feature_importance.values()),
+            color_continuous_scale='RdYlGn'
+        )
+        fig.update_layout(showlegend=False, height=350)
+        st.plotly_chart(fig, use_container_width=True)
+
+# Diagnostics (process-wide: counts every session's predictions)
+with st.sidebar:
+    with st.expander("🩺 Diagnostics"):
+        cache_stats = prediction_cache().stats()
+        st.caption(f"Model version: {cache_stats['version'] or 'not loaded yet'}")
+        col1, col2 = st.columns(2)
+        col1.metric("Cache Hits", cache_stats['hits'])
+        col2.metric("Cache Misses", cache_stats['misses'])
+        hit_rate = cache_stats['hit_rate']
+        st.metric("Hit Rate", "-" if hit_rate is None else f"{hit_rate:.0%}")
+        st.caption(f"{cache_stats['entries']}/{cache_stats['max_entries']} entries · "
+                   f"{cache_stats['evictions']} evicted · {cache_stats['expirations']} expired · "
+                   f"{cache_stats['invalidations']} model changes")
+        st.markdown("**Attributions**")
+        explainer = load_attributions(model_version) if warmer.status == 'ready' else None
+        if explainer is None:
+            st.caption("Not available for this model")
+        else:
+            timing = explainer.timing()
+            st.caption(f"Leaf paths extracted in {timing['precompute_seconds']:.2f}s")
+            if timing.get('seconds') is not None:
+                over = "" if timing['seconds'] <= ATTRIBUTION_BUDGET_SECONDS else " ⚠️ over budget"
+                st.caption(f"Last explanation: {timing['seconds'] * 1000:.0f} ms "
+                           f"(budget {ATTRIBUTION_BUDGET_SECONDS * 1000:.0f} ms){over}")
+        st.markdown("**Startup time**")
+        st.caption(f"Model {warmer.status}" + ("" if warmer.seconds is None else f" after {warmer.seconds:.2f}s"))
+        st.dataframe(pd.DataFrame(STARTUP.rows(), columns=['kind', 'name', 'seconds']),
+                     hide_index=True, use_container_width=True)
 
 # Footer
 st.markdown("---")
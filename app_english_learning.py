@@ -1,11 +1,13 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import pickle
-import json
-from pathlib import Path
-import plotly.graph_objects as go
-import plotly.express as px
+
+from feature_engineering import build_student_features
+from inference import artifact_version
+from model_bundle import ArtifactLoadError
+from persona import load_persona_model
+from similar_students import N_SIMILAR, load_similar_students
+from startup import ArtifactWarmer
 
 # Page configuration
 st.set_page_config(
@@ -59,107 +61,157 @@ st.markdown("""
 # Title
 st.markdown('<div class="main-header">🌍 English Learning Success Predictor</div>', unsafe_allow_html=True)
 st.markdown("### Personalized Feedback for English Language Learners")
-st.markdown("---")
 
-# Load model and preprocessors
-@st.cache_resource
-def load_model():
-    """Load the trained model and preprocessors"""
+# Load model and preprocessors, in a background thread started on the first
+# script run of the server process (keyed on the artifact version)
+@st.cache_resource(max_entries=1)
+def start_warmup(version):
+    """Start loading the model in a background thread"""
+    return ArtifactWarmer('.', imports=('plotly.graph_objects',)).start()
+
+@st.cache_resource(max_entries=1)
+def load_model(version):
+    """Load the trained model and preprocessors (waits for the warm-up thread)"""
     try:
-        model = pickle.load(open('model.pkl', 'rb'))
-        scaler = pickle.load(open('scaler.pkl', 'rb'))
-        encoder = pickle.load(open('encoder.pkl', 'rb'))
-        return model, scaler, encoder
-    except:
+        return start_warmup(version).result()
+    except (ArtifactLoadError, ValueError):
         st.warning("⚠️ Model files not found. Using demo mode.")
-        return None, None, None
+        return None
+
+# Learners with similar profiles (KD-tree stored in model_bundle/ by similar_students.py)
+@st.cache_resource(max_entries=1)
+def load_similar_students_finder(version):
+    """Similar-learners lookup, or None without a model or a neighbour index"""
+    inference_core = load_model(version)
+    if inference_core is None:
+        return None
+    try:
+        return load_similar_students('.', core=inference_core)
+    except (ArtifactLoadError, ValueError):
+        return None
+
+# Learner personas from the saved UMAP + KMeans clustering (persona.py)
+@st.cache_resource(max_entries=1)
+def load_personas(version):
+    """Persona lookup, or None if the bundle has no persona model"""
+    try:
+        return load_persona_model('.')
+    except (ArtifactLoadError, ValueError):
+        return None
+
+# Historical outcomes in this app's progress terms
+OUTCOME_PROGRESS = {
+    "Distinction": "Excellent Progress (A/A+)",
+    "Pass": "Good Progress (B/B+)",
+    "Fail": "Needs Improvement (C)",
+    "Withdrawn": "At Risk (D/F)"
+}
+
+# Readiness indicator
+model_version = artifact_version('.')
+warmer = start_warmup(model_version)
+if warmer.status == 'loading':
+    st.caption("⏳ Model loading in the background - feedback is available in a moment")
+elif warmer.status == 'ready':
+    st.caption(f"✅ Model ready (loaded in {warmer.seconds:.1f}s)")
+else:
+    st.caption("⚠️ Model unavailable - feedback runs in demo mode")
+st.markdown("---")
 
 # English Learning to Technical Feature Mapping
-def map_english_to_technical_features(inputs):
+# Activity type standing in for each practised skill
+SKILL_ACTIVITY_TYPES = {
+    'Reading': 'oucontent',
+    'Writing': 'quiz',
+    'Listening': 'resource',
+    'Speaking': 'forumng',
+    'Grammar': 'subpage'
+}
+
+def map_english_to_student_records(inputs):
     """
-    Convert student-friendly English learning inputs to technical model features
+    Convert student-friendly English learning inputs to the learner's activity and assessment records
+
+    The course is modelled as one weekly quiz per week; the technical features
+    are computed from these records by the training feature code.
     """
-    features = {}
-    
-    # ==== ENGAGEMENT METRICS ====
-    # Calculate total "clicks" based on lessons and exercises
-    lessons_per_week = inputs['lessons_per_week']
-    exercises_per_lesson = inputs['exercises_per_lesson']
     weeks_studying = inputs['weeks_in_course']
+    days_in_course = weeks_studying * 7
     
+    # ==== LEARNER ====
+    attempt_map = {
+        'First Time': 0,
+        'Second Attempt': 1,
+        'Third or More': 2
+    }
+    student = map_categorical_features(inputs)
+    primary_activity_type = student.pop('activity_type')
+    student['num_of_prev_attempts'] = attempt_map[inputs['course_attempt']]
+    student['studied_credits'] = 60  # Standard for one course
+    student['date_registration'] = 0
+    student['module_presentation_length'] = days_in_course
+    
+    # ==== ACTIVITY ====
     # Approximate clicks: lessons * exercises * weeks * 3 (avg interactions per exercise)
-    features['sum'] = lessons_per_week * exercises_per_lesson * weeks_studying * 3
-    features['count'] = lessons_per_week * weeks_studying  # Total activities
-    
-    # Activity diversity based on skill variety
-    skills_practiced = len(inputs['skills_practiced'])
-    features['activity_diversity'] = min(skills_practiced / 5.0, 1.0)  # Max 5 skills
-    
-    # ==== PERFORMANCE METRICS ====
-    features['score'] = inputs['average_lesson_score']
-    features['studied_credits'] = 60  # Standard for one course
-    features['score_per_weight'] = inputs['average_lesson_score'] / 60
+    total_clicks = inputs['lessons_per_week'] * inputs['exercises_per_lesson'] * weeks_studying * 3
+    total_activities = inputs['lessons_per_week'] * weeks_studying
     
-    # ==== ENGAGEMENT PATTERNS ====
-    # Engagement consistency (inverse of variability)
+    # Consistent learners spread their practice evenly over the activity types they use
     consistency_map = {
-        'Very Consistent': 0.2,
-        'Fairly Consistent': 0.4,
-        'Sometimes Inconsistent': 0.6,
-        'Very Inconsistent': 0.8
+        'Very Consistent': 1.0,
+        'Fairly Consistent': 0.67,
+        'Sometimes Inconsistent': 0.33,
+        'Very Inconsistent': 0.0
     }
-    features['engagement_cv'] = consistency_map[inputs['study_consistency']]
-    
-    # Module engagement rate (clicks per day)
-    days_in_course = weeks_studying * 7
-    features['module_engagement_rate'] = features['sum'] / max(days_in_course, 1)
-    
-    # Weighted engagement (adjusted for consistency)
-    features['weighted_engagement'] = features['sum'] * (1 - features['engagement_cv'])
-    
-    # ==== LEARNING BEHAVIOR ====
-    # Learning pace (credits per day)
-    features['learning_pace'] = features['studied_credits'] / max(days_in_course, 1)
-    
-    # Days since registration
-    features['days_since_registration'] = days_in_course
-    
-    # ==== ASSESSMENT METRICS ====
-    # Number of assessments (weekly quizzes)
-    features['total_assessments'] = weeks_studying
-    
-    # Submission timeliness
+    activity_types = [primary_activity_type]
+    for skill in inputs['skills_practiced']:
+        if SKILL_ACTIVITY_TYPES[skill] not in activity_types:
+            activity_types.append(SKILL_ACTIVITY_TYPES[skill])
+    n_types = len(activity_types)
+    primary_share = 1 / n_types + (1 - consistency_map[inputs['study_consistency']]) * (1 - 1 / n_types)
+    shares = np.full(n_types, (1 - primary_share) / max(n_types - 1, 1))
+    shares[0] = primary_share
+    activity = pd.DataFrame({
+        'activity_type': activity_types,
+        'sum': np.rint(total_clicks * shares).astype(int),
+        'count': np.rint(total_activities * shares).astype(int)
+    })
+    
+    # ==== ASSESSMENTS (weekly quizzes) ====
     timeliness_map = {
         'Always Early': -5,
         'Usually On Time': 0,
         'Sometimes Late': 5,
         'Often Late': 15
     }
-    features['submission_timeliness'] = timeliness_map[inputs['assignment_timeliness']]
-    
-    # Assessment engagement
-    features['assessment_engagement_score'] = features['sum'] / max(features['total_assessments'], 1)
-    
-    # Banked assessment ratio
-    features['banked_assessment_ratio'] = 0.1 if inputs['assignment_timeliness'] == 'Always Early' else 0
-    
-    # ==== ACADEMIC BACKGROUND ====
-    # Previous attempts
-    attempt_map = {
-        'First Time': 0,
-        'Second Attempt': 1,
-        'Third or More': 2
+    score_change_map = {
+        'Improving': 20,
+        'Staying Same': 0,
+        'Getting Worse': -20
     }
-    features['num_of_prev_attempts'] = attempt_map[inputs['course_attempt']]
-    features['repeat_student'] = 1 if features['num_of_prev_attempts'] > 0 else 0
-    
-    # ==== TRENDS (simplified for new students) ====
-    features['engagement_trend'] = 0.1 if inputs['motivation_trend'] == 'Increasing' else -0.1
-    features['score_trend'] = 0.1 if inputs['performance_trend'] == 'Improving' else -0.1
-    features['score_momentum'] = features['score_trend'] * features['score']
-    features['performance_by_registration'] = features['score'] / max(days_in_course, 1)
-    
-    return features
+    dates = 7 * np.arange(1, weeks_studying + 1)
+    score_change = score_change_map[inputs['performance_trend']]
+    scores = inputs['average_lesson_score'] + np.linspace(-score_change / 2, score_change / 2, weeks_studying)
+    n_banked = round(0.1 * weeks_studying) if inputs['assignment_timeliness'] == 'Always Early' else 0
+    assessments = pd.DataFrame({
+        'assessment_type': 'CMA',
+        'date': dates,
+        'weight': 100 / weeks_studying,
+        'date_submitted': dates + timeliness_map[inputs['assignment_timeliness']],
+        'is_banked': (np.arange(weeks_studying) < n_banked).astype(int),
+        'score': np.clip(scores, 0, 100)
+    })
+    
+    return student, activity, assessments
+
+def map_english_to_technical_features(inputs):
+    """
+    Convert student-friendly English learning inputs to technical model features
+
+    Returns a one-row DataFrame in the model's feature order, computed exactly
+    like the training features (feature_engineering.build_student_features).
+    """
+    return build_student_features(*map_english_to_student_records(inputs))
 
 def map_categorical_features(inputs):
     """Map categorical inputs for encoding"""
@@ -502,12 +554,14 @@ if predict_button:
     
     # Map features
     technical_features = map_english_to_technical_features(user_inputs)
-    categorical_features = map_categorical_features(user_inputs)
     
-    # Demo prediction (replace with actual model when available)
-    model, scaler, encoder = load_model()
+    # Imported here rather than at startup: only needed once the report is shown
+    import plotly.graph_objects as go
+    
+    # Model prediction (rule-based demo when no model is saved)
+    inference_core = load_model(model_version)
     
-    if model is None:
+    if inference_core is None:
         # Demo mode - rule-based prediction
         st.info("📍 Generating your personalized feedback...")
         
@@ -550,10 +604,14 @@ if predict_button:
     else:
         # Use actual model
         st.info("📍 Using trained model for prediction...")
-        # TODO: Implement actual model prediction
-        persona_id = 2  # Default
-        predicted_outcome = "Good Progress (B/B+)"
-        confidence = 0.75
+        probabilities = inference_core.predict_proba_frame(technical_features).iloc[0]
+        most_likely = probabilities.idxmax()
+        predicted_outcome = OUTCOME_PROGRESS.get(most_likely, most_likely)
+        confidence = float(probabilities[most_likely])
+        personas = load_personas(model_version)
+        persona_id = personas.assign_one(technical_features) if personas is not None else None
+        if persona_id not in LEARNER_PERSONAS:
+            persona_id = 2  # Default
     
     # Display prediction
     st.markdown("### 🎓 Predicted Learning Outcome")
@@ -621,6 +679,16 @@ if predict_button:
     with persona_col2:
         st.metric("Support Level", persona_info['risk_level'])
     
+    # How learners with the most similar profiles finished
+    finder = load_similar_students_finder(model_version)
+    if finder is not None:
+        st.markdown("### 👥 Learners Like You")
+        neighbours = finder.find(technical_features, k=N_SIMILAR)
+        for rank, neighbour in enumerate(neighbours, start=1):
+            progress = OUTCOME_PROGRESS.get(neighbour['final_result'], neighbour['final_result'])
+            st.markdown(f"{rank}. {outcome_icons.get(progress, '📊')} {progress} "
+                        f"(similarity distance {neighbour['distance']:.2f})")
+    
     # Personalized Feedback
     st.markdown("### 💡 Your Personalized Action Plan")
     
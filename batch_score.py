@@ -0,0 +1,240 @@
+"""
+Offline batch scoring of a whole cohort with the saved model.
+
+Student features are streamed in chunks, either from a features file written
+by parallel_build.py (Parquet record batches / CSV chunks) or built from the
+OULAD CSVs with build_features_parallel. Chunks are scored across a process
+pool, each worker loading the model artifacts once (inference.load_inference_core),
+and the predicted outcome plus one probability column per outcome are
+appended to the output file as soon as each chunk is done, in input order.
+At most a few chunks per worker are in flight, so memory stays bounded by
+the chunk size rather than the cohort size.
+
+With ``top_drivers`` each student also gets the features that moved their
+predicted outcome the most (TreeSHAP attributions, attributions.py). That is
+by far the most expensive part of a run: tens of milliseconds per student,
+against microseconds to predict.
+
+Usage:
+    python batch_score.py --features features.parquet --output scores.parquet
+    python batch_score.py --data-dir . --workers 8 --chunksize 20000 --output scores.csv
+    python batch_score.py --features features.parquet --top-drivers 3 --output scores.parquet
+
+    from batch_score import score_cohort
+    report = score_cohort(iter_feature_chunks('features.parquet'), 'scores.parquet')
+"""
+
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from data_cache import pa, pq
+from inference import load_inference_core
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+# Students per scoring task
+SCORE_CHUNKSIZE = 10_000
+
+# Chunks queued per worker before the reader waits for results
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+PREDICTION_COLUMN = 'predicted_outcome'
+PROBABILITY_PREFIX = 'prob_'
+
+_worker_core = None
+_worker_explainer = None
+
+
+def iter_feature_chunks(path, chunksize=SCORE_CHUNKSIZE):
+    """
+    Yield a features file (indexed by id_student) as DataFrames of at most ``chunksize`` rows.
+
+    Parquet files are read record batch by record batch; CSV files with
+    pandas' chunked reader.
+    """
+    if str(path).endswith('.csv'):
+        yield from pd.read_csv(path, index_col=0, chunksize=chunksize)
+        return
+    if pq is None:
+        raise ImportError("Reading Parquet features requires pyarrow; pass a .csv file instead")
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+        yield batch.to_pandas()
+
+
+def iter_frame_chunks(frame, chunksize=SCORE_CHUNKSIZE):
+    """Yield an in-memory DataFrame in slices of at most ``chunksize`` rows."""
+    for start in range(0, len(frame), chunksize):
+        yield frame.iloc[start:start + chunksize]
+
+
+def _init_worker(artifact_dir, top_drivers=0):
+    global _worker_core, _worker_explainer
+    _worker_core = load_inference_core(artifact_dir)
+    if top_drivers:
+        from attributions import FeatureAttributions
+        _worker_explainer = FeatureAttributions(_worker_core)
+
+
+def score_chunk(features, core=None, top_drivers=0, explainer=None):
+    """
+    Predicted outcome and per-outcome probabilities for one chunk of students.
+
+    Parameters:
+    -----------
+    features : DataFrame
+    core : InferenceCore, optional
+        Defaults to the worker's core
+    top_drivers : int
+        Also report this many top drivers per student (0: none)
+    explainer : FeatureAttributions, optional
+        Defaults to the worker's explainer
+
+    Returns:
+    --------
+    DataFrame indexed like ``features`` with the predicted_outcome column
+    followed by one prob_<outcome> column per model class, then
+    driver_1, driver_1_effect, ... when top_drivers is set
+    """
+    core = core if core is not None else _worker_core
+    probabilities = core.predict_proba_frame(features)
+    scores = probabilities.add_prefix(PROBABILITY_PREFIX)
+    scores.insert(0, PREDICTION_COLUMN, probabilities.idxmax(axis=1).astype(object) if len(features) else [])
+    if top_drivers:
+        explainer = explainer if explainer is not None else _worker_explainer
+        if explainer is None:
+            from attributions import FeatureAttributions
+            explainer = FeatureAttributions(core)
+        scores = scores.join(explainer.top_drivers(features, k=top_drivers))
+    return scores
+
+
+class _ScoreWriter:
+    """Appends scored chunks to a Parquet or CSV file."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.rows = 0
+        self._parquet_writer = None
+        if not self.path.endswith('.csv') and pq is None:
+            raise ImportError("Writing Parquet scores requires pyarrow; use a .csv output instead")
+
+    def write(self, scores):
+        if self.path.endswith('.csv'):
+            scores.to_csv(self.path, mode='w' if self.rows == 0 else 'a', header=self.rows == 0)
+        else:
+            table = pa.Table.from_pandas(scores, preserve_index=True)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        self.rows += len(scores)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process and of its (finished) worker processes, in MB."""
+    if resource is None:
+        return None, None
+    # ru_maxrss is in kilobytes on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return own, children
+
+
+def score_cohort(chunks, output, artifact_dir='.', n_workers=None, top_drivers=0):
+    """
+    Score a stream of feature chunks across a process pool and write the results incrementally.
+
+    Parameters:
+    -----------
+    chunks : iterable of DataFrame
+        Feature chunks indexed by id_student (iter_feature_chunks / iter_frame_chunks)
+    output : str
+        Output file, .parquet or .csv
+    artifact_dir : str
+        Directory with model_bundle/ (memory-mapped, shared by the workers) or
+        model.pkl, scaler.pkl, encoder.pkl and feature_names.json
+    n_workers : int, optional
+        Worker processes (default: os.cpu_count())
+    top_drivers : int
+        Top drivers to report per student (0: none; see score_chunk)
+
+    Returns:
+    --------
+    dict with rows, chunks, seconds, rows_per_second and peak memory (MB)
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    max_in_flight = n_workers * CHUNKS_IN_FLIGHT_PER_WORKER
+    writer = _ScoreWriter(output)
+    n_chunks = 0
+
+    start = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(str(artifact_dir), top_drivers)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(score_chunk, chunk, top_drivers=top_drivers))
+                n_chunks += 1
+                if len(pending) >= max_in_flight:
+                    writer.write(pending.popleft().result())
+            while pending:
+                writer.write(pending.popleft().result())
+    finally:
+        writer.close()
+    seconds = time.time() - start
+
+    own_mb, workers_mb = peak_memory_mb()
+    return {
+        'rows': writer.rows,
+        'chunks': n_chunks,
+        'seconds': seconds,
+        'rows_per_second': writer.rows / seconds if seconds > 0 else float('inf'),
+        'peak_memory_mb': own_mb,
+        'peak_worker_memory_mb': workers_mb,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score every student with the saved model, chunk by chunk over a process pool.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--features', help='features file from parallel_build.py (.parquet or .csv)')
+    source.add_argument('--data-dir', help='directory with the OULAD CSV files (features are built first)')
+    parser.add_argument('--cache-dir', default=None, help='Parquet cache directory when building from --data-dir')
+    parser.add_argument('--artifact-dir', default='.', help='directory with model_bundle/ or model.pkl, scaler.pkl, encoder.pkl, feature_names.json')
+    parser.add_argument('--output', default='scores.parquet', help='output file (.parquet or .csv)')
+    parser.add_argument('--chunksize', type=int, default=SCORE_CHUNKSIZE, help='students per scoring task')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--top-drivers', type=int, default=0,
+                        help='also write the K features that drove each prediction (TreeSHAP; slow)')
+    args = parser.parse_args()
+
+    if args.features:
+        chunks = iter_feature_chunks(args.features, chunksize=args.chunksize)
+    else:
+        from parallel_build import build_features_parallel
+        features = build_features_parallel(data_dir=args.data_dir, cache_dir=args.cache_dir, n_workers=args.workers)
+        chunks = iter_frame_chunks(features, chunksize=args.chunksize)
+
+    report = score_cohort(chunks, args.output, artifact_dir=args.artifact_dir, n_workers=args.workers,
+                          top_drivers=args.top_drivers)
+    print(f"✅ Scored {report['rows']:,} students in {report['chunks']} chunks: "
+          f"{report['seconds']:.1f}s ({report['rows_per_second']:,.0f} rows/s)")
+    if report['peak_memory_mb'] is not None:
+        print(f"📊 Peak memory: {report['peak_memory_mb']:.0f} MB main process, "
+              f"{report['peak_worker_memory_mb']:.0f} MB largest worker")
+    print(f"✅ Scores written: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Cluster-relative features (notebook cell 36) computed in one batch and served by lookup.
+
+The "enhanced" dataset adds, for the best UMAP + KMeans clustering:
+
+    dist_to_cluster_<j>               distance in the embedding to each cluster's centroid
+    <feature>_cluster_percentile      rank within the student's own cluster (pandas rank(pct=True))
+    <feature>_within_cluster_z        (value - cluster mean) / (cluster std + 1e-8)
+
+The notebook derives them from the whole training frame with a groupby pass
+per feature, so they could not be computed for one new student.
+ClusterFeatureTables keeps what the lookups need instead: each cluster's
+values of each feature, sorted, plus the per-cluster means, standard
+deviations and embedding centroids. A percentile is then two binary
+searches in the student's cluster (the average rank of the value among the
+cluster's training students, as pandas ties it), so re-scoring a training
+student gives exactly the notebook's features. A new student is placed
+and assigned a cluster with the persona model (persona.py).
+
+The tables are stored as the 'cluster_tables' component of model_bundle/.
+
+Usage:
+    from cluster_features import build_cluster_feature_tables
+    tables = build_cluster_feature_tables(final_data, best_result['best_labels'],
+                                          best_result['embedding'], best_result['features'])
+    extra = tables.transform(final_data, best_result['best_labels'], best_result['embedding'])
+
+    # Serving: one student, with the persona model for its cluster and embedding
+    from cluster_features import load_cluster_tables
+    from persona import load_persona_model
+    load_cluster_tables('.').enhanced_features(student_features, load_persona_model('.'))
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Added to the within-cluster std, as in the notebook
+Z_EPSILON = 1e-8
+
+
+def _cluster_codes(clusters, labels):
+    """Position of each label in ``clusters`` (ValueError for a cluster the tables do not know)."""
+    labels = np.asarray(labels)
+    codes = np.searchsorted(clusters, labels)
+    codes = np.minimum(codes, len(clusters) - 1)
+    if len(labels) and not np.array_equal(clusters[codes], labels):
+        unknown = sorted(set(labels.tolist()) - set(clusters.tolist()))
+        raise ValueError(f"Unknown cluster labels: {unknown}")
+    return codes
+
+
+class ClusterFeatureTables:
+    """
+    Per-cluster sorted values, means, standard deviations and centroids.
+
+    Parameters:
+    -----------
+    clusters : array (n_clusters,)
+        Cluster labels, sorted
+    centroids : array (n_clusters, n_components)
+        Mean embedding of each cluster's training students
+    sorted_values : array
+        For each feature and cluster in turn, the cluster's non-missing values, sorted
+    offsets : array (n_features, n_clusters + 1)
+        Where each feature x cluster run starts in sorted_values
+    means, stds : array (n_clusters, n_features)
+        Per-cluster mean and sample standard deviation (NaN below two students)
+    columns : list
+        The features, in order
+    """
+
+    ARRAYS = ('clusters', 'centroids', 'sorted_values', 'offsets', 'means', 'stds')
+
+    def __init__(self, clusters, centroids, sorted_values, offsets, means, stds, columns):
+        self.clusters = clusters
+        self.centroids = centroids
+        self.sorted_values = sorted_values
+        self.offsets = offsets
+        self.means = means
+        self.stds = stds
+        self.columns = list(columns)
+
+    @property
+    def n_clusters(self):
+        return len(self.clusters)
+
+    @property
+    def attributes(self):
+        return {'columns': self.columns}
+
+    def arrays(self):
+        return {key: getattr(self, key) for key in self.ARRAYS}
+
+    @property
+    def output_columns(self):
+        """Columns of transform, in the notebook's order."""
+        return ([f'dist_to_cluster_{cluster}' for cluster in self.clusters]
+                + [f'{col}_cluster_percentile' for col in self.columns]
+                + [f'{col}_within_cluster_z' for col in self.columns])
+
+    def _values(self, features):
+        missing = [col for col in self.columns if col not in features.columns]
+        if missing:
+            raise ValueError(f"Feature frame is missing cluster feature columns: {missing}")
+        return np.column_stack([features[col].to_numpy(dtype=np.float64, na_value=np.nan) for col in self.columns])
+
+    def percentiles(self, values, codes):
+        """
+        Rank within the own cluster as a fraction (rank(pct=True), ties averaged), shape like ``values``.
+
+        A value that is not one of the cluster's training values is ranked as
+        if it were; missing values stay NaN.
+        """
+        result = np.full(values.shape, np.nan)
+        # Plain views: slicing a memory-mapped array in the loop costs more than the search
+        sorted_values = np.asarray(self.sorted_values)
+        offsets = np.asarray(self.offsets).tolist()
+        for code in np.unique(codes).tolist():
+            rows = np.flatnonzero(codes == code)
+            for j in range(len(self.columns)):
+                run = sorted_values[offsets[j][code]:offsets[j][code + 1]]
+                if len(run) == 0:
+                    continue
+                x = values[rows, j]
+                below = np.searchsorted(run, x, side='left')
+                at_or_below = np.searchsorted(run, x, side='right')
+                rank = below + (at_or_below - below + 1) / 2
+                result[rows, j] = np.where(np.isfinite(x), rank / len(run), np.nan)
+        return result
+
+    def transform(self, features, labels, embedding):
+        """
+        dist_to_cluster_*, *_cluster_percentile and *_within_cluster_z for every student at once.
+
+        Parameters:
+        -----------
+        features : DataFrame
+            Students with the feature columns
+        labels : array (n_students,)
+            Each student's cluster
+        embedding : array (n_students, n_components)
+            Each student's UMAP coordinates
+
+        Returns:
+        --------
+        DataFrame indexed like ``features`` with output_columns
+        """
+        values = self._values(features)
+        codes = _cluster_codes(np.asarray(self.clusters), labels)
+        embedding = np.asarray(embedding, dtype=np.float64)
+        centroids = np.asarray(self.centroids, dtype=np.float64)
+
+        distances = np.sqrt(((embedding[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2))
+        percentiles = self.percentiles(values, codes)
+        z_scores = (values - np.asarray(self.means)[codes]) / (np.asarray(self.stds)[codes] + Z_EPSILON)
+        return pd.DataFrame(np.hstack([distances, percentiles, z_scores]), index=features.index,
+                            columns=self.output_columns)
+
+    def enhanced_features(self, features, persona_model):
+        """
+        Every cell 36 column for new students: cluster_id, umap_1.., cluster_<j> indicators and transform's.
+
+        The cluster and embedding come from the persona model (approximate
+        UMAP placement and nearest KMeans centroid).
+        """
+        embedding, labels = persona_model.place(features)
+        frame = pd.DataFrame({'cluster_id': labels}, index=features.index)
+        for i in range(embedding.shape[1]):
+            frame[f'umap_{i + 1}'] = embedding[:, i]
+        for cluster in self.clusters:
+            frame[f'cluster_{cluster}'] = labels == cluster
+        return pd.concat([frame, self.transform(features, labels, embedding)], axis=1)
+
+
+def build_cluster_feature_tables(frame, labels, embedding, columns):
+    """
+    Tables for cluster-relative features from the training students.
+
+    Parameters:
+    -----------
+    frame : DataFrame
+        Training students (final_data) with the ``columns``
+    labels : array (n_students,)
+        Cluster of each student (best_result['best_labels'])
+    embedding : array (n_students, n_components)
+        UMAP embedding of each student (best_result['embedding'])
+    columns : list
+        Features to rank and standardise within clusters (best_result['features'])
+
+    Returns:
+    --------
+    ClusterFeatureTables
+    """
+    labels = np.asarray(labels)
+    embedding = np.asarray(embedding, dtype=np.float64)
+    if len(labels) != len(frame) or len(embedding) != len(frame):
+        raise ValueError(f"Got {len(frame)} students, {len(labels)} labels and {len(embedding)} embedding rows")
+    clusters, codes, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    n_clusters = len(clusters)
+
+    centroids = np.zeros((n_clusters, embedding.shape[1]))
+    np.add.at(centroids, codes, embedding)
+    centroids /= counts[:, None]
+
+    values = np.column_stack([frame[col].to_numpy(dtype=np.float64, na_value=np.nan) for col in columns])
+    valid = np.isfinite(values)
+    filled = np.where(valid, values, 0.0)
+    n_valid = np.zeros((n_clusters, len(columns)))
+    sums = np.zeros((n_clusters, len(columns)))
+    np.add.at(n_valid, codes, valid)
+    np.add.at(sums, codes, filled)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums / n_valid
+        squares = np.zeros((n_clusters, len(columns)))
+        np.add.at(squares, codes, np.where(valid, values - means[codes], 0.0) ** 2)
+        stds = np.sqrt(squares / (n_valid - 1))
+    means[n_valid == 0] = np.nan
+    stds[n_valid < 2] = np.nan
+
+    # One sort per feature orders the rows by cluster, then by value; missing values are dropped
+    runs, offsets = [], np.zeros((len(columns), n_clusters + 1), dtype=np.int64)
+    position = 0
+    for j in range(len(columns)):
+        keep = valid[:, j]
+        order = np.lexsort((values[keep, j], codes[keep]))
+        runs.append(values[keep, j][order])
+        offsets[j] = position + np.concatenate([[0], np.cumsum(np.bincount(codes[keep], minlength=n_clusters))])
+        position += int(keep.sum())
+
+    return ClusterFeatureTables(
+        clusters=clusters,
+        centroids=centroids,
+        sorted_values=np.concatenate(runs) if runs else np.zeros(0),
+        offsets=offsets,
+        means=means,
+        stds=stds,
+        columns=columns,
+    )
+
+
+def load_cluster_tables(artifact_dir='.'):
+    """
+    ClusterFeatureTables from <artifact_dir>/model_bundle (component 'cluster_tables').
+
+    Raises ArtifactLoadError if the bundle has no cluster tables.
+    """
+    from model_bundle import DEFAULT_BUNDLE_DIR, load_model_bundle
+
+    bundle = load_model_bundle(Path(artifact_dir) / DEFAULT_BUNDLE_DIR, components=['cluster_tables'])
+    return bundle['cluster_tables']
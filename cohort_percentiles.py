@@ -0,0 +1,250 @@
+"""
+Precomputed cohort percentile tables: "where does this student stand".
+
+Placing one student against the historical cohort would otherwise mean
+loading the whole training frame (final_data) into the serving process. The
+build step here reduces that frame, once, to a sorted quantile array per
+numerical feature - for the whole cohort and, optionally, per code_module
+and per final_result - and stores them in a single .npz file (a few hundred KB).
+Serving loads the arrays only: a student's percentile is a binary search
+(np.searchsorted) in one array plus a linear interpolation between the two
+neighbouring quantiles, and the Pass/Fail/Distinction/Withdrawn reference
+bands are read straight from the per-outcome arrays.
+
+Usage:
+    python cohort_percentiles.py --data-dir . --output cohort_percentiles.npz
+    python cohort_percentiles.py --features final_data.parquet --output cohort_percentiles.npz
+
+    from cohort_percentiles import load_percentile_tables
+    tables = load_percentile_tables('cohort_percentiles.npz')
+    tables.percentile('score', 72.5)                     # -> 61.3 (percent of the cohort below)
+    tables.percentile('score', 72.5, code_module='AAA')  # within one module
+    tables.outcome_bands('score')                        # -> {'Pass': (58.1, 69.0, 78.4), ...}
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from feature_engineering import NUMERICAL_FEATURES, TARGET_COLUMN
+
+PERCENTILES_FILE = 'cohort_percentiles.npz'
+
+# Quantile levels stored per table (0%, 1%, ..., 100%)
+N_QUANTILES = 101
+
+# Groupings a table can be split by, besides the whole cohort
+GROUP_COLUMNS = ('code_module', TARGET_COLUMN)
+
+# Lower quartile, median and upper quartile of each outcome class
+BAND_LEVELS = (25, 50, 75)
+
+# Tables are only written for groups with at least this many students
+MIN_GROUP_SIZE = 30
+
+_ALL = 'all'
+
+
+def _table_key(column, group_column=None, group=None):
+    return f"{column}@{_ALL}" if group_column is None else f"{column}@{group_column}={group}"
+
+
+def _quantiles(values, levels):
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return None
+    return np.quantile(values, levels).astype(np.float32)
+
+
+def build_percentile_tables(frame, columns=None, group_by=GROUP_COLUMNS, n_quantiles=N_QUANTILES,
+                            min_group_size=MIN_GROUP_SIZE):
+    """
+    Sorted quantile arrays per numerical feature, for the whole cohort and per group.
+
+    Parameters:
+    -----------
+    frame : DataFrame
+        One row per student: the numerical features plus, for per-group
+        tables, the group columns (the notebook's final_data / engineer_features output)
+    columns : list, optional
+        Features to tabulate (default: the NUMERICAL_FEATURES present in frame)
+    group_by : tuple
+        Group columns to split by; those missing from frame are skipped
+    n_quantiles : int
+        Quantile levels per table, evenly spaced from 0 to 1
+    min_group_size : int
+        Smallest group that gets its own tables
+
+    Returns:
+    --------
+    PercentileTables
+    """
+    columns = [col for col in (columns or NUMERICAL_FEATURES) if col in frame.columns]
+    levels = np.linspace(0, 1, n_quantiles)
+    arrays = {}
+    counts = {}
+    groups = {}
+
+    for col in columns:
+        table = _quantiles(frame[col], levels)
+        if table is not None:
+            arrays[_table_key(col)] = table
+    counts[_ALL] = len(frame)
+
+    for group_column in group_by:
+        if group_column not in frame.columns:
+            continue
+        groups[group_column] = []
+        for group, rows in frame.groupby(frame[group_column].astype(str), sort=True, observed=True):
+            if len(rows) < min_group_size:
+                continue
+            groups[group_column].append(group)
+            counts[f"{group_column}={group}"] = len(rows)
+            for col in columns:
+                table = _quantiles(rows[col], levels)
+                if table is not None:
+                    arrays[_table_key(col, group_column, group)] = table
+
+    meta = {'columns': columns, 'groups': groups, 'counts': counts}
+    return PercentileTables(levels, arrays, meta)
+
+
+class PercentileTables:
+    """
+    Quantile arrays with percentile lookups and outcome reference bands.
+
+    Parameters:
+    -----------
+    levels : array
+        Quantile levels (0..1) shared by every table
+    arrays : dict
+        '<column>@all' / '<column>@<group_column>=<group>' -> sorted quantiles
+    meta : dict
+        columns, groups ({group_column: [group, ...]}) and counts (students per group)
+    """
+
+    def __init__(self, levels, arrays, meta):
+        self.levels = np.asarray(levels, dtype=np.float64)
+        self.arrays = arrays
+        self.columns = list(meta['columns'])
+        self.groups = {col: list(values) for col, values in meta['groups'].items()}
+        self.counts = dict(meta['counts'])
+
+    @property
+    def outcomes(self):
+        return self.groups.get(TARGET_COLUMN, [])
+
+    def save(self, path=PERCENTILES_FILE):
+        meta = {'columns': self.columns, 'groups': self.groups, 'counts': self.counts}
+        with open(path, 'wb') as f:
+            # The metadata travels as a 0-d string array, so loading needs no pickle
+            np.savez(f, levels=self.levels, meta=np.array(json.dumps(meta)), **self.arrays)
+        return Path(path)
+
+    def table(self, column, code_module=None, outcome=None):
+        """Quantile array for a column, within one module or outcome class if given (None if not tabulated)."""
+        if code_module is not None:
+            key = _table_key(column, 'code_module', code_module)
+        elif outcome is not None:
+            key = _table_key(column, TARGET_COLUMN, outcome)
+        else:
+            key = _table_key(column)
+        return self.arrays.get(key)
+
+    def percentile(self, column, value, code_module=None, outcome=None):
+        """
+        Percent of the (module's / outcome class's) cohort below ``value``, 0-100.
+
+        Falls back to the whole cohort when the module has no table of its
+        own; None when the column is not tabulated or value is not finite.
+        """
+        quantiles = self.table(column, code_module=code_module, outcome=outcome)
+        if quantiles is None and code_module is not None:
+            quantiles = self.table(column)
+        if quantiles is None or value is None or not np.isfinite(value):
+            return None
+
+        lo = int(np.searchsorted(quantiles, value, side='left'))
+        hi = int(np.searchsorted(quantiles, value, side='right'))
+        if hi > lo:
+            # value sits on one or more quantiles (ties, e.g. many zeros): middle of that run
+            level = (self.levels[lo] + self.levels[hi - 1]) / 2
+        elif lo == 0:
+            level = 0.0
+        elif lo == len(quantiles):
+            level = 1.0
+        else:
+            below, above = float(quantiles[lo - 1]), float(quantiles[lo])
+            fraction = (value - below) / (above - below)
+            level = self.levels[lo - 1] + fraction * (self.levels[lo] - self.levels[lo - 1])
+        return float(100 * level)
+
+    def value_at(self, column, percent, code_module=None, outcome=None):
+        """Feature value at a percentile (0-100) of the cohort, or of one module / outcome class."""
+        quantiles = self.table(column, code_module=code_module, outcome=outcome)
+        if quantiles is None:
+            return None
+        return float(np.interp(percent / 100, self.levels, quantiles))
+
+    def outcome_bands(self, column, levels=BAND_LEVELS):
+        """
+        Reference band of each outcome class: {outcome: (p25, median, p75)} by default.
+
+        Outcomes without a table (too few students) are left out.
+        """
+        bands = {}
+        for outcome in self.outcomes:
+            if self.table(column, outcome=outcome) is not None:
+                bands[outcome] = tuple(self.value_at(column, level, outcome=outcome) for level in levels)
+        return bands
+
+    def outcome_percentiles(self, column, value):
+        """The student's percentile within each outcome class: {outcome: percent}."""
+        return {outcome: self.percentile(column, value, outcome=outcome) for outcome in self.outcomes
+                if self.table(column, outcome=outcome) is not None}
+
+
+def load_percentile_tables(path=PERCENTILES_FILE):
+    """Load tables written by PercentileTables.save (plain arrays, no pandas)."""
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        arrays = {key: data[key] for key in data.files if key not in ('levels', 'meta')}
+        return PercentileTables(data['levels'], arrays, meta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the cohort percentile tables the apps use for "where do I stand" context.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--features', help='student summary file (.parquet or .csv) with the numerical features, '
+                                            'plus code_module / final_result for per-group tables')
+    source.add_argument('--data-dir', help='directory with the OULAD CSV files (the student summary is built first)')
+    parser.add_argument('--cache-dir', default=None, help='Parquet cache directory when building from --data-dir')
+    parser.add_argument('--output', default=PERCENTILES_FILE, help='output .npz file')
+    parser.add_argument('--quantiles', type=int, default=N_QUANTILES, help='quantile levels per table')
+    args = parser.parse_args()
+
+    import pandas as pd
+    if args.features:
+        frame = pd.read_csv(args.features) if args.features.endswith('.csv') else pd.read_parquet(args.features)
+    else:
+        from data_cache import load_oulad_tables
+        from feature_engineering import aggregate_student_vle, engineer_features, prepare_assessment_frame
+        tables = load_oulad_tables(data_dir=args.data_dir, cache_dir=args.cache_dir)
+        # The summary before conform_features still carries code_module and final_result
+        frame = engineer_features(aggregate_student_vle(tables['studentVle'], tables['vle']),
+                                  prepare_assessment_frame(tables))
+
+    percentile_tables = build_percentile_tables(frame, n_quantiles=args.quantiles)
+    path = percentile_tables.save(args.output)
+    n_tables = len(percentile_tables.arrays)
+    print(f"✅ {n_tables} percentile tables for {len(percentile_tables.columns)} features "
+          f"({percentile_tables.counts[_ALL]:,} students): {path} ({path.stat().st_size / 1024:.0f} KB)")
+    for group_column, groups in percentile_tables.groups.items():
+        print(f"📊 {group_column}: {', '.join(groups)}")
+
+
+if __name__ == '__main__':
+    main()
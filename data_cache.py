@@ -0,0 +1,404 @@
+"""
+Typed columnar cache for the OULAD CSV inputs used by Final.ipynb.
+
+Parsing the raw CSV text is the slowest part of loading the notebook data, and
+letting pandas infer every column as int64/object wastes memory. This module
+converts each CSV once into a Parquet file with explicit dtypes and
+dictionary-encoded (categorical) columns, and reuses that file on every later
+load. A small manifest stores the SHA-256 checksum of the source CSV, so the
+cache is rebuilt automatically whenever the source data changes.
+
+Usage:
+    from data_cache import load_oulad_tables
+
+    tables = load_oulad_tables()             # dict of DataFrames, keyed by table name
+    studentInfo = tables['studentInfo']
+    studentVle = tables['studentVle']
+
+    # Large tables can also be streamed in bounded chunks
+    from data_cache import iter_table_chunks
+    for chunk in iter_table_chunks('studentVle', chunksize=1_000_000):
+        ...
+
+If pyarrow is not installed the loader falls back to a typed ``pd.read_csv``
+(no cache is written).
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = None
+    pq = None
+
+
+# Bump this when the schemas below change so existing caches are rebuilt
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = '.oulad_cache'
+
+# Columns stored as categorical codes in every table that has them
+CATEGORICAL_COLUMNS = ('code_module', 'code_presentation', 'region', 'imd_band', 'activity_type')
+
+# File name and column dtypes for each OULAD table. Columns that can be empty
+# in the source data stay float64 so missing values survive as NaN.
+OULAD_SCHEMAS = {
+    'studentRegistration': {
+        'file': 'studentRegistration.csv',
+        'dtypes': {
+            'code_module': 'category',
+            'code_presentation': 'category',
+            'id_student': 'int32',
+            'date_registration': 'float64',
+            'date_unregistration': 'float64',
+        },
+    },
+    'studentInfo': {
+        'file': 'studentInfo.csv',
+        'dtypes': {
+            'code_module': 'category',
+            'code_presentation': 'category',
+            'id_student': 'int32',
+            'gender': 'object',
+            'region': 'category',
+            'highest_education': 'object',
+            'imd_band': 'category',
+            'age_band': 'object',
+            'num_of_prev_attempts': 'int16',
+            'studied_credits': 'int16',
+            'disability': 'object',
+            'final_result': 'object',
+        },
+    },
+    'studentVle': {
+        'file': 'studentvle.csv',
+        'dtypes': {
+            'code_module': 'category',
+            'code_presentation': 'category',
+            'id_student': 'int32',
+            'id_site': 'int32',
+            'date': 'int32',
+            'sum_click': 'int32',
+        },
+    },
+    'studentAssessment': {
+        'file': 'studentAssessment.csv',
+        'dtypes': {
+            'id_assessment': 'int32',
+            'id_student': 'int32',
+            'date_submitted': 'int32',
+            'is_banked': 'int8',
+            'score': 'float64',
+        },
+    },
+    'courses': {
+        'file': 'courses.csv',
+        'dtypes': {
+            'code_module': 'category',
+            'code_presentation': 'category',
+            'module_presentation_length': 'int16',
+        },
+    },
+    'vle': {
+        'file': 'vle.csv',
+        'dtypes': {
+            'id_site': 'int32',
+            'code_module': 'category',
+            'code_presentation': 'category',
+            'activity_type': 'category',
+            'week_from': 'float64',
+            'week_to': 'float64',
+        },
+    },
+    'assessments': {
+        'file': 'assessments.csv',
+        'dtypes': {
+            'code_module': 'category',
+            'code_presentation': 'category',
+            'id_assessment': 'int32',
+            'assessment_type': 'object',
+            'date': 'float64',
+            'weight': 'float64',
+        },
+    },
+}
+
+# Rows per chunk used while converting a CSV into the cache
+CONVERT_CHUNKSIZE = 1_000_000
+
+
+def file_checksum(path, block_size=1 << 20):
+    """Return the SHA-256 hex digest of a file, read in fixed-size blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def frame_checksum(frame):
+    """SHA-256 of a DataFrame's columns, dtypes, index and values (a cache key for derived results)."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(col), str(dtype)] for col, dtype in frame.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def resolve_source_path(name, data_dir='.'):
+    """
+    Return the path of the CSV backing table ``name``.
+
+    OULAD ships ``studentVle.csv`` while the notebook reads ``studentvle.csv``,
+    so the file name is matched case-insensitively if the exact name is missing.
+    """
+    if name not in OULAD_SCHEMAS:
+        raise KeyError(f"Unknown OULAD table '{name}'. Expected one of: {', '.join(OULAD_SCHEMAS)}")
+
+    data_path = Path(data_dir)
+    file_name = OULAD_SCHEMAS[name]['file']
+    path = data_path / file_name
+    if path.exists():
+        return path
+
+    for candidate in data_path.glob('*.csv'):
+        if candidate.name.lower() == file_name.lower():
+            return candidate
+
+    raise FileNotFoundError(f"Source file for '{name}' not found: {path}")
+
+
+def _csv_read_kwargs(name):
+    dtypes = OULAD_SCHEMAS[name]['dtypes']
+    # Categories are applied after reading so every chunk is parsed as plain strings
+    read_dtypes = {col: ('object' if dtype == 'category' else dtype) for col, dtype in dtypes.items()}
+    return {'usecols': list(dtypes), 'dtype': read_dtypes}
+
+
+def _apply_categories(df, name):
+    for col, dtype in OULAD_SCHEMAS[name]['dtypes'].items():
+        if dtype != 'category' or col not in df.columns:
+            continue
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            # Dictionaries from different row groups are unified in arbitrary order
+            df[col] = df[col].cat.set_categories(sorted(df[col].cat.categories))
+        else:
+            df[col] = df[col].astype('category')
+    return df
+
+
+def _paths(name, cache_dir):
+    cache_path = Path(cache_dir)
+    return cache_path / f'{name}.parquet', cache_path / f'{name}.manifest.json'
+
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _cache_is_fresh(source_path, parquet_path, manifest_path):
+    """Check the manifest against the source file, hashing only when size/mtime changed."""
+    manifest = _read_manifest(manifest_path)
+    if manifest is None or not parquet_path.exists():
+        return False
+    if manifest.get('cache_version') != CACHE_VERSION:
+        return False
+
+    stat = source_path.stat()
+    if manifest.get('source_size') == stat.st_size and manifest.get('source_mtime_ns') == stat.st_mtime_ns:
+        return True
+
+    if manifest.get('source_sha256') != file_checksum(source_path):
+        return False
+
+    # Same content with a new mtime (e.g. re-copied file): keep the cache
+    manifest['source_size'] = stat.st_size
+    manifest['source_mtime_ns'] = stat.st_mtime_ns
+    _write_json(manifest_path, manifest)
+    return True
+
+
+def _write_json(path, payload):
+    tmp_path = Path(f'{path}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def build_cache(name, data_dir='.', cache_dir=None, chunksize=CONVERT_CHUNKSIZE):
+    """
+    Convert one OULAD CSV into its typed Parquet cache file.
+
+    The CSV is parsed in chunks of ``chunksize`` rows and each chunk is written
+    as a Parquet row group, so peak memory is bounded by the chunk size rather
+    than the file size.
+
+    Returns the path of the written Parquet file.
+    """
+    if pq is None:
+        raise ImportError("pyarrow is required to build the Parquet cache (pip install pyarrow)")
+
+    cache_dir = Path(cache_dir if cache_dir is not None else Path(data_dir) / DEFAULT_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    source_path = resolve_source_path(name, data_dir)
+    parquet_path, manifest_path = _paths(name, cache_dir)
+
+    stat = source_path.stat()
+    checksum = file_checksum(source_path)
+
+    tmp_path = Path(f'{parquet_path}.tmp')
+    writer = None
+    n_rows = 0
+    try:
+        for chunk in pd.read_csv(source_path, chunksize=chunksize, **_csv_read_kwargs(name)):
+            chunk = _apply_categories(chunk, name)
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table)
+            n_rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        # Header-only CSV: still write an empty, correctly typed file
+        empty = _apply_categories(pd.read_csv(source_path, nrows=0, **_csv_read_kwargs(name)), name)
+        pq.write_table(pa.Table.from_pandas(empty, preserve_index=False), tmp_path)
+
+    os.replace(tmp_path, parquet_path)
+    _write_json(manifest_path, {
+        'table': name,
+        'cache_version': CACHE_VERSION,
+        'source': str(source_path),
+        'source_sha256': checksum,
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'n_rows': n_rows,
+    })
+    return parquet_path
+
+
+def ensure_cache(name, data_dir='.', cache_dir=None):
+    """
+    Return the Parquet cache path for ``name``, (re)building it if the source
+    CSV changed since the cache was written.
+    """
+    cache_dir = Path(cache_dir if cache_dir is not None else Path(data_dir) / DEFAULT_CACHE_DIR)
+    source_path = resolve_source_path(name, data_dir)
+    parquet_path, manifest_path = _paths(name, cache_dir)
+
+    if not _cache_is_fresh(source_path, parquet_path, manifest_path):
+        print(f"🔄 Building typed cache for {name} ({source_path.name})...")
+        build_cache(name, data_dir=data_dir, cache_dir=cache_dir)
+    return parquet_path
+
+
+def _filter_mask(df, filters):
+    mask = pd.Series(True, index=df.index)
+    for col, values in filters.items():
+        mask &= df[col].isin(values if isinstance(values, (list, tuple, set)) else [values])
+    return mask
+
+
+def load_table(name, data_dir='.', cache_dir=None, columns=None, filters=None):
+    """
+    Load one OULAD table with its declared dtypes.
+
+    Parameters:
+    -----------
+    name : str
+        Table name, e.g. 'studentInfo' or 'studentVle' (see OULAD_SCHEMAS)
+    data_dir : str
+        Directory containing the source CSV files
+    cache_dir : str, optional
+        Directory for the Parquet cache (default: <data_dir>/.oulad_cache)
+    columns : list, optional
+        Subset of columns to load
+    filters : dict, optional
+        Only load rows where each column equals the value (or one of the
+        values), e.g. {'code_module': 'AAA', 'code_presentation': '2013J'}.
+        With the Parquet cache only the matching row groups are read.
+
+    Returns:
+    --------
+    DataFrame with categorical codes for CATEGORICAL_COLUMNS
+    """
+    if pq is None:
+        source_path = resolve_source_path(name, data_dir)
+        kwargs = _csv_read_kwargs(name)
+        if columns is not None:
+            kwargs['usecols'] = list(dict.fromkeys(list(columns) + list(filters or {})))
+            kwargs['dtype'] = {col: kwargs['dtype'][col] for col in kwargs['usecols']}
+        if not filters:
+            return _apply_categories(pd.read_csv(source_path, **kwargs), name)
+        chunks = [
+            chunk[_filter_mask(chunk, filters)]
+            for chunk in pd.read_csv(source_path, chunksize=CONVERT_CHUNKSIZE, **kwargs)
+        ]
+        df = pd.concat(chunks, ignore_index=True)
+        return _apply_categories(df[list(columns)] if columns is not None else df, name)
+
+    parquet_path = ensure_cache(name, data_dir=data_dir, cache_dir=cache_dir)
+    arrow_filters = None
+    if filters:
+        arrow_filters = [
+            (col, 'in', list(values) if isinstance(values, (list, tuple, set)) else [values])
+            for col, values in filters.items()
+        ]
+    df = pq.read_table(parquet_path, columns=columns, filters=arrow_filters).to_pandas()
+    return _apply_categories(df, name)
+
+
+def load_oulad_tables(data_dir='.', cache_dir=None, tables=None):
+    """
+    Load the OULAD tables used by Final.ipynb through the typed cache.
+
+    Parameters:
+    -----------
+    data_dir : str
+        Directory containing the source CSV files
+    cache_dir : str, optional
+        Directory for the Parquet cache (default: <data_dir>/.oulad_cache)
+    tables : list, optional
+        Table names to load (default: all tables in OULAD_SCHEMAS)
+
+    Returns:
+    --------
+    dict mapping table name -> DataFrame
+    """
+    names = list(tables) if tables is not None else list(OULAD_SCHEMAS)
+    return {name: load_table(name, data_dir=data_dir, cache_dir=cache_dir) for name in names}
+
+
+def iter_table_chunks(name, data_dir='.', cache_dir=None, chunksize=CONVERT_CHUNKSIZE, columns=None):
+    """
+    Yield an OULAD table as DataFrames of at most ``chunksize`` rows.
+
+    Reads Parquet record batches from the cache (or CSV chunks when pyarrow is
+    unavailable) so the whole table is never materialised at once.
+    """
+    if pq is None:
+        source_path = resolve_source_path(name, data_dir)
+        kwargs = _csv_read_kwargs(name)
+        if columns is not None:
+            kwargs['usecols'] = list(columns)
+            kwargs['dtype'] = {col: kwargs['dtype'][col] for col in columns}
+        for chunk in pd.read_csv(source_path, chunksize=chunksize, **kwargs):
+            yield _apply_categories(chunk, name)
+        return
+
+    parquet_path = ensure_cache(name, data_dir=data_dir, cache_dir=cache_dir)
+    parquet_file = pq.ParquetFile(parquet_path)
+    for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+        yield _apply_categories(batch.to_pandas(), name)
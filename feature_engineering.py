@@ -0,0 +1,1315 @@
+"""
+Feature-engineering building blocks for the student outcome pipeline in Final.ipynb.
+
+The notebook cells call these helpers instead of doing row-wise pandas work,
+so the same logic can be reused (and tested against the notebook output)
+outside of the notebook.
+
+Usage:
+    from data_cache import load_oulad_tables
+    from feature_engineering import build_features
+
+    # One row per student, FEATURE_COLUMNS in the model's order
+    features = build_features(load_oulad_tables(), with_target=True)
+
+    # Streaming the click log instead of loading studentVle
+    from data_cache import iter_table_chunks
+    from feature_engineering import aggregate_student_vle_streaming
+
+    tables = load_oulad_tables(tables=['studentRegistration', 'studentInfo', 'studentAssessment',
+                                       'courses', 'vle', 'assessments'])
+    grouped_student_interaction = aggregate_student_vle_streaming(
+        iter_table_chunks('studentVle', chunksize=1_000_000), tables['vle']
+    )
+    features = build_features(tables, grouped_student_interaction=grouped_student_interaction)
+
+    # Check the vectorised features against the notebook's original row-level code
+    python feature_engineering.py
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# Rows of the studentVle click log processed per chunk in streaming mode
+CLICK_LOG_CHUNKSIZE = 1_000_000
+
+def build_site_activity_lookup(vle):
+    """
+    Build a dense id_site -> activity_type lookup from the vle table.
+
+    Returns a dict with:
+    - 'activity': int array indexed by id_site holding the activity_type code (-1 = unknown site)
+    - 'module' / 'presentation': int arrays indexed by id_site holding the owning course codes
+    - 'activity_types' / 'modules' / 'presentations': the category labels for those codes
+    """
+    # Sorted labels keep the output ordered exactly like a groupby over strings
+    modules = pd.Categorical(vle['code_module'])
+    modules = modules.set_categories(sorted(modules.categories))
+    presentations = pd.Categorical(vle['code_presentation'])
+    presentations = presentations.set_categories(sorted(presentations.categories))
+    activities = pd.Categorical(vle['activity_type'])
+    activities = activities.set_categories(sorted(activities.categories))
+
+    site_ids = vle['id_site'].to_numpy(dtype=np.int64)
+    if len(site_ids) and site_ids.min() < 0:
+        raise ValueError("vle.id_site must be non-negative")
+    if len(np.unique(site_ids)) != len(site_ids):
+        raise ValueError("vle.id_site must be unique to build the site lookup")
+
+    size = int(site_ids.max()) + 1 if len(site_ids) else 0
+    lookup = {
+        'activity': np.full(size, -1, dtype=np.int32),
+        'module': np.full(size, -1, dtype=np.int32),
+        'presentation': np.full(size, -1, dtype=np.int32),
+        'activity_types': activities.categories,
+        'modules': modules.categories,
+        'presentations': presentations.categories,
+    }
+    lookup['activity'][site_ids] = activities.codes
+    lookup['module'][site_ids] = modules.codes
+    lookup['presentation'][site_ids] = presentations.codes
+    return lookup
+
+
+def _recode(series, categories):
+    """Codes of ``series`` against a fixed category index (-1 for labels not in it)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        mapping = categories.get_indexer(series.cat.categories)
+        codes = series.cat.codes.to_numpy()
+        return np.where(codes >= 0, mapping[codes], -1)
+    return categories.get_indexer(series)
+
+
+def _chunk_keys(chunk, lookup):
+    """Pack each click row into one int64 key; rows with no matching vle site are dropped."""
+    site_ids = chunk['id_site'].to_numpy(dtype=np.int64)
+    in_range = (site_ids >= 0) & (site_ids < len(lookup['activity']))
+    safe_ids = np.where(in_range, site_ids, 0)
+
+    activity = np.where(in_range, lookup['activity'][safe_ids], -1)
+    module = _recode(chunk['code_module'], lookup['modules'])
+    presentation = _recode(chunk['code_presentation'], lookup['presentations'])
+
+    # Same semantics as the left merge on (code_module, code_presentation, id_site)
+    # followed by a groupby that drops rows whose activity_type is missing
+    matched = (
+        (activity >= 0)
+        & (module == lookup['module'][safe_ids])
+        & (presentation == lookup['presentation'][safe_ids])
+    )
+
+    n_presentations = len(lookup['presentations'])
+    n_activities = len(lookup['activity_types'])
+    students = chunk['id_student'].to_numpy(dtype=np.int64)[matched]
+    keys = ((students * len(lookup['modules']) + module[matched]) * n_presentations
+            + presentation[matched]) * n_activities + activity[matched]
+    clicks = chunk['sum_click'].to_numpy(dtype=np.float64)[matched]
+    return keys, clicks
+
+
+def _fold(keys, sums, counts, new_keys, new_sums, new_counts):
+    all_keys = np.concatenate([keys, new_keys])
+    uniq, inverse = np.unique(all_keys, return_inverse=True)
+    return (
+        uniq,
+        np.bincount(inverse, weights=np.concatenate([sums, new_sums]), minlength=len(uniq)),
+        np.bincount(inverse, weights=np.concatenate([counts, new_counts]), minlength=len(uniq)),
+    )
+
+
+def aggregate_student_vle_streaming(chunks, vle):
+    """
+    Streaming equivalent of merging studentVle with vle and aggregating clicks.
+
+    Produces the same frame as:
+
+        studentVle.merge(vle, on=['code_module', 'code_presentation', 'id_site'], how='left')
+                  .groupby(['id_student', 'code_module', 'code_presentation', 'activity_type'])['sum_click']
+                  .agg(['sum', 'count']).reset_index()
+
+    (with ``sum``/``count`` always int64) but never materialises the merged
+    click log. Each chunk is mapped to
+    activity types through a dense id_site lookup array, reduced to per-key
+    sums and counts, and folded into running totals, so peak memory depends
+    on the number of distinct (student, course, activity_type) keys rather
+    than on the length of the log.
+
+    Parameters:
+    -----------
+    chunks : iterable of DataFrame
+        studentVle chunks with code_module, code_presentation, id_student, id_site and sum_click
+    vle : DataFrame
+        The vle table (id_site, code_module, code_presentation, activity_type)
+
+    Returns:
+    --------
+    DataFrame with columns id_student, code_module, code_presentation, activity_type, sum, count
+    """
+    lookup = build_site_activity_lookup(vle)
+    keys = np.empty(0, dtype=np.int64)
+    sums = np.empty(0, dtype=np.float64)
+    counts = np.empty(0, dtype=np.float64)
+    id_dtype = np.dtype(np.int64)
+
+    for chunk in chunks:
+        id_dtype = chunk['id_student'].dtype
+        chunk_keys, chunk_clicks = _chunk_keys(chunk, lookup)
+        if len(chunk_keys) == 0:
+            continue
+        chunk_uniq, inverse = np.unique(chunk_keys, return_inverse=True)
+        chunk_sums = np.bincount(inverse, weights=chunk_clicks, minlength=len(chunk_uniq))
+        chunk_counts = np.bincount(inverse, minlength=len(chunk_uniq)).astype(np.float64)
+        keys, sums, counts = _fold(keys, sums, counts, chunk_uniq, chunk_sums, chunk_counts)
+
+    n_presentations = len(lookup['presentations'])
+    n_activities = len(lookup['activity_types'])
+    activity = keys % n_activities
+    rest = keys // n_activities
+    presentation = rest % n_presentations
+    rest = rest // n_presentations
+    module = rest % len(lookup['modules'])
+    students = rest // len(lookup['modules'])
+
+    return pd.DataFrame({
+        'id_student': students.astype(id_dtype),
+        'code_module': pd.Categorical.from_codes(module, categories=lookup['modules']),
+        'code_presentation': pd.Categorical.from_codes(presentation, categories=lookup['presentations']),
+        'activity_type': pd.Categorical.from_codes(activity, categories=lookup['activity_types']),
+        'sum': np.rint(sums).astype(np.int64),
+        'count': counts.astype(np.int64),
+    })
+
+
+def _segments(keys):
+    """Group codes, group sizes and each row's 0-based position within its group (in row order)."""
+    codes, uniques = pd.factorize(keys, use_na_sentinel=False)
+    sizes = np.bincount(codes, minlength=len(uniques))
+    positions = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+    return codes, sizes, positions
+
+
+def group_slope(keys, values):
+    """
+    Per-row OLS slope of ``values`` against their position within each group.
+
+    Vectorised replacement for
+    ``groupby(keys).transform(lambda x: np.polyfit(range(len(x)), x, 1)[0] if len(x) > 1 else 0)``:
+    the slope is computed from per-group centred sums, with rows taken in
+    their current order (sort the frame first, as the notebook does).
+    """
+    codes, sizes, positions = _segments(keys)
+    y = np.asarray(values, dtype=np.float64)
+
+    y_mean = np.bincount(codes, weights=y, minlength=len(sizes)) / np.maximum(sizes, 1)
+    dx = positions - (sizes[codes] - 1) / 2.0
+    dy = y - y_mean[codes]
+    sxy = np.bincount(codes, weights=dx * dy, minlength=len(sizes))
+    # sum((x - mean(x))**2) for x = 0..n-1
+    sxx = sizes * (sizes.astype(np.float64) ** 2 - 1) / 12.0
+
+    slope = np.zeros(len(sizes))
+    multi = sizes > 1
+    slope[multi] = sxy[multi] / sxx[multi]
+    return slope[codes]
+
+
+def group_cv(keys, values, weights=None):
+    """
+    Per-row coefficient of variation (population std / mean) of ``values`` within each group.
+
+    Vectorised replacement for
+    ``groupby(keys).transform(lambda x: np.std(x) / np.mean(x) if np.mean(x) > 0 else 0)``.
+    Optional per-row ``weights`` act as repeat counts (a row with weight 3
+    counts like three identical rows).
+    """
+    codes, sizes, _ = _segments(keys)
+    y = np.asarray(values, dtype=np.float64)
+    w = np.ones(len(y)) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    total = np.maximum(np.bincount(codes, weights=w, minlength=len(sizes)), np.finfo(np.float64).tiny)
+    mean = np.bincount(codes, weights=w * y, minlength=len(sizes)) / total
+    dev = y - mean[codes]
+    std = np.sqrt(np.bincount(codes, weights=w * dev * dev, minlength=len(sizes)) / total)
+
+    cv = np.zeros(len(sizes))
+    positive = mean > 0
+    cv[positive] = std[positive] / mean[positive]
+    return cv[codes]
+
+
+# score_momentum: mean of the last 3 scores minus mean of the first 3, for students with 6+ rows
+MOMENTUM_WINDOW = 3
+MOMENTUM_MIN_SIZE = 6
+
+
+def group_momentum(keys, values, window=MOMENTUM_WINDOW, min_size=MOMENTUM_MIN_SIZE):
+    """
+    Per-row difference between the mean of the last and first ``window`` values of each group.
+
+    Vectorised replacement for
+    ``groupby(keys).transform(lambda x: x.tail(3).mean() - x.head(3).mean() if len(x) >= 6 else 0)``.
+    """
+    codes, sizes, positions = _segments(keys)
+    y = np.asarray(values, dtype=np.float64)
+
+    head = positions < window
+    tail = positions >= sizes[codes] - window
+    window_sizes = np.minimum(np.maximum(sizes, 1), window)
+    head_mean = np.bincount(codes[head], weights=y[head], minlength=len(sizes)) / window_sizes
+    tail_mean = np.bincount(codes[tail], weights=y[tail], minlength=len(sizes)) / window_sizes
+
+    momentum = np.where(sizes >= min_size, tail_mean - head_mean, 0.0)
+    return momentum[codes]
+
+
+# Study-method classification (notebook cell 15)
+STUDY_METHOD_THRESHOLD = 5
+
+ALL_ACTIVITY_TYPES = [
+    'homepage', 'subpage', 'resource', 'forumng', 'oucontent', 'url',
+    'quiz', 'ouwiki', 'oucollaborate', 'page', 'glossary', 'questionnaire',
+    'dualpane', 'dataplus', 'externalquiz', 'ouelluminate', 'folder',
+    'htmlactivity', 'sharedsubpage', 'repeatactivity'
+]
+RESOURCE_ACTIVITY_TYPES = [
+    'resource', 'homepage', 'folder', 'subpage', 'url', 'page',
+    'glossary', 'dataplus', 'dualpane', 'htmlactivity'
+]
+COLLABORATIVE_ACTIVITY_TYPES = [
+    'ouelluminate', 'ouwiki', 'sharedsubpage', 'oucontent', 'page', 'oucollaborate'
+]
+
+
+def classify_study_method(activity_counts, threshold=STUDY_METHOD_THRESHOLD):
+    """
+    Label every row of an activity-count matrix with its study_method_preference.
+
+    Batch version of the notebook's row-wise ``determine_study_method``: the
+    poor / interactive / resource-based / collaborative conditions are built
+    as boolean masks over the whole matrix and resolved with one ``np.select``
+    using the same precedence:
+
+    1. Offline Content - every activity below threshold and no other condition
+    2. Collaborative   - collaborative and not interactive
+    3. Resource-Based  - resource-based and neither collaborative nor interactive
+    4. Interactive     - interactive
+    5. Informational   - everything else
+
+    Parameters:
+    -----------
+    activity_counts : DataFrame
+        One row per student, one column per activity_type (missing columns count as 0)
+    threshold : int
+        Activity count threshold used by all conditions
+
+    Returns:
+    --------
+    Series of labels indexed like ``activity_counts``
+    """
+    columns = list(dict.fromkeys(ALL_ACTIVITY_TYPES + RESOURCE_ACTIVITY_TYPES + COLLABORATIVE_ACTIVITY_TYPES))
+    counts = activity_counts.reindex(columns=columns, fill_value=0)
+    above = counts.to_numpy(dtype=np.float64) > threshold
+    below = counts.to_numpy(dtype=np.float64) < threshold
+    col = {name: i for i, name in enumerate(columns)}
+
+    def index(names):
+        return [col[name] for name in names]
+
+    poor = below[:, index(ALL_ACTIVITY_TYPES)].all(axis=1)
+    interactive = (
+        (above[:, col['quiz']] & above[:, col['externalquiz']])
+        | above[:, col['repeatactivity']]
+        | above[:, col['questionnaire']]
+    )
+    resource_based = above[:, index(RESOURCE_ACTIVITY_TYPES)].any(axis=1)
+    collaborative = above[:, index(COLLABORATIVE_ACTIVITY_TYPES)].any(axis=1)
+
+    labels = np.select(
+        [
+            poor & ~(collaborative | interactive | resource_based),
+            collaborative & ~interactive,
+            resource_based & ~(collaborative | interactive),
+            interactive,
+        ],
+        ['Offline Content', 'Collaborative', 'Resource-Based', 'Interactive'],
+        default='Informational',
+    )
+    return pd.Series(labels, index=activity_counts.index, name='study_method_preference', dtype=object)
+
+
+def group_mode(keys, values, weights=None):
+    """
+    Most frequent value of ``values`` within each group of ``keys``.
+
+    Vectorised replacement for ``groupby(keys)[col].agg(lambda x: x.mode().iloc[0])``:
+    values are factorised once, (group, value) pairs are counted in a single
+    pass and the winner per group is picked by an argmax over the counts.
+    Ties go to the smallest value, exactly like ``Series.mode()`` (which
+    returns its modes sorted). Missing values are ignored; groups with no
+    non-missing value get None.
+
+    Parameters:
+    -----------
+    keys : array-like
+        Group key for every row (rows with a missing key are dropped, as in groupby)
+    values : array-like
+        Values to take the mode of
+    weights : array-like, optional
+        Per-row repeat counts (default: every row counts once)
+
+    Returns:
+    --------
+    Series indexed by the sorted unique keys
+    """
+    group_codes, groups = pd.factorize(keys, sort=True)
+    value_codes, uniques = pd.factorize(values, sort=True)
+    name = getattr(values, 'name', None)
+
+    valid = (group_codes >= 0) & (value_codes >= 0)
+    pairs = group_codes[valid].astype(np.int64) * max(len(uniques), 1) + value_codes[valid]
+    if weights is None:
+        pair_keys, counts = np.unique(pairs, return_counts=True)
+    else:
+        pair_keys, inverse = np.unique(pairs, return_inverse=True)
+        counts = np.bincount(inverse, weights=np.asarray(weights, dtype=np.float64)[valid], minlength=len(pair_keys))
+    pair_groups = pair_keys // max(len(uniques), 1)
+    pair_values = pair_keys % max(len(uniques), 1)
+
+    # Per group: highest count first, then the smallest value code
+    order = np.lexsort((pair_values, -counts, pair_groups))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = pair_groups[order][1:] != pair_groups[order][:-1]
+    winners = order[first]
+
+    modes = np.full(len(groups), None, dtype=object)
+    modes[pair_groups[winners]] = np.asarray(uniques, dtype=object)[pair_values[winners]]
+    return pd.Series(modes, index=groups, name=name).infer_objects()
+
+
+def fill_with_group_mode(df, column, by):
+    """
+    Fill missing values of ``df[column]`` with the mode of ``column`` within each ``by`` group.
+
+    Vectorised replacement for ``df.groupby(by).apply(fill_with_mode)``; rows
+    keep their original order. Rows whose group has no mode stay missing.
+    """
+    modes = group_mode(df[by], df[column])
+    fill = df[by].astype(object).map(modes)
+    return df[column].fillna(fill)
+
+
+def aggregate_with_modes(frame, by, spec):
+    """
+    ``frame.groupby(by).agg(spec)`` where spec entries equal to 'mode' use group_mode.
+
+    Every other entry is passed to pandas unchanged, so 'mean', 'sum',
+    'first' etc. keep their cythonised implementations. Columns come back in
+    ``spec`` order, indexed by the sorted group keys.
+    """
+    mode_columns = [col for col, how in spec.items() if isinstance(how, str) and how == 'mode']
+    other = {col: how for col, how in spec.items() if col not in mode_columns}
+
+    grouped = frame.groupby(by, observed=True)
+    result = grouped.agg(other) if other else pd.DataFrame(index=grouped.size().index)
+    for col in mode_columns:
+        result[col] = group_mode(frame[by], frame[col])
+    return result[list(spec)]
+
+
+# Aggregate-before-join plan (notebook cells 8-16)
+#
+# The click side (student x presentation x activity_type) and the assessment
+# side (student x presentation x assessment) used to be inner-joined row by
+# row, so every student-presentation produced k * m rows before the summary
+# collapsed them again. Instead both sides are kept at their own grain and
+# every row carries the size of the *other* side of its student-presentation.
+# A mean over the old cross product is then a weighted mean over one side
+# (weights m on click rows, k on assessment rows, k * m on the
+# student-presentation table), which gives the same numbers without ever
+# materialising the product.
+#
+# The order-dependent features (cumulative_score, engagement_trend,
+# score_trend, score_momentum, learning_pace) ran over the row join sorted
+# by (id_student, date) with a stable sort. That order is fixed by the
+# merge: per date, each presentation in join order emits its k click rows
+# in turn, each paired with the presentation's assessments on that date.
+# sequence_features rebuilds the same sums from per-segment totals.
+PRESENTATION_KEYS = ['id_student', 'code_module', 'code_presentation']
+
+ASSESSMENT_COLUMNS = [
+    'id_assessment', 'assessment_type', 'date', 'weight',
+    'date_submitted', 'is_banked', 'score',
+]
+
+
+def compact_frame(frame, lossy_float32=False):
+    """
+    Copy of ``frame`` in the memory-budget dtypes.
+
+    - integer columns (ids, day offsets, counts) -> int16 or int32 when the values fit
+    - float columns -> float32 when that round-trips exactly (scores, weights,
+      dates), or always with ``lossy_float32`` (derived ratios / features,
+      ~7 significant digits)
+    - string / object columns -> category
+
+    Parameters:
+    -----------
+    frame : DataFrame
+        Frame to compact
+    lossy_float32 : bool
+        Store every float column as float32, even if that rounds values
+
+    Returns:
+    --------
+    DataFrame with the same columns and index
+    """
+    compact = frame.copy()
+    for col in compact.columns:
+        values = compact[col]
+        if isinstance(values.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(values):
+            continue
+        if pd.api.types.is_integer_dtype(values):
+            low, high = (values.min(), values.max()) if len(values) else (0, 0)
+            for dtype in (np.int16, np.int32):
+                if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                    compact[col] = values.astype(dtype)
+                    break
+        elif pd.api.types.is_float_dtype(values):
+            as_float32 = values.astype(np.float32)
+            if lossy_float32 or np.array_equal(as_float32.to_numpy(dtype=np.float64), values.to_numpy(), equal_nan=True):
+                compact[col] = as_float32
+        elif pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            compact[col] = values.astype('category')
+    return compact
+
+
+def record_checkpoint(checkpoints, stage, frame):
+    """
+    Append (and print) the row count and in-memory size of ``frame`` after a pipeline stage.
+
+    Parameters:
+    -----------
+    checkpoints : list or None
+        List the checkpoint dict is appended to (nothing is recorded when None)
+    stage : str
+        Name of the stage
+    frame : DataFrame
+        Frame produced by the stage
+    """
+    if checkpoints is None:
+        return
+    n_bytes = int(frame.memory_usage(deep=True).sum())
+    checkpoint = {
+        'stage': stage,
+        'rows': len(frame),
+        'columns': frame.shape[1],
+        'bytes': n_bytes,
+        'mb': n_bytes / 1024 ** 2,
+    }
+    checkpoints.append(checkpoint)
+    print(f"📊 {stage}: {checkpoint['rows']:,} rows x {checkpoint['columns']} cols, {checkpoint['mb']:.1f} MB")
+
+
+def build_join_plan(grouped_student_interaction, df, checkpoints=None):
+    """
+    Reduce the click and assessment sides to the student-presentation grain instead of joining them.
+
+    Both inputs are semi-joined on ``PRESENTATION_KEYS`` (the inner join
+    the notebook used to do keeps exactly these student-presentations).
+
+    Parameters:
+    -----------
+    grouped_student_interaction : DataFrame
+        One row per student x presentation x activity_type with 'sum' and 'count' clicks
+    df : DataFrame
+        One row per student x assessment with the student/course columns attached
+    checkpoints : list, optional
+        Receives a row/memory checkpoint per stage (see record_checkpoint)
+
+    Returns:
+    --------
+    tuple of (interaction_side, assessment_side, student_presentations)
+        interaction_side : click rows plus 'n_assessments', 'module_presentation_length' and 'join_order'
+        assessment_side : assessment rows plus 'n_activity_rows', 'date_registration' and 'join_order'
+        student_presentations : one row per student-presentation with the
+            demographic/course columns, both side sizes, 'first_date'
+            (earliest assessment date) and 'join_order' (rank of the
+            presentation's first click row, the order the row join emitted
+            presentations in), ordered by student, first_date, join_order
+    """
+    record_checkpoint(checkpoints, 'input: interaction rows', grouped_student_interaction)
+    record_checkpoint(checkpoints, 'input: assessment rows', df)
+
+    # sort=False keeps the presentations in order of their first click row
+    n_activity_rows = grouped_student_interaction.groupby(PRESENTATION_KEYS, observed=True, sort=False).size()
+    assessment_groups = df.groupby(PRESENTATION_KEYS, observed=True)
+    sizes = pd.concat(
+        [n_activity_rows.rename('n_activity_rows'),
+         pd.Series(np.arange(len(n_activity_rows)), index=n_activity_rows.index, name='join_order'),
+         assessment_groups.size().rename('n_assessments'),
+         assessment_groups['date'].min().rename('first_date')],
+        axis=1, join='inner',
+    ).reset_index()
+
+    presentation_columns = [col for col in df.columns if col not in ASSESSMENT_COLUMNS]
+    student_presentations = (
+        df[presentation_columns]
+        .drop_duplicates(PRESENTATION_KEYS)
+        .merge(sizes, on=PRESENTATION_KEYS, how='inner')
+        .sort_values(['id_student', 'first_date', 'join_order'], kind='stable')
+        .reset_index(drop=True)
+    )
+
+    interaction_side = grouped_student_interaction.merge(
+        student_presentations[PRESENTATION_KEYS + ['n_assessments', 'module_presentation_length', 'join_order']],
+        on=PRESENTATION_KEYS, how='inner',
+    )
+    assessment_side = df[PRESENTATION_KEYS + ASSESSMENT_COLUMNS + ['date_registration']].merge(
+        student_presentations[PRESENTATION_KEYS + ['n_activity_rows', 'join_order']],
+        on=PRESENTATION_KEYS, how='inner',
+    )
+
+    record_checkpoint(checkpoints, 'interaction side', interaction_side)
+    record_checkpoint(checkpoints, 'assessment side', assessment_side)
+    record_checkpoint(checkpoints, 'student-presentations', student_presentations)
+    if checkpoints is not None:
+        cross_rows = int((student_presentations['n_activity_rows'] * student_presentations['n_assessments']).sum())
+        print(f"✅ Row-level join avoided: it would have produced {cross_rows:,} rows")
+    return interaction_side, assessment_side, student_presentations
+
+
+def _group_weighted_mean(keys, values, weights):
+    """Per-row weighted mean of ``values`` within each group (missing values ignored)."""
+    codes, sizes, _ = _segments(keys)
+    y = np.asarray(values, dtype=np.float64)
+    w = np.where(np.isnan(y), 0.0, np.asarray(weights, dtype=np.float64))
+    total = np.bincount(codes, weights=w, minlength=len(sizes))
+    weighted = np.bincount(codes, weights=w * np.where(np.isnan(y), 0.0, y), minlength=len(sizes))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (weighted / total)[codes]
+
+
+def add_interaction_features(interaction_side):
+    """
+    Click-side features (notebook cell 14), one row per student x presentation x activity_type.
+
+    Every feature equals its row-join value; engagement_trend depends on the
+    row order and is added by add_presentation_features (see sequence_features).
+    """
+    side = interaction_side.copy()
+    side['assessment_engagement_score'] = side['sum'].astype(np.int64) * side['count']
+    side['module_engagement_rate'] = side['sum'] / side['module_presentation_length']
+    side['activity_diversity'] = side.groupby('id_student')['activity_type'].transform('nunique')
+    side['engagement_cv'] = group_cv(side['id_student'], side['sum'], weights=side['n_assessments'])
+    return side
+
+
+def add_assessment_features(assessment_side):
+    """
+    Assessment-side features (notebook cell 14), one row per student x assessment.
+
+    Rows are sorted the way the row join ordered each student's assessments
+    (by date, then presentation in join order, stable). The order-dependent
+    features are added by add_presentation_features (see sequence_features).
+    """
+    side = assessment_side.copy()
+    side['submission_timeliness'] = side['date_submitted'] - side['date']
+    side['score_per_weight'] = side['score'] / (side['weight'] + 1)
+    side['days_since_registration'] = side['date'] - side['date_registration']
+    side['performance_by_registration'] = side['score'] / (side['days_since_registration'] + 1)
+    side['banked_assessment_ratio'] = _group_weighted_mean(
+        side['id_student'], side['is_banked'], side['n_activity_rows']
+    )
+    return side.sort_values(['id_student', 'date', 'join_order'], kind='stable').reset_index(drop=True)
+
+
+def sequence_features(interaction_side, assessment_side):
+    """
+    Order-dependent features of the row join, per student, without building it.
+
+    The notebook sorted the row join by (id_student, date) and took the
+    cumsum of score, the polyfit slopes of sum and score, the last-3 minus
+    first-3 score means and the diff of date_submitted over each student's
+    rows. In that order a student's rows form one segment per (date,
+    presentation): the presentation's k click rows in turn, each paired with
+    the c assessments of the segment. Segment totals of score, position x score,
+    clicks and position x clicks give the same values in closed form.
+
+    Click rows must be contiguous per student-presentation (every click
+    aggregate in this module is sorted by PRESENTATION_KEYS).
+
+    Parameters:
+    -----------
+    interaction_side, assessment_side : DataFrame
+        Outputs of build_join_plan (with 'join_order')
+
+    Returns:
+    --------
+    DataFrame indexed by id_student with engagement_trend, score_trend and
+    score_momentum, and the row-join means of cumulative_score and learning_pace
+    """
+    # Click side per presentation: k rows, total clicks and sum of (row position x clicks)
+    presentation = interaction_side['join_order'].to_numpy()
+    clicks = interaction_side['sum'].to_numpy(dtype=np.float64)
+    position = interaction_side.groupby('join_order').cumcount().to_numpy()
+    n_presentations = int(presentation.max()) + 1 if len(presentation) else 0
+    k_rows = np.bincount(presentation, minlength=n_presentations).astype(np.float64)
+    click_total = np.bincount(presentation, weights=clicks, minlength=n_presentations)
+    click_moment = np.bincount(presentation, weights=position * clicks, minlength=n_presentations)
+
+    side = assessment_side[['id_student', 'date', 'join_order', 'score', 'date_submitted']].sort_values(
+        ['id_student', 'date', 'join_order'], kind='stable'
+    )
+    student = side['id_student'].to_numpy()
+    date = side['date'].to_numpy(dtype=np.float64)
+    order = side['join_order'].to_numpy()
+    score = side['score'].to_numpy(dtype=np.float64)
+    submitted = side['date_submitted'].to_numpy(dtype=np.float64)
+
+    # Segments: runs of one student, date and presentation
+    same_date = (date[1:] == date[:-1]) | (np.isnan(date[1:]) & np.isnan(date[:-1]))
+    new_student = np.r_[True, student[1:] != student[:-1]]
+    new_segment = new_student | np.r_[True, (order[1:] != order[:-1]) | ~same_date]
+    segment = np.cumsum(new_segment) - 1
+    start = np.flatnonzero(new_segment)
+    c = np.bincount(segment).astype(np.float64)
+    local = np.arange(len(score)) - start[segment]
+    score_total = np.bincount(segment, weights=score)
+    score_moment = np.bincount(segment, weights=local * score)
+
+    seg_presentation = order[start]
+    k = k_rows[seg_presentation]
+    length = (k * c).astype(np.int64)
+    seg_student = np.cumsum(new_student[start]) - 1
+    students = student[start][new_student[start]]
+    first_segment = np.flatnonzero(new_student[start])
+
+    n = np.bincount(seg_student, weights=length).astype(np.int64)
+    global_offset = np.cumsum(length) - length
+    base = global_offset[first_segment]
+    centred_offset = global_offset - base[seg_student] - (n[seg_student] - 1) / 2.0
+
+    # sum((x - mean(x)) * y): score tiles the segment's assessments k times,
+    # clicks repeat each click row c times
+    score_sxy = np.bincount(seg_student, weights=k * (centred_offset * score_total
+                                                      + c * score_total * (k - 1) / 2.0 + score_moment))
+    click_sxy = np.bincount(seg_student, weights=(click_total[seg_presentation] * (c * centred_offset + c * (c - 1) / 2.0)
+                                                  + c * c * click_moment[seg_presentation]))
+    sxx = n * (n.astype(np.float64) ** 2 - 1) / 12.0
+    multi = n > 1
+    score_trend = np.zeros(len(students))
+    engagement_trend = np.zeros(len(students))
+    score_trend[multi] = score_sxy[multi] / sxx[multi]
+    engagement_trend[multi] = click_sxy[multi] / sxx[multi]
+
+    # mean of the running score total: every score counts once for itself and each later row
+    score_sum = np.bincount(seg_student, weights=k * score_total)
+    cumulative_score = ((n - (n - 1) / 2.0) * score_sum - score_sxy) / n
+
+    # learning_pace: diffs inside each tile (k times), between the k tiles and between segments
+    end = start + c.astype(np.int64) - 1
+    inner = ~new_segment[1:]
+    within = np.bincount(segment[1:][inner], weights=np.nan_to_num(np.diff(submitted)[inner]), minlength=len(start))
+    tile_step = np.nan_to_num(submitted[start] - submitted[end])
+    pace_total = np.bincount(seg_student, weights=k * within + (k - 1) * tile_step)
+    later = ~new_student[start][1:]
+    pace_total += np.bincount(seg_student[1:][later], weights=np.nan_to_num(submitted[start[1:]] - submitted[end[:-1]])[later],
+                              minlength=len(students))
+    learning_pace = pace_total / n
+
+    # score_momentum: values at the first and last three positions of the sequence
+    def score_at(offsets):
+        x = base[:, None] + np.clip(offsets, 0, n[:, None] - 1)
+        seg = np.searchsorted(global_offset, x, side='right') - 1
+        return score[start[seg] + (x - global_offset[seg]) % c[seg].astype(np.int64)]
+
+    head = score_at(np.arange(MOMENTUM_WINDOW)[None, :])
+    tail = score_at(n[:, None] - MOMENTUM_WINDOW + np.arange(MOMENTUM_WINDOW)[None, :])
+    score_momentum = np.where(n >= MOMENTUM_MIN_SIZE, tail.mean(axis=1) - head.mean(axis=1), 0.0)
+
+    return pd.DataFrame({
+        'cumulative_score': cumulative_score,
+        'engagement_trend': engagement_trend,
+        'score_trend': score_trend,
+        'score_momentum': score_momentum,
+        'learning_pace': learning_pace,
+    }, index=pd.Index(students, name='id_student'))
+
+
+def add_presentation_features(student_presentations, interaction_side, assessment_side):
+    """
+    Student-presentation features that need both sides (notebook cell 14).
+
+    weighted_engagement is assessment_engagement_score * weight averaged over
+    every (activity row, assessment) pair of the presentation, which factorises
+    into sum(engagement) * sum(weight) / (k * m). The per-student
+    sequence_features are repeated on each of the student's presentations.
+    """
+    presentations = student_presentations.copy()
+    presentations['repeat_student'] = (presentations['num_of_prev_attempts'] > 0).astype(int)
+
+    engagement = interaction_side.groupby(PRESENTATION_KEYS, observed=True)['assessment_engagement_score'].sum()
+    weight = assessment_side.groupby(PRESENTATION_KEYS, observed=True)['weight'].sum()
+    keys = pd.MultiIndex.from_frame(presentations[PRESENTATION_KEYS])
+    pairs = presentations['n_activity_rows'] * presentations['n_assessments']
+    presentations['weighted_engagement'] = (
+        engagement.reindex(keys).to_numpy() * weight.reindex(keys).to_numpy() / pairs.to_numpy()
+    )
+    sequence = sequence_features(interaction_side, assessment_side)
+    for col in sequence.columns:
+        presentations[col] = presentations['id_student'].map(sequence[col])
+    return presentations
+
+
+def student_activity_counts(interaction_side):
+    """
+    Activity-type counts per student as the row join used to produce them (input to classify_study_method).
+
+    Each click row stood for ``n_assessments`` joined rows, so the counts are
+    the per-student sums of that weight.
+    """
+    counts = interaction_side.pivot_table(
+        index='id_student', columns='activity_type', values='n_assessments',
+        aggfunc='sum', fill_value=0, observed=True,
+    )
+    counts.columns = counts.columns.astype(str)
+    counts.columns.name = 'activity_type'
+    return counts
+
+
+def summarise_join_plan(spec, student_presentations, assessment_side, interaction_side, checkpoints=None):
+    """
+    Per-student summary of the join plan, equal to aggregating the old row join with ``spec``.
+
+    Each column is read from the first frame that has it (student-presentations,
+    then assessment side, then interaction side) with weights k * m, k and m
+    respectively, so 'mean', 'sum' and 'mode' match the row join. 'first' takes
+    the first row of the frame: the earliest-dated presentation, or the
+    earliest assessment (ties in join order, as in the row join).
+
+    Parameters:
+    -----------
+    spec : dict
+        Column -> 'mean', 'sum', 'first' or 'mode' (the notebook's summary_columns)
+    student_presentations, assessment_side, interaction_side : DataFrame
+        Outputs of build_join_plan (plus the add_*_features columns)
+    checkpoints : list, optional
+        Receives a row/memory checkpoint for the summary
+
+    Returns:
+    --------
+    DataFrame indexed by id_student with the columns in ``spec`` order
+    """
+    frames = [
+        (student_presentations, student_presentations['n_activity_rows'] * student_presentations['n_assessments']),
+        (assessment_side, assessment_side['n_activity_rows']),
+        (interaction_side, interaction_side['n_assessments']),
+    ]
+    students = np.sort(pd.unique(student_presentations['id_student']))
+
+    result = {}
+    for col, how in spec.items():
+        frame, weights = next((f, w) for f, w in frames if col in f.columns)
+        codes = np.searchsorted(students, frame['id_student'].to_numpy())
+        if how == 'mode':
+            result[col] = group_mode(frame['id_student'], frame[col], weights=weights).reindex(students).to_numpy()
+        elif how == 'first':
+            result[col] = frame.groupby('id_student', sort=True)[col].first().reindex(students).to_numpy()
+        elif how in ('mean', 'sum'):
+            y = frame[col].to_numpy(dtype=np.float64)
+            w = np.where(np.isnan(y), 0.0, weights.to_numpy(dtype=np.float64))
+            total = np.bincount(codes, weights=w * np.where(np.isnan(y), 0.0, y), minlength=len(students))
+            if how == 'sum':
+                result[col] = np.rint(total).astype(np.int64) if pd.api.types.is_integer_dtype(frame[col]) else total
+            else:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    result[col] = total / np.bincount(codes, weights=w, minlength=len(students))
+        else:
+            raise ValueError(f"Unsupported aggregation for '{col}': {how!r}")
+
+    summary = pd.DataFrame(result, index=pd.Index(students, name='id_student'))
+    record_checkpoint(checkpoints, 'student summary', summary)
+    return summary
+
+
+# Feature build entry point (notebook cells 1-17, app.py, app_english_learning.py)
+#
+# build_features runs the whole notebook pipeline on the OULAD tables and
+# returns the model input columns in a fixed order and dtype. The apps use
+# build_student_features, which runs the same code on one student's records,
+# so training and serving compute the features the same way.
+FINISHED_STATUSES = {'Pass', 'Fail', 'Distinction'}
+
+EDUCATION_MAPPING = {
+    'No Formal quals': 'Lower Than A Level',
+    'Post Graduate Qualification': 'HE Qualification',
+}
+
+AGE_BAND_MAPPING = {
+    '55<=': '35+',
+    '35-55': '35+',
+}
+
+# Per-student aggregation of the join plan (see summarise_join_plan)
+SUMMARY_COLUMNS = {
+    # Course Information (use mode - may vary if student takes multiple courses)
+    'code_module': 'mode',
+    'code_presentation': 'mode',
+
+    # Activity Metrics (aggregate across all activities)
+    'activity_type': 'mode',                       # Most common activity type
+    'sum': 'sum',                                  # Total clicks/interactions
+    'count': 'sum',                                # Total number of activities
+    'activity_diversity': 'mean',                  # Average diversity score
+
+    # Assessment Metrics
+    'id_assessment': 'first',                      # Just keep first (not meaningful to average IDs)
+    'assessment_type': 'mode',                     # Most common assessment type
+    'date': 'mean',                                # Average date
+    'weight': 'mean',                              # Average assessment weight
+    'date_submitted': 'mean',                      # Average submission date
+    'is_banked': 'mean',                           # Proportion of banked assessments
+    'score': 'mean',                               # Average score
+    'score_per_weight': 'mean',                    # Average score per weight
+    'cumulative_score': 'mean',                    # Average cumulative score
+    'assessment_engagement_score': 'mean',         # Average engagement
+    'submission_timeliness': 'mean',               # Average timeliness
+    'banked_assessment_ratio': 'mean',             # Average banking ratio
+
+    # Student Demographics (use first - these should be constant per student)
+    'date_registration': 'first',                  # Registration date (constant)
+    'gender': 'first',                             # Gender (constant)
+    'region': 'first',                             # Region (constant)
+    'highest_education': 'first',                  # Education (constant)
+    'imd_band': 'first',                           # Deprivation index (constant)
+    'age_band': 'first',                           # Age band (constant)
+    'num_of_prev_attempts': 'first',               # Previous attempts (constant)
+    'studied_credits': 'first',                    # Credits studied (constant)
+    'disability': 'first',                         # Disability status (constant)
+    'repeat_student': 'first',                     # Repeat indicator (constant)
+
+    # Student Outcomes (use first/mode - should be constant per student)
+    'final_result': 'first',                       # Final result
+    'study_status': 'first',                       # Study status
+    'withdrawal_status': 'first',                  # Withdrawal status
+
+    # Module Information
+    'module_presentation_length': 'first',         # Module length (constant)
+
+    # Engagement Metrics (average across time)
+    'module_engagement_rate': 'mean',              # Average engagement rate
+    'weighted_engagement': 'mean',                 # Average weighted engagement
+    'days_since_registration': 'mean',             # Average days since registration
+    'performance_by_registration': 'mean',         # Average performance metric
+    'engagement_cv': 'mean',                       # Engagement coefficient of variation
+    'engagement_trend': 'mean',                    # Engagement trend
+    'learning_pace': 'mean',                       # Average learning pace
+
+    # Score Trends (average across time)
+    'score_trend': 'mean',                         # Average score trend
+    'score_momentum': 'mean',                      # Average score momentum
+
+    # Study Method
+    'study_method_preference': 'mode',             # Most common study method
+}
+
+# Model inputs, in the order the PowerTransformer / OneHotEncoder were fitted on
+# (feature_names.json is these numerical columns followed by the one-hot columns)
+NUMERICAL_FEATURES = [
+    'num_of_prev_attempts',
+    'repeat_student',
+    'studied_credits',
+    'sum',
+    'count',
+    'activity_diversity',
+    'score',
+    'score_per_weight',
+    'assessment_engagement_score',
+    'module_engagement_rate',
+    'weighted_engagement',
+    'engagement_trend',
+    'submission_timeliness',
+    'banked_assessment_ratio',
+    'days_since_registration',
+    'score_trend',
+    'score_momentum',
+    'performance_by_registration',
+    'learning_pace',
+    'engagement_cv',
+]
+
+CATEGORICAL_FEATURES = [
+    'gender',
+    'region',
+    'highest_education',
+    'imd_band',
+    'age_band',
+    'disability',
+    'activity_type',
+    'study_method_preference',
+]
+
+FEATURE_COLUMNS = NUMERICAL_FEATURES + CATEGORICAL_FEATURES
+
+TARGET_COLUMN = 'final_result'
+
+# Student-presentation columns build_student_features takes from its ``student`` dict
+STUDENT_COLUMNS = [
+    'date_registration', 'gender', 'region', 'highest_education', 'imd_band', 'age_band',
+    'num_of_prev_attempts', 'studied_credits', 'disability', 'final_result',
+    'study_status', 'withdrawal_status', 'module_presentation_length',
+]
+
+_INTEGER_FEATURES = {'num_of_prev_attempts', 'repeat_student', 'studied_credits', 'sum', 'count'}
+
+FEATURE_DTYPES = {
+    **{col: ('int64' if col in _INTEGER_FEATURES else 'float64') for col in NUMERICAL_FEATURES},
+    **{col: 'object' for col in CATEGORICAL_FEATURES},
+}
+
+
+def categorize_withdrawal(date_unregistration):
+    """
+    Withdrawal bucket for each unregistration date (notebook cell 4), vectorised.
+
+    Missing date -> "didn't withdraw", < 5 -> early, < 30 -> normal, otherwise late.
+    """
+    date = pd.to_numeric(pd.Series(date_unregistration), errors='coerce').to_numpy(dtype=np.float64)
+    return np.select(
+        [np.isnan(date), date < 5, date < 30],
+        ["didn't withdraw", 'early withdrawal', 'normal withdrawal'],
+        default='late withdrawal',
+    ).astype(object)
+
+
+def prepare_student_frame(tables):
+    """
+    One row per student-presentation with the registration, student and course columns (notebook cells 1, 3, 4).
+
+    study_status and withdrawal_status are added and date_unregistration dropped.
+    """
+    student_data = tables['studentRegistration'].merge(tables['studentInfo'], on=PRESENTATION_KEYS, how='inner')
+    student_data = student_data.merge(tables['courses'], on=['code_module', 'code_presentation'], how='inner')
+
+    student_data['study_status'] = np.where(student_data['final_result'].isin(FINISHED_STATUSES), 'finished', 'unfinished')
+    student_data['withdrawal_status'] = categorize_withdrawal(student_data['date_unregistration'])
+    return student_data.drop(columns=['date_unregistration'])
+
+
+def prepare_assessment_frame(tables):
+    """
+    Student x assessment frame with the student and course columns attached (notebook cells 1-5).
+
+    Parameters:
+    -----------
+    tables : dict
+        OULAD tables by name, as returned by data_cache.load_oulad_tables
+        (studentRegistration, studentInfo, courses, assessments, studentAssessment)
+
+    Returns:
+    --------
+    DataFrame with one row per submitted assessment, study_status and
+    withdrawal_status added, imd_band filled by region and incomplete rows dropped
+    """
+    student_data = prepare_student_frame(tables)
+
+    student_assessment_data = tables['assessments'].merge(tables['studentAssessment'], on=['id_assessment'], how='inner')
+    student_assessment_data['score'] = student_assessment_data['score'].fillna(0)
+    student_assessment_data = student_assessment_data.dropna()
+
+    df = student_assessment_data.merge(student_data, on=['code_module', 'code_presentation', 'id_student'], how='inner')
+    df['imd_band'] = fill_with_group_mode(df, 'imd_band', by='region')
+    return df.dropna()
+
+
+def aggregate_student_vle(student_vle, vle):
+    """
+    Clicks per student x presentation x activity_type from an in-memory studentVle table (notebook cell 7).
+
+    Same output as aggregate_student_vle_streaming, for callers that already hold the table.
+    """
+    student_interaction = student_vle.merge(vle, on=['code_module', 'code_presentation', 'id_site'], how='left')
+    return (
+        student_interaction
+        .groupby(PRESENTATION_KEYS + ['activity_type'], observed=True)['sum_click']
+        .agg(['sum', 'count'])
+        .reset_index()
+    )
+
+
+def engineer_features(grouped_student_interaction, df, checkpoints=None, memory_budget=False):
+    """
+    Per-student summary from the click aggregate and the assessment frame (notebook cells 8-16).
+
+    Parameters:
+    -----------
+    grouped_student_interaction : DataFrame
+        Clicks per student x presentation x activity_type ('sum', 'count')
+    df : DataFrame
+        Student x assessment frame (see prepare_assessment_frame)
+    checkpoints : list, optional
+        Receives row/memory checkpoints (see record_checkpoint)
+    memory_budget : bool
+        Keep every intermediate frame in compact dtypes (see compact_frame);
+        derived features are stored as float32
+
+    Returns:
+    --------
+    DataFrame indexed by id_student with the SUMMARY_COLUMNS columns
+    """
+    interaction_side, assessment_side, student_presentations = build_join_plan(
+        grouped_student_interaction, df, checkpoints=checkpoints
+    )
+    for col, mapping in (('highest_education', EDUCATION_MAPPING), ('age_band', AGE_BAND_MAPPING)):
+        student_presentations[col] = student_presentations[col].astype(object).replace(mapping)
+
+    interaction_side = add_interaction_features(interaction_side)
+    assessment_side = add_assessment_features(assessment_side)
+    student_presentations = add_presentation_features(student_presentations, interaction_side, assessment_side)
+    if memory_budget:
+        interaction_side = compact_frame(interaction_side, lossy_float32=True)
+        assessment_side = compact_frame(assessment_side, lossy_float32=True)
+        student_presentations = compact_frame(student_presentations, lossy_float32=True)
+    record_checkpoint(checkpoints, 'interaction features', interaction_side)
+    record_checkpoint(checkpoints, 'assessment features', assessment_side)
+
+    activity_type_counts = student_activity_counts(interaction_side)
+    study_method = classify_study_method(activity_type_counts)
+    student_presentations['study_method_preference'] = (
+        student_presentations['id_student'].map(study_method).astype(object)
+    )
+
+    summary = summarise_join_plan(SUMMARY_COLUMNS, student_presentations, assessment_side, interaction_side)
+    if memory_budget:
+        summary = compact_frame(summary, lossy_float32=True)
+    record_checkpoint(checkpoints, 'student summary', summary)
+    return summary
+
+
+def conform_features(frame, with_target=False):
+    """
+    Select FEATURE_COLUMNS (plus TARGET_COLUMN if requested) in their fixed order and dtypes.
+
+    Raises:
+    -------
+    ValueError
+        If a feature column is missing
+    """
+    columns = FEATURE_COLUMNS + ([TARGET_COLUMN] if with_target else [])
+    missing = [col for col in columns if col not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing feature columns: {missing}")
+
+    features = frame[columns].copy()
+    for col in CATEGORICAL_FEATURES + ([TARGET_COLUMN] if with_target else []):
+        values = features[col].astype(object)
+        features[col] = values.where(values.notna(), None)
+    features.index = features.index.astype('int64')
+    return features.astype({col: FEATURE_DTYPES.get(col, 'object') for col in columns})
+
+
+def build_features(tables, grouped_student_interaction=None, students=None, with_target=False, checkpoints=None,
+                   memory_budget=False):
+    """
+    Model input features for every student (batch mode) or a subset of students.
+
+    Parameters:
+    -----------
+    tables : dict
+        OULAD tables by name, as returned by data_cache.load_oulad_tables.
+        'studentVle' is only needed when grouped_student_interaction is not given
+    grouped_student_interaction : DataFrame, optional
+        Pre-aggregated clicks (e.g. from aggregate_student_vle_streaming)
+    students : array-like, optional
+        Only build features for these id_student values
+    with_target : bool
+        Append the final_result column (training)
+    checkpoints : list, optional
+        Receives row/memory checkpoints (see record_checkpoint)
+    memory_budget : bool
+        Run in memory-budget mode: every frame in compact dtypes (see
+        compact_frame) and the features returned as float32 / int16-32 /
+        category instead of FEATURE_DTYPES
+
+    Returns:
+    --------
+    DataFrame indexed by id_student with FEATURE_COLUMNS in order (see FEATURE_DTYPES)
+    """
+    df = prepare_assessment_frame(tables)
+    if memory_budget:
+        df = compact_frame(df)
+    record_checkpoint(checkpoints, 'assessment frame', df)
+
+    if grouped_student_interaction is None:
+        student_vle = tables['studentVle']
+        if students is not None:
+            student_vle = student_vle[student_vle['id_student'].isin(students)]
+        grouped_student_interaction = aggregate_student_vle(student_vle, tables['vle'])
+    if memory_budget:
+        grouped_student_interaction = compact_frame(grouped_student_interaction)
+    record_checkpoint(checkpoints, 'click aggregate', grouped_student_interaction)
+
+    if students is not None:
+        df = df[df['id_student'].isin(students)]
+        grouped_student_interaction = grouped_student_interaction[
+            grouped_student_interaction['id_student'].isin(students)
+        ]
+
+    summary = engineer_features(grouped_student_interaction, df, checkpoints=checkpoints, memory_budget=memory_budget)
+    features = conform_features(summary, with_target=with_target)
+    if memory_budget:
+        features = compact_frame(features, lossy_float32=True)
+    record_checkpoint(checkpoints, 'features', features)
+    return features
+
+
+def build_student_features(student, activity, assessments, with_target=False):
+    """
+    Model input features for a single student from their own records (single-row mode for the apps).
+
+    Runs exactly the same feature code as build_features, on one
+    student-presentation.
+
+    Parameters:
+    -----------
+    student : dict
+        Demographic and course columns: gender, region, highest_education,
+        imd_band, age_band, disability, num_of_prev_attempts, studied_credits,
+        date_registration, module_presentation_length (final_result optional)
+    activity : DataFrame or list of dict
+        Clicks per activity type: activity_type, sum, count
+    assessments : DataFrame or list of dict
+        Submitted assessments: assessment_type, date, weight, date_submitted, is_banked, score
+
+    Returns:
+    --------
+    One-row DataFrame with FEATURE_COLUMNS in order (see FEATURE_DTYPES)
+    """
+    keys = {'id_student': student.get('id_student', 0), 'code_module': 'APP', 'code_presentation': 'APP'}
+    student_columns = {col: student.get(col) for col in STUDENT_COLUMNS}
+
+    grouped_student_interaction = pd.DataFrame(activity, columns=['activity_type', 'sum', 'count']).assign(**keys)
+    df = pd.DataFrame(assessments, columns=ASSESSMENT_COLUMNS).assign(**keys, **student_columns)
+    df['id_assessment'] = df['id_assessment'].fillna(pd.Series(np.arange(len(df)), index=df.index))
+
+    summary = engineer_features(grouped_student_interaction, df)
+    return conform_features(summary, with_target=with_target)
+
+
+# Check against the notebook's original row-level code
+#
+# group_slope / group_cv / group_momentum replaced per-student np.polyfit and
+# lambda transforms, and the join plan replaced the row join they ran on.
+# check_against_row_join recomputes both with the original cell 8 / 14 code
+# on a fixed frame, so a change that alters these values is caught.
+def check_frames(n_students=40, seed=0):
+    """
+    Fixed click aggregate and assessment frame for check_against_row_join.
+
+    Students take 1-3 presentations with 1-6 activity rows and 1-8
+    assessments each; assessment dates are coarse (ties within and across
+    presentations) and the assessment rows are shuffled.
+    """
+    rng = np.random.default_rng(seed)
+    presentations = [('AAA', '2013J'), ('BBB', '2013J'), ('BBB', '2014B'), ('CCC', '2014J')]
+    activity_types = ALL_ACTIVITY_TYPES[:6]
+    clicks, assessments = [], []
+    for id_student in range(1, n_students + 1):
+        for index in np.sort(rng.choice(len(presentations), rng.integers(1, 4), replace=False)):
+            module, presentation = presentations[index]
+            keys = {'id_student': id_student, 'code_module': module, 'code_presentation': presentation}
+            for activity_type in sorted(rng.choice(activity_types, rng.integers(1, 7), replace=False)):
+                clicks.append({**keys, 'activity_type': activity_type,
+                               'sum': int(rng.integers(1, 500)), 'count': int(rng.integers(1, 50))})
+            for _ in range(rng.integers(1, 9)):
+                date = float(rng.choice([20, 50, 50, 100, 150, 200]))
+                assessments.append({
+                    **keys, 'id_assessment': len(assessments), 'assessment_type': 'TMA', 'date': date,
+                    'weight': float(rng.choice([0, 10, 20])), 'date_submitted': date + rng.integers(-10, 10),
+                    'is_banked': int(rng.random() < 0.1), 'score': float(rng.integers(0, 101)),
+                    'date_registration': -50.0, 'module_presentation_length': 260, 'num_of_prev_attempts': 0,
+                })
+    df = pd.DataFrame(assessments).sample(frac=1, random_state=seed).reset_index(drop=True)
+    return pd.DataFrame(clicks), df
+
+
+def check_against_row_join(grouped_student_interaction=None, df=None, rtol=1e-9, atol=1e-9):
+    """
+    Compare the vectorised reductions and the join plan with the original row-level code.
+
+    The reference is notebook cells 8 and 14 as they were: the row join of
+    both sides, sorted by (id_student, date), with np.polyfit / lambda
+    transforms. Checked:
+
+    - group_cv, group_slope and group_momentum on the sorted row join,
+      row by row, against the transforms they replaced
+    - the join plan (build_join_plan, add_*_features, summarise_join_plan)
+      against the per-student means of the row join for engagement_cv and
+      the order-dependent features
+
+    Parameters:
+    -----------
+    grouped_student_interaction, df : DataFrame, optional
+        Click aggregate and assessment frame (default: check_frames())
+    rtol, atol : float
+        Tolerances of the comparison
+
+    Returns:
+    --------
+    DataFrame with one row per mismatching check and column (empty = all match)
+    """
+    if grouped_student_interaction is None or df is None:
+        grouped_student_interaction, df = check_frames()
+
+    merged = grouped_student_interaction.merge(df, on=PRESENTATION_KEYS, how='inner')
+    merged = merged.sort_values(['id_student', 'date'])
+    by = merged.groupby('id_student')
+    reference = pd.DataFrame({
+        'cumulative_score': by['score'].cumsum(),
+        'engagement_cv': by['sum'].transform(lambda x: np.std(x) / np.mean(x) if np.mean(x) > 0 else 0),
+        'engagement_trend': by['sum'].transform(lambda x: np.polyfit(range(len(x)), x, 1)[0] if len(x) > 1 else 0),
+        'score_trend': by['score'].transform(lambda x: np.polyfit(range(len(x)), x, 1)[0] if len(x) > 1 else 0),
+        'score_momentum': by['score'].transform(lambda x: x.tail(3).mean() - x.head(3).mean() if len(x) >= 6 else 0),
+        'learning_pace': by['date_submitted'].diff().fillna(0),
+    })
+    vectorised = pd.DataFrame({
+        'engagement_cv': group_cv(merged['id_student'], merged['sum']),
+        'engagement_trend': group_slope(merged['id_student'], merged['sum']),
+        'score_trend': group_slope(merged['id_student'], merged['score']),
+        'score_momentum': group_momentum(merged['id_student'], merged['score']),
+    }, index=merged.index)
+
+    interaction_side, assessment_side, student_presentations = build_join_plan(grouped_student_interaction, df)
+    interaction_side = add_interaction_features(interaction_side)
+    assessment_side = add_assessment_features(assessment_side)
+    student_presentations = add_presentation_features(student_presentations, interaction_side, assessment_side)
+    plan = summarise_join_plan(dict.fromkeys(reference.columns, 'mean'),
+                               student_presentations, assessment_side, interaction_side)
+    expected = reference.groupby(merged['id_student']).mean()
+
+    problems = []
+    for check, actual, wanted in (('group reductions', vectorised, reference[vectorised.columns]),
+                                  ('join plan', plan, expected)):
+        if not actual.index.equals(wanted.index):
+            problems.append({'check': check, 'column': 'index', 'mismatches': len(actual.index.symmetric_difference(wanted.index)),
+                             'max_abs_diff': np.nan})
+            continue
+        for col in wanted.columns:
+            x, y = wanted[col].to_numpy(dtype=np.float64), actual[col].to_numpy(dtype=np.float64)
+            equal = np.isclose(y, x, rtol=rtol, atol=atol, equal_nan=True)
+            if not equal.all():
+                problems.append({'check': check, 'column': col, 'mismatches': int((~equal).sum()),
+                                 'max_abs_diff': float(np.nanmax(np.abs(x - y)[~equal]))})
+
+    report = pd.DataFrame(problems, columns=['check', 'column', 'mismatches', 'max_abs_diff'])
+    if report.empty:
+        print(f"✅ Vectorised reductions and join plan match the row-level code ({len(merged):,} joined rows)")
+    else:
+        print(f"❌ {len(report)} columns differ from the row-level code")
+        print(report.to_string(index=False))
+    return report
+
+
+if __name__ == '__main__':
+    raise SystemExit(0 if check_against_row_join().empty else 1)
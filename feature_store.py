@@ -0,0 +1,501 @@
+"""
+Incremental per-student feature store for refreshing risk scores during a presentation.
+
+build_features recomputes every feature from the full click and assessment
+history. FeatureStore keeps sufficient statistics per student-presentation
+(id_student, code_module, code_presentation) instead, so a batch of new
+studentVle / studentAssessment rows only touches the students in the batch:
+
+- running click sums and counts per activity type
+- Welford mean / M2 of the per-activity-type click totals (engagement_cv)
+- each student's assessments in the order the row join visited them, from
+  which the order-dependent features (engagement_trend, score_trend,
+  score_momentum, learning_pace) are recomputed for the touched students
+- per-presentation sums of the assessment-level features
+
+Features are assembled from these statistics with the same weights as
+feature_engineering.summarise_join_plan, so they equal a full build_features
+run; verify_against_rebuild checks exactly that.
+
+Usage:
+    from data_cache import load_oulad_tables
+    from feature_store import FeatureStore
+
+    store = FeatureStore.from_tables(load_oulad_tables())
+    store.save('feature_store.pkl')
+
+    # Every refresh
+    store = FeatureStore.load('feature_store.pkl')
+    updated = store.apply_delta(student_vle=new_clicks, student_assessment=new_submissions)
+    store.save('feature_store.pkl')
+"""
+
+import pickle
+from bisect import insort
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering import (
+    AGE_BAND_MAPPING,
+    EDUCATION_MAPPING,
+    FEATURE_COLUMNS,
+    MOMENTUM_MIN_SIZE,
+    MOMENTUM_WINDOW,
+    PRESENTATION_KEYS,
+    TARGET_COLUMN,
+    build_features,
+    classify_study_method,
+    conform_features,
+    prepare_student_frame,
+)
+
+# Assessment-row features averaged into the student summary
+ASSESSMENT_MEANS = [
+    'score',
+    'score_per_weight',
+    'submission_timeliness',
+    'banked_assessment_ratio',
+    'days_since_registration',
+    'performance_by_registration',
+]
+
+_STUDENT_COLUMNS = [
+    'gender', 'region', 'highest_education', 'imd_band', 'age_band', 'disability',
+    'num_of_prev_attempts', 'studied_credits', 'date_registration',
+    'module_presentation_length', 'final_result',
+]
+
+
+def _divide(numerator, denominator):
+    """numerator / denominator with pandas semantics (x / 0 -> +-inf, 0 / 0 -> nan)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.float64(numerator) / np.float64(denominator))
+
+
+def _mode(counts):
+    """Key with the highest count, ties -> smallest key (like group_mode)."""
+    return min(counts.items(), key=lambda item: (-item[1], item[0]))[0] if counts else None
+
+
+def _welford_add(state, x):
+    n, mean, m2 = state
+    n += 1
+    delta = x - mean
+    mean += delta / n
+    return [n, mean, m2 + delta * (x - mean)]
+
+
+def _welford_remove(state, x):
+    n, mean, m2 = state
+    if n <= 1:
+        return [0, 0.0, 0.0]
+    previous_mean = (n * mean - x) / (n - 1)
+    return [n - 1, previous_mean, m2 - (x - previous_mean) * (x - mean)]
+
+
+class _Presentation:
+    """Sufficient statistics of one student-presentation."""
+
+    def __init__(self):
+        # Click side: activity_type -> [clicks, click-log rows]
+        self.activity = {}
+        self.clicks = 0
+        self.rows = 0
+        self.click_rows = 0  # sum over activity types of clicks * rows
+        self.welford = [0, 0.0, 0.0]  # n, mean, M2 of the per-type click totals
+
+        # Assessment side
+        self.n_assessments = 0
+        self.sums = dict.fromkeys(ASSESSMENT_MEANS, 0.0)
+        self.valid = dict.fromkeys(ASSESSMENT_MEANS, 0)
+        self.weight = 0.0
+        self.first_date = None  # earliest assessment date
+
+
+class _Student:
+    """Presentations and assessments of one student."""
+
+    def __init__(self):
+        self.presentations = set()
+        # (date, code_module, code_presentation, rank, arrival, score, date_submitted, presentation key):
+        # sorted, this is the order the row join visited the student's assessments in
+        self.assessments = []
+
+
+class FeatureStore:
+    """
+    Per-student features kept up to date from click / assessment deltas.
+
+    Registration, student, course, assessment and VLE metadata are static
+    context; build a new store when they change.
+
+    Parameters:
+    -----------
+    tables : dict
+        OULAD tables by name (studentRegistration, studentInfo, courses,
+        assessments, vle); the click and submission logs come in through
+        apply_delta
+    """
+
+    def __init__(self, tables):
+        student_data = prepare_student_frame(tables)
+        self.info = {
+            (int(row.id_student), str(row.code_module), str(row.code_presentation)): {
+                col: (None if pd.isna(getattr(row, col)) else getattr(row, col)) for col in _STUDENT_COLUMNS
+            }
+            for row in student_data.itertuples(index=False)
+        }
+        self.missing_imd = {}
+        for key, info in self.info.items():
+            if info['imd_band'] is None:
+                self.missing_imd.setdefault(info['region'], set()).add(key[0])
+
+        assessments = tables['assessments'].copy()
+        assessments['rank'] = np.arange(len(assessments))
+        self.assessment_info = assessments[
+            ['id_assessment', 'code_module', 'code_presentation', 'assessment_type', 'date', 'weight', 'rank']
+        ]
+        self.site_activity = tables['vle'][['code_module', 'code_presentation', 'id_site', 'activity_type']]
+
+        self.presentations = {}
+        self.students = {}
+        self.region_imd = {}
+        self.features = {}
+        self._arrivals = 0
+
+    @classmethod
+    def from_tables(cls, tables):
+        """Store built from the full history in ``tables`` (including studentVle and studentAssessment)."""
+        store = cls(tables)
+        store.apply_delta(student_vle=tables['studentVle'], student_assessment=tables['studentAssessment'])
+        return store
+
+    # ------------------------------------------------------------------
+    # Deltas
+    # ------------------------------------------------------------------
+
+    def apply_delta(self, student_vle=None, student_assessment=None):
+        """
+        Fold new click-log and submission rows into the store.
+
+        Work is proportional to the delta: only students with new rows (and,
+        when a region's most common imd_band changes, the students whose
+        missing imd_band is filled from it) are recomputed.
+
+        Parameters:
+        -----------
+        student_vle : DataFrame, optional
+            New studentVle rows (code_module, code_presentation, id_student, id_site, date, sum_click)
+        student_assessment : DataFrame, optional
+            New studentAssessment rows (id_assessment, id_student, date_submitted, is_banked, score)
+
+        Returns:
+        --------
+        DataFrame of the refreshed students' features (see feature_engineering.conform_features)
+        """
+        regions_before = {region: _mode(counts) for region, counts in self.region_imd.items()}
+        touched = set()
+        if student_vle is not None and len(student_vle):
+            touched |= self._add_clicks(student_vle)
+        if student_assessment is not None and len(student_assessment):
+            touched |= self._add_assessments(student_assessment)
+
+        for region, counts in self.region_imd.items():
+            if _mode(counts) != regions_before.get(region):
+                touched |= self.missing_imd.get(region, set())
+        return self._refresh(touched)
+
+    def _add_clicks(self, student_vle):
+        merged = student_vle.merge(self.site_activity, on=['code_module', 'code_presentation', 'id_site'], how='left')
+        grouped = (
+            merged.groupby(PRESENTATION_KEYS + ['activity_type'], observed=True)['sum_click']
+            .agg(['sum', 'count'])
+            .reset_index()
+        )
+
+        touched = set()
+        for id_student, module, presentation, activity_type, clicks, rows in grouped.itertuples(index=False):
+            key = (int(id_student), str(module), str(presentation))
+            activity_type = str(activity_type)
+            p = self._presentation(key)
+            old_clicks, old_rows = p.activity.get(activity_type, (0, 0))
+            new_clicks, new_rows = old_clicks + int(clicks), old_rows + int(rows)
+            if activity_type in p.activity:
+                p.welford = _welford_remove(p.welford, old_clicks)
+            p.welford = _welford_add(p.welford, new_clicks)
+            p.activity[activity_type] = (new_clicks, new_rows)
+            p.clicks += int(clicks)
+            p.rows += int(rows)
+            p.click_rows += new_clicks * new_rows - old_clicks * old_rows
+            touched.add(key[0])
+        return touched
+
+    def _add_assessments(self, student_assessment):
+        rows = self.assessment_info.merge(student_assessment, on='id_assessment', how='inner')
+        rows['score'] = rows['score'].fillna(0)
+        rows = rows.dropna()
+
+        touched = set()
+        for row in rows.itertuples(index=False):
+            key = (int(row.id_student), str(row.code_module), str(row.code_presentation))
+            info = self.info.get(key)
+            if info is None:
+                continue
+            p = self._presentation(key)
+            student = self.students[key[0]]
+
+            days = row.date - info['date_registration'] if info['date_registration'] is not None else np.nan
+            values = {
+                'score': row.score,
+                'score_per_weight': _divide(row.score, row.weight + 1),
+                'submission_timeliness': row.date_submitted - row.date,
+                'banked_assessment_ratio': row.is_banked,
+                'days_since_registration': days,
+                'performance_by_registration': _divide(row.score, days + 1),
+            }
+            for col, value in values.items():
+                if not np.isnan(value):
+                    p.sums[col] += value
+                    p.valid[col] += 1
+            p.n_assessments += 1
+            p.weight += row.weight
+            p.first_date = row.date if p.first_date is None else min(p.first_date, row.date)
+            if info['imd_band'] is not None:
+                self.region_imd.setdefault(info['region'], Counter())[info['imd_band']] += 1
+
+            self._arrivals += 1
+            insort(student.assessments, (row.date, key[1], key[2], row.rank, self._arrivals,
+                                         float(row.score), float(row.date_submitted), key))
+            touched.add(key[0])
+        return touched
+
+    def _presentation(self, key):
+        if key not in self.presentations:
+            self.presentations[key] = _Presentation()
+            self.students.setdefault(key[0], _Student()).presentations.add(key)
+        return self.presentations[key]
+
+    # ------------------------------------------------------------------
+    # Order-dependent features (engagement_trend, score_trend, score_momentum, learning_pace)
+    # ------------------------------------------------------------------
+
+    def _sequence_features(self, student, included):
+        """
+        The order-dependent features over the student's row-join rows, from segment totals.
+
+        Same closed form as feature_engineering.sequence_features: one segment
+        per (date, presentation), the presentation's k click rows in turn,
+        each paired with the segment's assessments.
+        """
+        segments = []
+        for assessment in student.assessments:
+            key = assessment[7]
+            if key not in included:
+                continue
+            if segments and segments[-1][0] == (assessment[0], key):
+                segments[-1][1].append(assessment)
+            else:
+                segments.append(((assessment[0], key), [assessment]))
+
+        click_moments = {}
+        for key in included:
+            clicks = [clicks for _, (clicks, _) in sorted(self.presentations[key].activity.items())]
+            click_moments[key] = (len(clicks), float(sum(clicks)), float(sum(x * y for x, y in enumerate(clicks))))
+
+        n = sum(click_moments[key][0] * len(rows) for (_, key), rows in segments)
+        mean_x = (n - 1) / 2.0
+        offset, score_sxy, click_sxy = 0, 0.0, 0.0
+        for (_, key), rows in segments:
+            k, click_total, click_moment = click_moments[key]
+            c = len(rows)
+            scores = [row[5] for row in rows]
+            score_total = sum(scores)
+            centred = offset - mean_x
+            score_sxy += k * (centred * score_total + c * score_total * (k - 1) / 2.0
+                              + sum(j * y for j, y in enumerate(scores)))
+            click_sxy += click_total * (c * centred + c * (c - 1) / 2.0) + c * c * click_moment
+            offset += k * c
+
+        def score_at(x):
+            for (_, key), rows in segments:
+                length = click_moments[key][0] * len(rows)
+                if x < length:
+                    return rows[x % len(rows)][5]
+                x -= length
+
+        sxx = n * (n * n - 1) / 12.0
+        window = range(MOMENTUM_WINDOW)
+        return {
+            'engagement_trend': click_sxy / sxx if n > 1 else 0.0,
+            'score_trend': score_sxy / sxx if n > 1 else 0.0,
+            'score_momentum': (
+                np.mean([score_at(n - MOMENTUM_WINDOW + i) for i in window]) - np.mean([score_at(i) for i in window])
+                if n >= MOMENTUM_MIN_SIZE else 0.0
+            ),
+            # the diffs of date_submitted over the rows telescope to last - first
+            'learning_pace': (segments[-1][1][-1][6] - segments[0][1][0][6]) / n,
+        }
+
+    # ------------------------------------------------------------------
+    # Feature assembly
+    # ------------------------------------------------------------------
+
+    def _imd_band(self, info):
+        return info['imd_band'] if info['imd_band'] is not None else _mode(self.region_imd.get(info['region'], {}))
+
+    def _included(self, key):
+        """Whether the presentation survives the notebook's filters and the click/assessment semi-join."""
+        info = self.info.get(key)
+        p = self.presentations[key]
+        return (
+            info is not None and p.rows > 0 and p.n_assessments > 0
+            and info['date_registration'] is not None and self._imd_band(info) is not None
+        )
+
+    def _student_row(self, id_student):
+        student = self.students[id_student]
+        included = frozenset(key for key in student.presentations if self._included(key))
+        if not included:
+            return None, None
+
+        keys = sorted(included, key=lambda key: key[1:])
+        ps = [self.presentations[key] for key in keys]
+        k = np.array([len(p.activity) for p in ps], dtype=np.float64)
+        m = np.array([p.n_assessments for p in ps], dtype=np.float64)
+        pairs = float((k * m).sum())
+
+        # Click side, each activity row counted once per assessment of its presentation
+        activity_counts = Counter()
+        for p, weight in zip(ps, m):
+            for activity_type in p.activity:
+                activity_counts[activity_type] += weight
+
+        # Welford moments merged across presentations (Chan et al.), weights m
+        mean = sum(w * p.welford[0] * p.welford[1] for p, w in zip(ps, m)) / pairs
+        m2 = sum(w * (p.welford[2] + p.welford[0] * (p.welford[1] - mean) ** 2) for p, w in zip(ps, m))
+        std = np.sqrt(max(m2, 0.0) / pairs)
+
+        first = self.info[min(keys, key=lambda key: (self.presentations[key].first_date, key[1:]))]
+        row = {
+            'id_student': id_student,
+            'num_of_prev_attempts': first['num_of_prev_attempts'],
+            'repeat_student': int(first['num_of_prev_attempts'] > 0),
+            'studied_credits': first['studied_credits'],
+            'sum': int(sum(w * p.clicks for p, w in zip(ps, m))),
+            'count': int(sum(w * p.rows for p, w in zip(ps, m))),
+            'activity_diversity': float(len(activity_counts)),
+            'assessment_engagement_score': sum(w * p.click_rows for p, w in zip(ps, m)) / pairs,
+            'module_engagement_rate': sum(
+                w * p.clicks / self.info[key]['module_presentation_length'] for key, p, w in zip(keys, ps, m)
+            ) / pairs,
+            'weighted_engagement': sum(p.click_rows * p.weight for p in ps) / pairs,
+            'engagement_cv': std / mean if mean > 0 else 0.0,
+            **self._sequence_features(student, included),
+            'gender': first['gender'],
+            'region': first['region'],
+            'highest_education': EDUCATION_MAPPING.get(first['highest_education'], first['highest_education']),
+            'imd_band': self._imd_band(first),
+            'age_band': AGE_BAND_MAPPING.get(first['age_band'], first['age_band']),
+            'disability': first['disability'],
+            'activity_type': _mode(activity_counts),
+            TARGET_COLUMN: first['final_result'],
+        }
+        for col in ASSESSMENT_MEANS:
+            total = sum(w * p.valid[col] for p, w in zip(ps, k))
+            row[col] = sum(w * p.sums[col] for p, w in zip(ps, k)) / total if total else np.nan
+        return row, activity_counts
+
+    def _refresh(self, students):
+        rows, counts = [], []
+        for id_student in sorted(students & self.students.keys()):
+            row, activity_counts = self._student_row(id_student)
+            if row is None:
+                self.features.pop(id_student, None)
+                continue
+            rows.append(row)
+            counts.append(activity_counts)
+        if not rows:
+            return conform_features(pd.DataFrame(columns=['id_student'] + FEATURE_COLUMNS).set_index('id_student'))
+
+        ids = [row['id_student'] for row in rows]
+        methods = classify_study_method(pd.DataFrame(counts, index=ids).fillna(0))
+        for row, method in zip(rows, methods):
+            row['study_method_preference'] = method
+            self.features[row['id_student']] = row
+        return self._frame(rows)
+
+    @staticmethod
+    def _frame(rows, with_target=False):
+        frame = pd.DataFrame(rows).set_index('id_student').sort_index()
+        return conform_features(frame, with_target=with_target)
+
+    def snapshot(self, with_target=False):
+        """Features of every student in the store (same layout as build_features)."""
+        return self._frame([self.features[id_student] for id_student in sorted(self.features)], with_target)
+
+    # ------------------------------------------------------------------
+    # Persistence and verification
+    # ------------------------------------------------------------------
+
+    def save(self, path):
+        """Pickle the store to ``path``."""
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f"✅ Feature store saved: {path} ({len(self.features):,} students)")
+
+    @staticmethod
+    def load(path):
+        """Load a store written by save."""
+        with open(Path(path), 'rb') as f:
+            return pickle.load(f)
+
+    def verify_against_rebuild(self, tables, grouped_student_interaction=None, rtol=1e-9, atol=1e-9):
+        """
+        Compare the store with a full build_features run over ``tables``.
+
+        ``tables`` must hold the same history the store has seen (base tables
+        plus every applied delta).
+
+        Returns:
+        --------
+        DataFrame with the number of mismatching students per column (empty report = equivalent)
+        """
+        expected = build_features(tables, grouped_student_interaction=grouped_student_interaction, with_target=True)
+        report = compare_features(expected, self.snapshot(with_target=True), rtol=rtol, atol=atol)
+        if report.empty:
+            print(f"✅ Feature store matches a full rebuild ({len(expected):,} students)")
+        else:
+            print(f"❌ Feature store differs from a full rebuild in {len(report)} columns")
+        return report
+
+
+def compare_features(expected, actual, rtol=1e-9, atol=1e-9):
+    """
+    Column-by-column comparison of two feature frames.
+
+    Returns:
+    --------
+    DataFrame with one row per column that differs (students missing on
+    either side are reported under 'id_student')
+    """
+    problems = []
+    missing = expected.index.symmetric_difference(actual.index)
+    if len(missing):
+        problems.append({'column': 'id_student', 'mismatches': len(missing), 'max_abs_diff': np.nan})
+
+    common = expected.index.intersection(actual.index)
+    for col in expected.columns:
+        a, b = expected.loc[common, col], actual.loc[common, col]
+        if pd.api.types.is_numeric_dtype(a):
+            x, y = a.to_numpy(dtype=np.float64), b.to_numpy(dtype=np.float64)
+            equal = np.isclose(x, y, rtol=rtol, atol=atol, equal_nan=True)
+            diff = np.nanmax(np.abs(x - y)[~equal]) if (~equal).any() else 0.0
+        else:
+            equal = a.astype(str).to_numpy() == b.astype(str).to_numpy()
+            diff = np.nan
+        if not equal.all():
+            problems.append({'column': col, 'mismatches': int((~equal).sum()), 'max_abs_diff': diff})
+    return pd.DataFrame(problems, columns=['column', 'mismatches', 'max_abs_diff'])
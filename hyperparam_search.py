@@ -0,0 +1,405 @@
+"""
+Parallel, resumable hyperparameter search for the XGBoost / LightGBM models.
+
+The notebook's tuning cells (51, 58, 64) fit every parameter combination on
+every fold, one after another, each fit running all of its n_estimators.
+run_search evaluates the same kind of candidates with:
+
+- successive halving over CV folds: every candidate is scored on one fold,
+  the best 1/eta go on to eta times as many folds, and so on until the
+  survivors have been scored on all folds, so poor candidates cost one fit
+  instead of n_folds
+- early stopping: each fit holds out EARLY_STOPPING_FRACTION of its
+  training rows and stops adding trees once that slice stops improving
+  (n_estimators is the cap); the CV fold itself is only used for the score,
+  so scores sit slightly below those of a fit on the whole training fold
+  while ranking candidates the same way
+- a process pool with a fixed total thread budget: ``total_threads`` is
+  split evenly between ``n_workers`` processes, each fit using its share
+- a checkpoint file: every finished (candidate, fold) fit is appended as
+  one JSON line, and a re-run with the same data, folds and settings skips
+  the fits already recorded, so an interrupted search resumes where it stopped
+
+Usage:
+    python hyperparam_search.py --features features.parquet --model xgb --binary \\
+        --candidates 60 --workers 8 --threads 32 --checkpoint xgb_search.jsonl
+
+    from hyperparam_search import run_search
+    search = run_search('xgb', xgb_param_combinations, X_train_binary, y_train_binary,
+                        checkpoint='xgb_search.jsonl')
+    search['best_params'], search['best_score'], search['results']
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_cache import frame_checksum
+
+# Bump this when the fitting or scoring procedure changes, so old checkpoints are not reused
+SEARCH_VERSION = 1
+
+N_FOLDS = 5
+HALVING_ETA = 3
+EARLY_STOPPING_ROUNDS = 20
+EARLY_STOPPING_FRACTION = 0.1
+RANDOM_STATE = 42
+
+# Binary target of the notebook's binary classification cells
+BINARY_TARGET_MAPPING = {'Fail': 0, 'Withdrawn': 0, 'Pass': 1, 'Distinction': 1}
+
+# Sampling spaces for --candidates (cell 50 for XGBoost; the LightGBM counterpart)
+PARAM_SPACES = {
+    'xgb': {
+        'max_depth': [3, 4, 5, 6, 7, 8],
+        'learning_rate': [0.01, 0.05, 0.1, 0.15, 0.2],
+        'n_estimators': [100, 200, 300, 500],
+        'min_child_weight': [1, 3, 5, 7],
+        'gamma': [0, 0.1, 0.2, 0.5],
+        'reg_alpha': [0, 0.1, 0.5, 1.0],
+        'reg_lambda': [1, 1.5, 2.0, 2.5],
+        'subsample': [0.7, 0.8, 0.9, 1.0],
+        'colsample_bytree': [0.7, 0.8, 0.9, 1.0],
+    },
+    'lgb': {
+        'max_depth': [-1, 4, 5, 6, 7, 8],
+        'num_leaves': [15, 31, 63, 127],
+        'learning_rate': [0.01, 0.05, 0.1, 0.15, 0.2],
+        'n_estimators': [100, 200, 300, 500],
+        'min_child_samples': [10, 20, 40],
+        'reg_alpha': [0, 0.1, 0.5, 1.0],
+        'reg_lambda': [0, 1, 2],
+        'subsample': [0.7, 0.8, 0.9, 1.0],
+        'subsample_freq': [1],
+        'colsample_bytree': [0.7, 0.8, 0.9, 1.0],
+    },
+}
+
+SCORERS = ('accuracy', 'f1_macro', 'f1_weighted')
+
+_worker_data = None
+
+
+def make_model(model_type, params, n_jobs=1, random_state=RANDOM_STATE,
+               early_stopping_rounds=EARLY_STOPPING_ROUNDS):
+    """XGBClassifier / LGBMClassifier with the notebook's fixed settings, ``params`` and early stopping."""
+    if model_type == 'xgb':
+        import xgboost as xgb
+        return xgb.XGBClassifier(random_state=random_state, verbosity=0, n_jobs=n_jobs,
+                                 early_stopping_rounds=early_stopping_rounds, **params)
+    if model_type == 'lgb':
+        import lightgbm as lgb
+        return lgb.LGBMClassifier(random_state=random_state, verbosity=-1, n_jobs=n_jobs, **params)
+    raise ValueError(f"Unknown model type '{model_type}'. Expected 'xgb' or 'lgb'")
+
+
+def _fit_early_stopping(model_type, model, X_train, y_train, X_stop, y_stop, early_stopping_rounds):
+    """Fit with early stopping on (X_stop, y_stop); returns the number of trees kept."""
+    if model_type == 'xgb':
+        model.fit(X_train, y_train, eval_set=[(X_stop, y_stop)], verbose=False)
+        return int(model.best_iteration) + 1
+    import inspect
+    import lightgbm as lgb
+    callbacks = [lgb.early_stopping(early_stopping_rounds, verbose=False)]
+    # LightGBM 4.6 replaced eval_set with eval_X / eval_y; requirements allow 4.1
+    if 'eval_X' in inspect.signature(model.fit).parameters:
+        model.fit(X_train, y_train, eval_X=(X_stop,), eval_y=(y_stop,), callbacks=callbacks)
+    else:
+        model.fit(X_train, y_train, eval_set=[(X_stop, y_stop)], callbacks=callbacks)
+    return int(model.best_iteration_ or model.n_estimators)
+
+
+def _score(scoring, y_true, y_pred):
+    from sklearn.metrics import accuracy_score, f1_score
+    if scoring == 'accuracy':
+        return float(accuracy_score(y_true, y_pred))
+    return float(f1_score(y_true, y_pred, average=scoring.split('_', 1)[1]))
+
+
+def search_folds(y, n_folds=N_FOLDS, random_state=RANDOM_STATE, early_stopping_fraction=EARLY_STOPPING_FRACTION):
+    """
+    Stratified CV folds, each with the training rows split again for early stopping.
+
+    Returns:
+    --------
+    list of (fit_rows, stop_rows, validation_rows) arrays
+    """
+    from sklearn.model_selection import StratifiedKFold, train_test_split
+
+    folds = []
+    for train, validation in StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state).split(
+            np.zeros(len(y)), y):
+        fit_rows, stop_rows = train_test_split(train, test_size=early_stopping_fraction,
+                                               random_state=random_state, stratify=y[train])
+        folds.append((np.sort(fit_rows), np.sort(stop_rows), validation))
+    return folds
+
+
+def _init_worker(X, y, folds, threads):
+    global _worker_data
+    _worker_data = (X, y, folds, threads)
+    # Keep BLAS / OpenMP pools inside this worker's share of the thread budget
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:  # pragma: no cover - installed with scikit-learn
+        return
+    threadpool_limits(limits=threads)
+
+
+def evaluate_fold(model_type, params, fold, scoring, random_state, early_stopping_rounds):
+    """
+    Fit one candidate on one fold with early stopping and score it on the fold (runs in a worker).
+
+    Returns:
+    --------
+    dict with the fold, score, trees kept and seconds
+    """
+    X, y, folds, threads = _worker_data
+    fit_rows, stop_rows, validation_rows = folds[fold]
+    start = time.time()
+    model = make_model(model_type, params, n_jobs=threads, random_state=random_state,
+                       early_stopping_rounds=early_stopping_rounds)
+    trees = _fit_early_stopping(model_type, model, X[fit_rows], y[fit_rows], X[stop_rows], y[stop_rows],
+                                early_stopping_rounds)
+    score = _score(scoring, y[validation_rows], model.predict(X[validation_rows]))
+    return {'fold': fold, 'score': score, 'trees': trees, 'seconds': time.time() - start}
+
+
+def candidate_id(model_type, params):
+    """Stable id of a parameter combination."""
+    payload = json.dumps({'model': model_type, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def halving_schedule(n_folds=N_FOLDS, eta=HALVING_ETA, min_folds=1):
+    """Folds scored at each rung: min_folds, min_folds * eta, ... up to n_folds (e.g. 1, 3, 5)."""
+    rungs = []
+    folds = max(1, min(min_folds, n_folds))
+    while folds < n_folds:
+        rungs.append(folds)
+        folds *= eta
+    rungs.append(n_folds)
+    return rungs
+
+
+def sample_candidates(model_type, n_candidates, random_state=RANDOM_STATE, space=None):
+    """``n_candidates`` distinct parameter combinations drawn from PARAM_SPACES[model_type] (or ``space``)."""
+    from sklearn.model_selection import ParameterSampler
+
+    space = PARAM_SPACES[model_type] if space is None else space
+    return [
+        {key: (value.item() if isinstance(value, np.generic) else value) for key, value in params.items()}
+        for params in ParameterSampler(space, n_iter=n_candidates, random_state=random_state)
+    ]
+
+
+def _read_checkpoint(path, search_key):
+    """{(candidate_id, fold): record} from the lines of this search (other searches' lines are ignored)."""
+    done = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by an interruption
+                    continue
+                if record.get('search') == search_key:
+                    done[(record['candidate'], record['fold'])] = record
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def run_search(model_type, candidates, X, y, checkpoint='hyperparam_search.jsonl', n_folds=N_FOLDS,
+               eta=HALVING_ETA, min_folds=1, scoring='accuracy', n_workers=None, total_threads=None,
+               early_stopping_rounds=EARLY_STOPPING_ROUNDS, random_state=RANDOM_STATE):
+    """
+    Successive-halving search over ``candidates`` with early stopping, in parallel and checkpointed.
+
+    Parameters:
+    -----------
+    model_type : str
+        'xgb' or 'lgb'
+    candidates : list of dict
+        Parameter combinations (e.g. xgb_param_combinations, or sample_candidates(...));
+        n_estimators is the most trees a fit may use
+    X : DataFrame or array
+    y : array
+        Class labels (any values; encoded to 0..n_classes-1)
+    checkpoint : str
+        JSON-lines file with one record per finished fit; appended to and resumed from
+    n_folds : int
+        Stratified CV folds for the full evaluation
+    eta : int
+        Halving rate: 1/eta of the candidates survive each rung, scored on eta times the folds
+    min_folds : int
+        Folds every candidate is scored on at the first rung
+    scoring : str
+        'accuracy', 'f1_macro' or 'f1_weighted'
+    n_workers : int, optional
+        Worker processes (default: total_threads, one thread each)
+    total_threads : int, optional
+        Threads shared by all workers (default: os.cpu_count())
+    early_stopping_rounds : int
+        Rounds without improvement on the early-stopping slice before a fit stops
+    random_state : int
+        Seed for the folds and the models
+
+    Returns:
+    --------
+    dict with best_params (including n_estimators set to the median number of
+    trees early stopping kept), best_score / best_std over all folds, results
+    (one row per candidate: mean, std, folds scored, rung reached) and
+    fits, resumed_fits and seconds
+    """
+    if scoring not in SCORERS:
+        raise ValueError(f"Unknown scoring '{scoring}'. Expected one of {SCORERS}")
+    total_threads = total_threads or os.cpu_count() or 1
+    n_workers = max(1, min(n_workers or total_threads, total_threads))
+    threads = max(1, total_threads // n_workers)
+
+    X_values = np.ascontiguousarray(X.to_numpy(dtype=np.float32) if hasattr(X, 'to_numpy') else X, dtype=np.float32)
+    classes, y_codes = np.unique(np.asarray(y), return_inverse=True)
+    folds = search_folds(y_codes, n_folds=n_folds, random_state=random_state)
+
+    # Everything that changes a fit's score is part of the key; the worker count is not
+    data_frame = pd.DataFrame(X_values)
+    data_frame['__y'] = y_codes
+    search_key = hashlib.sha256(json.dumps({
+        'version': SEARCH_VERSION, 'model': model_type, 'data': frame_checksum(data_frame),
+        'n_folds': n_folds, 'scoring': scoring, 'early_stopping_rounds': early_stopping_rounds,
+        'random_state': random_state,
+    }, sort_keys=True).encode()).hexdigest()[:16]
+
+    candidates = [dict(params) for params in candidates]
+    ids = [candidate_id(model_type, params) for params in candidates]
+    by_id = dict(zip(ids, candidates))
+    done = _read_checkpoint(checkpoint, search_key)
+    resumed = sum(1 for (cid, _) in done if cid in by_id)
+    rungs = halving_schedule(n_folds, eta, min_folds)
+    print(f"🔍 {model_type}: {len(by_id)} candidates, rungs of {rungs} folds, {n_workers} workers x "
+          f"{threads} threads" + (f", {resumed} fits resumed from {checkpoint}" if resumed else ''))
+
+    def mean_score(cid, n):
+        return float(np.mean([done[(cid, fold)]['score'] for fold in range(n)]))
+
+    survivors = list(by_id)
+    reached = {}
+    n_fits = 0
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                             initargs=(X_values, y_codes, folds, threads)) as pool, open(checkpoint, 'a') as log:
+        for rung, n_rung_folds in enumerate(rungs):
+            pending = {}
+            for cid in survivors:
+                reached[cid] = rung
+                for fold in range(n_rung_folds):
+                    if (cid, fold) not in done:
+                        future = pool.submit(evaluate_fold, model_type, by_id[cid], fold, scoring, random_state,
+                                             early_stopping_rounds)
+                        pending[future] = cid
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    cid = pending.pop(future)
+                    record = dict(future.result(), search=search_key, candidate=cid, params=by_id[cid])
+                    done[(cid, record['fold'])] = record
+                    log.write(json.dumps(record, default=str) + '\n')
+                    log.flush()
+                    n_fits += 1
+
+            ranked = sorted(survivors, key=lambda cid: -mean_score(cid, n_rung_folds))
+            print(f"   rung {rung + 1}/{len(rungs)}: {len(survivors)} candidates on {n_rung_folds} folds, "
+                  f"best {mean_score(ranked[0], n_rung_folds):.4f} ({time.time() - start:.0f}s)")
+            if rung < len(rungs) - 1:
+                # sorted is stable: ties keep the candidates' order
+                survivors = ranked[:max(1, math.ceil(len(survivors) / eta))]
+
+    rows = []
+    for cid, params in by_id.items():
+        scores = [done[(cid, fold)]['score'] for fold in range(n_folds) if (cid, fold) in done]
+        trees = [done[(cid, fold)]['trees'] for fold in range(n_folds) if (cid, fold) in done]
+        rows.append({
+            'candidate': cid,
+            'params': params,
+            'rung': reached.get(cid, 0) + 1,
+            'folds': len(scores),
+            'mean_cv_score': float(np.mean(scores)),
+            'std_cv_score': float(np.std(scores)),
+            'median_trees': int(np.median(trees)),
+        })
+    results = pd.DataFrame(rows).sort_values(['folds', 'mean_cv_score'], ascending=False, kind='stable')
+    best = results.iloc[0]
+    best_params = dict(best['params'], n_estimators=int(best['median_trees']))
+    seconds = time.time() - start
+    print(f"🏆 Best {scoring}: {best['mean_cv_score']:.4f} ± {best['std_cv_score']:.4f} over {n_folds} folds "
+          f"({n_fits} fits in {seconds:.0f}s): {best_params}")
+    return {
+        'best_params': best_params,
+        'best_score': float(best['mean_cv_score']),
+        'best_std': float(best['std_cv_score']),
+        'classes': classes,
+        'results': results.reset_index(drop=True),
+        'fits': n_fits,
+        'resumed_fits': resumed,
+        'seconds': seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Successive-halving hyperparameter search with early stopping, '
+                                                 'in parallel and resumable.')
+    parser.add_argument('--features', required=True, help='features file with the target column (.parquet or .csv; '
+                                                          'parallel_build.py --with-target)')
+    parser.add_argument('--model', choices=sorted(PARAM_SPACES), default='xgb', help='model family')
+    parser.add_argument('--binary', action='store_true', help='Pass/Distinction vs Fail/Withdrawn, as in the notebook')
+    parser.add_argument('--candidates', type=int, default=50, help='parameter combinations sampled from PARAM_SPACES')
+    parser.add_argument('--candidates-file', default=None, help='JSON list of parameter dicts (instead of sampling)')
+    parser.add_argument('--checkpoint', default=None, help='JSON-lines checkpoint (default: <model>_search.jsonl)')
+    parser.add_argument('--folds', type=int, default=N_FOLDS, help='CV folds')
+    parser.add_argument('--eta', type=int, default=HALVING_ETA, help='halving rate')
+    parser.add_argument('--scoring', choices=SCORERS, default='accuracy', help='CV metric')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per thread)')
+    parser.add_argument('--threads', type=int, default=None, help='total thread budget (default: all cores)')
+    parser.add_argument('--seed', type=int, default=RANDOM_STATE, help='random_state for folds, sampling and models')
+    args = parser.parse_args()
+
+    from feature_engineering import CATEGORICAL_FEATURES, NUMERICAL_FEATURES, TARGET_COLUMN
+
+    frame = pd.read_csv(args.features, index_col=0) if args.features.endswith('.csv') else pd.read_parquet(args.features)
+    if TARGET_COLUMN not in frame.columns:
+        parser.error(f"{args.features} has no '{TARGET_COLUMN}' column (build it with --with-target)")
+    frame = frame[frame[TARGET_COLUMN].notna()]
+    categorical = [col for col in CATEGORICAL_FEATURES if col in frame.columns]
+    X = pd.get_dummies(frame[[col for col in NUMERICAL_FEATURES if col in frame.columns] + categorical],
+                       columns=categorical, dtype=np.float32)
+    y = frame[TARGET_COLUMN].astype(str)
+    if args.binary:
+        y = y.map(BINARY_TARGET_MAPPING)
+
+    if args.candidates_file:
+        with open(args.candidates_file) as f:
+            candidates = json.load(f)
+    else:
+        candidates = sample_candidates(args.model, args.candidates, random_state=args.seed)
+
+    checkpoint = args.checkpoint or f"{args.model}_search.jsonl"
+    search = run_search(args.model, candidates, X, y.to_numpy(), checkpoint=checkpoint, n_folds=args.folds,
+                        eta=args.eta, scoring=args.scoring, n_workers=args.workers, total_threads=args.threads,
+                        random_state=args.seed)
+    columns = ['mean_cv_score', 'std_cv_score', 'folds', 'median_trees', 'params']
+    print(search['results'][columns].head(10).to_string(index=False))
+    print(f"✅ Checkpoint: {Path(checkpoint).absolute()}")
+
+
+if __name__ == '__main__':
+    main()
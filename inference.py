@@ -0,0 +1,319 @@
+"""
+Batched model inference for the classifier saved by save_model.py.
+
+The notebook trains on a 58-column matrix: the power-transformed numerical
+features followed by the one-hot encoded categoricals, in the order stored in
+feature_names.json. InferenceCore turns feature frames (build_features /
+build_student_features output) into that matrix and calls predict_proba on
+the whole batch at once. Missing values are filled with the training median
+(numerical) or mode (categorical) first, as the notebook does before fitting
+the scaler and encoder (fill_values.json). Where every scaler and encoder output column lands
+in the matrix is worked out once, from a name -> index map over
+feature_names.json, so assembling a batch is two vectorised transforms and
+two fancy-indexed assignments, whatever the batch size.
+
+Usage:
+    from inference import InferenceCore
+    core = InferenceCore.from_artifacts('.')          # the pickles from save_model.py
+    core = InferenceCore.from_bundle('model_bundle')  # or the memory-mapped bundle
+    core = load_inference_core('.')                   # the bundle if saved, else the pickles
+
+    probabilities = core.predict_proba_frame(features)   # one row per student
+    outcomes = core.predict(features)                    # most likely outcome
+    version = artifact_version('.')                      # changes whenever the artifacts are re-saved
+"""
+
+import hashlib
+import json
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering import CATEGORICAL_FEATURES, NUMERICAL_FEATURES
+from model_bundle import (DEFAULT_BUNDLE_DIR, MANIFEST_FILE, ArrayOneHotEncoder, ArrayScaler, ArtifactLoadError,
+                          load_model_bundle, read_manifest)
+from tree_engine import TreeEnsemble, compile_ensemble
+
+# Files written by save_model.save_model_artifacts
+MODEL_FILE = 'model.pkl'
+SCALER_FILE = 'scaler.pkl'
+ENCODER_FILE = 'encoder.pkl'
+TARGET_ENCODER_FILE = 'target_encoder.pkl'
+FEATURE_NAMES_FILE = 'feature_names.json'
+FILL_VALUES_FILE = 'fill_values.json'
+
+# Largest batch sent to the compiled tree engine when the original model is
+# also at hand; bigger batches go to the library's own (C) predict_proba
+COMPILED_MAX_BATCH = 256
+
+
+def _input_columns(transformer, default):
+    """Columns a fitted scaler/encoder expects (the ones it was fitted on, if recorded)."""
+    names = getattr(transformer, 'feature_names_in_', None)
+    return list(names) if names is not None else list(default)
+
+
+def _place(output_names, feature_index):
+    """
+    Match a transformer's output columns to model matrix columns.
+
+    Returns (source, target) position arrays: output column source[i] goes
+    to matrix column target[i]. Outputs the model does not use are skipped.
+    """
+    pairs = [(i, feature_index[name]) for i, name in enumerate(output_names) if name in feature_index]
+    source, target = zip(*pairs) if pairs else ((), ())
+    return np.array(source, dtype=np.intp), np.array(target, dtype=np.intp)
+
+
+class InferenceCore:
+    """
+    Model, scaler and encoder behind one batched predict_proba.
+
+    Parameters:
+    -----------
+    model : sklearn classifier
+        Fitted on the matrix described by feature_names
+    scaler : sklearn transformer
+        Fitted on the numerical features (PowerTransformer in the notebook)
+    encoder : OneHotEncoder
+        Fitted on the categorical features
+    feature_names : list
+        Model matrix columns, in order (feature_names.json)
+    target_encoder : LabelEncoder, optional
+        Decodes integer model classes to outcome labels
+    fill_values : dict, optional
+        Training median of each numerical feature and mode of each
+        categorical one, filled in for missing values. Without them a batch
+        with a missing value is rejected (ValueError).
+    compiled : bool
+        Score small batches with the array-compiled tree engine
+        (tree_engine.compile_ensemble) and use the numpy forms of the scaler
+        and encoder, skipping sklearn's per-call overhead. Models the engine
+        does not support keep their own predict_proba.
+    """
+
+    def __init__(self, model, scaler, encoder, feature_names, target_encoder=None, compiled=False, fill_values=None):
+        self.model = model
+        self.engine = model if isinstance(model, TreeEnsemble) else None
+        if compiled and self.engine is None:
+            try:
+                self.engine = compile_ensemble(model)
+            except (TypeError, ValueError):
+                self.engine = None
+            try:
+                scaler = ArrayScaler.from_sklearn(scaler)
+            except (TypeError, AttributeError):
+                pass
+            try:
+                encoder = ArrayOneHotEncoder.from_sklearn(encoder)
+            except (TypeError, AttributeError):
+                pass
+        self.scaler = scaler
+        self.encoder = encoder
+        self.feature_names = list(feature_names)
+        self.feature_index = {name: i for i, name in enumerate(self.feature_names)}
+
+        self.numerical_columns = _input_columns(scaler, NUMERICAL_FEATURES)
+        self.categorical_columns = _input_columns(encoder, CATEGORICAL_FEATURES)
+        self._numerical_source, self._numerical_target = _place(self.numerical_columns, self.feature_index)
+        encoded_names = encoder.get_feature_names_out(self.categorical_columns)
+        self._encoded_source, self._encoded_target = _place(encoded_names, self.feature_index)
+
+        # Training fill value of each input column that has one (public, so
+        # callers can reject a missing value up front instead of failing a batch)
+        fill_values = dict(fill_values or {})
+        self.fill_values = {col: fill_values[col] for col in self.numerical_columns + self.categorical_columns
+                            if col in fill_values}
+        self._numerical_fill = np.array([fill_values.get(col, np.nan) for col in self.numerical_columns],
+                                        dtype=np.float64)
+        self._categorical_fill = [fill_values.get(col) for col in self.categorical_columns]
+
+        covered = np.zeros(len(self.feature_names), dtype=bool)
+        covered[self._numerical_target] = True
+        covered[self._encoded_target] = True
+        if not covered.all():
+            missing = [name for name, ok in zip(self.feature_names, covered) if not ok]
+            raise ValueError(f"Features not produced by the scaler or encoder: {missing}")
+
+        classes = np.asarray(model.classes_)
+        if target_encoder is not None and np.issubdtype(classes.dtype, np.integer):
+            classes = target_encoder.inverse_transform(classes)
+        self.classes = [str(label) for label in classes]
+
+    @classmethod
+    def from_artifacts(cls, artifact_dir='.', compiled=False, timings=None):
+        """
+        Load model.pkl, scaler.pkl, encoder.pkl, feature_names.json (and
+        target_encoder.pkl and fill_values.json if present).
+
+        Raises ArtifactLoadError naming the file that could not be loaded.
+        ``timings``, if given, is filled with the load time of each file in seconds.
+        """
+        artifact_dir = Path(artifact_dir)
+
+        def _load(component, name):
+            path = artifact_dir / name
+            start = time.perf_counter()
+            try:
+                with open(path, 'rb') as f:
+                    loaded = pickle.load(f) if name.endswith('.pkl') else json.load(f)
+            except Exception as e:
+                raise ArtifactLoadError(component, path, e) from e
+            if timings is not None:
+                timings[component] = time.perf_counter() - start
+            return loaded
+
+        target_encoder = None
+        if (artifact_dir / TARGET_ENCODER_FILE).exists():
+            target_encoder = _load('target_encoder', TARGET_ENCODER_FILE)
+        fill_values = None
+        if (artifact_dir / FILL_VALUES_FILE).exists():
+            fill_values = _load('fill_values', FILL_VALUES_FILE)
+        return cls(_load('model', MODEL_FILE), _load('scaler', SCALER_FILE), _load('encoder', ENCODER_FILE),
+                   _load('feature_names', FEATURE_NAMES_FILE), target_encoder, compiled=compiled,
+                   fill_values=fill_values)
+
+    @classmethod
+    def from_bundle(cls, bundle_dir=DEFAULT_BUNDLE_DIR, mmap=True, timings=None):
+        """Load from a model_bundle directory, memory-mapping its arrays (see model_bundle.py)."""
+        components = ['model', 'scaler', 'encoder']
+        if 'target_encoder' in read_manifest(bundle_dir)['components']:
+            components.append('target_encoder')
+        bundle = load_model_bundle(bundle_dir, components=components, mmap=mmap, timings=timings)
+        return cls(bundle['model'], bundle['scaler'], bundle['encoder'], bundle['feature_names'],
+                   bundle.get('target_encoder'), fill_values=bundle['fill_values'])
+
+    def transform(self, features):
+        """
+        Build the model matrix for a batch of students.
+
+        Parameters:
+        -----------
+        features : DataFrame
+            One row per student with the numerical and categorical feature
+            columns (extra columns are ignored); NaN, inf and None are
+            filled with the training median / mode
+
+        Returns:
+        --------
+        float64 array of shape (len(features), len(feature_names))
+        """
+        missing = [col for col in self.numerical_columns + self.categorical_columns if col not in features.columns]
+        if missing:
+            raise ValueError(f"Feature frame is missing columns: {missing}")
+
+        numerical = features[self.numerical_columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        # np.where, not in-place: to_numpy may return a read-only view of the frame
+        missing_numerical = ~np.isfinite(numerical)
+        if missing_numerical.any():
+            numerical = np.where(missing_numerical, self._numerical_fill, numerical)
+            self._check_filled(np.isnan(numerical).any(axis=0), self.numerical_columns)
+        if not isinstance(self.scaler, ArrayScaler):
+            # sklearn checks the column names it was fitted with
+            numerical = pd.DataFrame(numerical, columns=self.numerical_columns, index=features.index)
+        scaled = np.asarray(self.scaler.transform(numerical), dtype=np.float64)
+
+        # Column by column: converting the string columns one at a time is
+        # several times cheaper than selecting and converting the block
+        categorical = np.column_stack([features[col].to_numpy(dtype=object) for col in self.categorical_columns])
+        missing_categorical = pd.isna(categorical)
+        if missing_categorical.any():
+            categorical[missing_categorical] = np.array(self._categorical_fill, dtype=object)[
+                np.nonzero(missing_categorical)[1]]
+            self._check_filled(pd.isna(categorical).any(axis=0), self.categorical_columns)
+        if not isinstance(self.encoder, ArrayOneHotEncoder):
+            categorical = pd.DataFrame(categorical, columns=self.categorical_columns, index=features.index)
+        encoded = self.encoder.transform(categorical)
+        if hasattr(encoded, 'toarray'):
+            encoded = encoded.toarray()
+
+        matrix = np.zeros((len(features), len(self.feature_names)), dtype=np.float64)
+        matrix[:, self._numerical_target] = scaled[:, self._numerical_source]
+        matrix[:, self._encoded_target] = encoded[:, self._encoded_source]
+        return matrix
+
+    @staticmethod
+    def _check_filled(still_missing, columns):
+        if still_missing.any():
+            names = [col for col, missing in zip(columns, still_missing) if missing]
+            raise ValueError(f"Missing values in {names} and no training fill value for them "
+                             f"(save the artifacts with fill_values)")
+
+    def predict_proba(self, features):
+        """Class probabilities, shape (len(features), len(classes)), columns in self.classes order."""
+        if len(features) == 0:
+            return np.empty((0, len(self.classes)))
+        matrix = self.transform(features)
+        if self.engine is not None and (self.engine is self.model or len(matrix) <= COMPILED_MAX_BATCH):
+            return self.engine.predict_proba(matrix)
+        return self.model.predict_proba(matrix)
+
+    def predict_proba_frame(self, features):
+        """predict_proba as a DataFrame with one column per outcome, indexed like features."""
+        return pd.DataFrame(self.predict_proba(features), index=features.index, columns=self.classes)
+
+    def example_frame(self):
+        """One placeholder student: numericals at the training median (else 0), categoricals their first category."""
+        row = {col: 0.0 if np.isnan(fill) else float(fill)
+               for col, fill in zip(self.numerical_columns, self._numerical_fill)}
+        for col, categories in zip(self.categorical_columns, self.encoder.categories_):
+            row[col] = categories[0].item() if hasattr(categories[0], 'item') else categories[0]
+        return pd.DataFrame([row])
+
+    def warm_up(self):
+        """
+        Score one placeholder student, so the first real request does not pay
+        for first-call work (lazy imports inside the model library, thread
+        pools, faulting in memory-mapped pages).
+        """
+        self.predict_proba(self.example_frame())
+
+    def predict(self, features):
+        """Most likely outcome per student (Series indexed like features)."""
+        probabilities = self.predict_proba(features)
+        labels = np.asarray(self.classes, dtype=object)[probabilities.argmax(axis=1)] if len(features) else []
+        return pd.Series(labels, index=features.index, name='predicted_outcome', dtype=object)
+
+
+def load_inference_core(artifact_dir='.', compiled=True, timings=None):
+    """
+    InferenceCore from <artifact_dir>/model_bundle when it exists, else from the pickles in artifact_dir.
+
+    Processes loading the same bundle share its memory-mapped arrays. A
+    bundle is always evaluated by the compiled engine; pickles are compiled
+    when ``compiled`` is set. ``timings``, if given, is filled with the load
+    time of each component in seconds.
+    """
+    bundle_dir = Path(artifact_dir) / DEFAULT_BUNDLE_DIR
+    if (bundle_dir / MANIFEST_FILE).exists():
+        return InferenceCore.from_bundle(bundle_dir, timings=timings)
+    return InferenceCore.from_artifacts(artifact_dir, compiled=compiled, timings=timings)
+
+
+def artifact_version(artifact_dir='.'):
+    """
+    Short fingerprint of the artifacts load_inference_core would load.
+
+    Built from the size and modification time of model_bundle/manifest.json
+    (rewritten on every bundle save) or of the individual pickles, so it
+    changes whenever save_model_artifacts runs again. None when there is
+    nothing to load.
+    """
+    artifact_dir = Path(artifact_dir)
+    bundle_manifest = artifact_dir / DEFAULT_BUNDLE_DIR / MANIFEST_FILE
+    if bundle_manifest.exists():
+        paths = [bundle_manifest]
+    else:
+        paths = [artifact_dir / name for name in
+                 (MODEL_FILE, SCALER_FILE, ENCODER_FILE, FEATURE_NAMES_FILE, TARGET_ENCODER_FILE, FILL_VALUES_FILE)]
+        paths = [path for path in paths if path.exists()]
+        if not paths:
+            return None
+    fingerprint = hashlib.sha1()
+    for path in paths:
+        stat = path.stat()
+        fingerprint.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return fingerprint.hexdigest()[:12]
@@ -0,0 +1,451 @@
+"""
+Memory-mappable model artifact bundle.
+
+save_model_artifacts writes one pickle per component, and unpickling a large
+RandomForest takes seconds and gives every serving process its own private
+copy. A bundle instead stores the numeric state of each component as plain
+.npy arrays next to a small manifest.json:
+
+    model_bundle/
+        manifest.json             component kinds, shapes, column names, training fill values
+        model.feature.npy         tree node tables (tree_engine.TreeEnsemble: sklearn
+        model.threshold.npy       forests, XGBoost and LightGBM alike)
+        ...
+        scaler.lambdas.npy        PowerTransformer lambdas / StandardScaler mean and scale
+        encoder.categories_0.npy  OneHotEncoder categories, one array per column
+        cluster_model.cluster_centers.npy
+        neighbor_index.data.npy   similar-students KD-tree (similar_students.py)
+        persona_model.*.npy       persona lookup: UMAP placement + KMeans (persona.py)
+        cluster_tables.*.npy      per-cluster percentile / z-score tables (cluster_features.py)
+        umap_reducer.pkl          components without an array form stay pickled
+
+load_model_bundle memory-maps the arrays (np.load(mmap_mode='r')), so loading
+is near-instant and the operating system keeps a single page-cache copy that
+all serving processes share. The loaded components are small numpy
+evaluators exposing the scikit-learn methods InferenceCore uses
+(transform, predict_proba, get_feature_names_out, ...). A component that
+fails to load raises ArtifactLoadError naming the component.
+
+Usage:
+    from model_bundle import save_model_bundle, load_model_bundle
+    save_model_bundle('model_bundle', model=model, scaler=scaler, encoder=encoder,
+                      feature_names=feature_names, target_encoder=target_encoder)
+
+    from inference import InferenceCore
+    core = InferenceCore.from_bundle('model_bundle')
+"""
+
+import json
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cluster_features import ClusterFeatureTables
+from persona import PersonaModel
+from similar_students import KDTreeIndex
+from tree_engine import TreeEnsemble, compile_ensemble
+
+BUNDLE_FORMAT_VERSION = 2
+MANIFEST_FILE = 'manifest.json'
+DEFAULT_BUNDLE_DIR = 'model_bundle'
+
+# Components written by save_model_artifacts, in load order
+BUNDLE_COMPONENTS = ('model', 'scaler', 'encoder', 'target_encoder', 'cluster_model', 'umap_reducer',
+                     'neighbor_index', 'persona_model', 'cluster_tables')
+
+
+class ArtifactLoadError(Exception):
+    """A model artifact component failed to load; ``component`` names which one."""
+
+    def __init__(self, component, path, cause):
+        self.component = component
+        self.path = str(path)
+        self.cause = cause
+        super().__init__(f"Could not load the '{component}' component from {self.path}: {cause}")
+
+
+def _names_or_none(names):
+    return None if names is None else [str(name) for name in names]
+
+
+# ============================================================================
+# ARRAY EVALUATORS (what load_model_bundle returns)
+# ============================================================================
+
+class ArrayScaler:
+    """PowerTransformer (Yeo-Johnson / Box-Cox) or StandardScaler transform from lambdas, means and scales."""
+
+    ARRAYS = ('lambdas', 'mean', 'scale')
+
+    def __init__(self, method, lambdas=None, mean=None, scale=None, feature_names_in=None):
+        self.method = method
+        self.lambdas = lambdas
+        self.mean = mean
+        self.scale = scale
+        self.feature_names_in_ = None if feature_names_in is None else np.asarray(feature_names_in, dtype=object)
+
+    @classmethod
+    def from_sklearn(cls, scaler):
+        name = type(scaler).__name__
+        names = getattr(scaler, 'feature_names_in_', None)
+        if name == 'PowerTransformer':
+            standard = getattr(scaler, '_scaler', None) if scaler.standardize else None
+            return cls(scaler.method, lambdas=np.asarray(scaler.lambdas_, dtype=np.float64),
+                       mean=None if standard is None else np.asarray(standard.mean_, dtype=np.float64),
+                       scale=None if standard is None else np.asarray(standard.scale_, dtype=np.float64),
+                       feature_names_in=names)
+        if name == 'StandardScaler':
+            return cls('standard',
+                       mean=None if scaler.mean_ is None else np.asarray(scaler.mean_, dtype=np.float64),
+                       scale=None if scaler.scale_ is None else np.asarray(scaler.scale_, dtype=np.float64),
+                       feature_names_in=names)
+        raise TypeError(f"No array form for {name}")
+
+    def transform(self, X):
+        X = np.array(X, dtype=np.float64)
+        if self.method == 'yeo-johnson':
+            X = _yeo_johnson(X, self.lambdas)
+        elif self.method == 'box-cox':
+            X = _box_cox(X, self.lambdas)
+        if self.mean is not None:
+            X -= self.mean
+        if self.scale is not None:
+            X /= self.scale
+        return X
+
+
+def _yeo_johnson(X, lambdas):
+    out = np.empty_like(X)
+    eps = np.spacing(1.0)
+    for j, lmbda in enumerate(lambdas):
+        x = X[:, j]
+        positive = x >= 0
+        if abs(lmbda) < eps:
+            out[positive, j] = np.log1p(x[positive])
+        else:
+            out[positive, j] = (np.power(x[positive] + 1, lmbda) - 1) / lmbda
+        if abs(lmbda - 2) > eps:
+            out[~positive, j] = -(np.power(-x[~positive] + 1, 2 - lmbda) - 1) / (2 - lmbda)
+        else:
+            out[~positive, j] = -np.log1p(-x[~positive])
+    return out
+
+
+def _box_cox(X, lambdas):
+    out = np.empty_like(X)
+    for j, lmbda in enumerate(lambdas):
+        out[:, j] = np.log(X[:, j]) if lmbda == 0 else (np.power(X[:, j], lmbda) - 1) / lmbda
+    return out
+
+
+class ArrayOneHotEncoder:
+    """
+    OneHotEncoder transform from its per-column categories and dropped indices.
+
+    Unknown categories encode as all zeros (handle_unknown='ignore').
+    """
+
+    def __init__(self, categories, drop_idx=None, feature_names_in=None):
+        self.categories_ = categories
+        self.drop_idx = drop_idx if drop_idx is not None else [None] * len(categories)
+        self.feature_names_in_ = None if feature_names_in is None else np.asarray(feature_names_in, dtype=object)
+        self._kept = [
+            np.delete(np.arange(len(cats)), [] if drop is None else [drop])
+            for cats, drop in zip(categories, self.drop_idx)
+        ]
+        # category -> output column within the column's block (dropped ones absent)
+        self._lookup = [
+            {cats[i].item() if hasattr(cats[i], 'item') else cats[i]: k for k, i in enumerate(kept)}
+            for cats, kept in zip(categories, self._kept)
+        ]
+
+    @classmethod
+    def from_sklearn(cls, encoder):
+        if getattr(encoder, '_infrequent_enabled', False):
+            raise TypeError("No array form for a OneHotEncoder with infrequent categories")
+        drop_idx = getattr(encoder, 'drop_idx_', None)
+        drop_idx = None if drop_idx is None else [None if d is None else int(d) for d in drop_idx]
+        return cls([np.asarray(cats) for cats in encoder.categories_], drop_idx,
+                   getattr(encoder, 'feature_names_in_', None))
+
+    def get_feature_names_out(self, input_features=None):
+        if input_features is None:
+            input_features = self.feature_names_in_ if self.feature_names_in_ is not None else \
+                [f"x{i}" for i in range(len(self.categories_))]
+        return np.array([
+            f"{feature}_{cats[i]}"
+            for feature, cats, kept in zip(input_features, self.categories_, self._kept)
+            for i in kept
+        ], dtype=object)
+
+    def transform(self, X):
+        values = X.to_numpy(dtype=object) if isinstance(X, pd.DataFrame) else np.asarray(X, dtype=object)
+        blocks = []
+        for j, (lookup, kept) in enumerate(zip(self._lookup, self._kept)):
+            # Plain dict lookups beat building a Categorical for the small
+            # batches the service scores; unknown (and dropped) values match
+            # no output column
+            positions = np.fromiter((lookup.get(value, -1) for value in values[:, j]), dtype=np.intp,
+                                    count=len(values))
+            block = np.zeros((len(values), len(kept)), dtype=np.float64)
+            known = positions >= 0
+            block[np.flatnonzero(known), positions[known]] = 1.0
+            blocks.append(block)
+        return np.hstack(blocks) if blocks else np.zeros((len(X), 0))
+
+
+class ArrayLabelEncoder:
+    """LabelEncoder.inverse_transform / transform from its classes array."""
+
+    def __init__(self, classes):
+        self.classes_ = classes
+
+    def inverse_transform(self, y):
+        return np.asarray(self.classes_)[np.asarray(y, dtype=np.intp)]
+
+    def transform(self, y):
+        return np.searchsorted(self.classes_, np.asarray(y, dtype=self.classes_.dtype))
+
+
+class ArrayKMeans:
+    """KMeans.predict (nearest centroid) from the cluster centres."""
+
+    def __init__(self, cluster_centers):
+        self.cluster_centers_ = cluster_centers
+        self.n_clusters = len(cluster_centers)
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        squared = (
+            np.einsum('ij,ij->i', X, X)[:, None]
+            - 2 * X @ self.cluster_centers_.T
+            + np.einsum('ij,ij->i', self.cluster_centers_, self.cluster_centers_)[None, :]
+        )
+        return np.sqrt(np.maximum(squared, 0))
+
+    def predict(self, X):
+        return self.transform(X).argmin(axis=1)
+
+
+# ============================================================================
+# SAVE
+# ============================================================================
+
+def _component_arrays(name, obj):
+    """(kind, arrays, attributes) of a component, or None when it has no array form."""
+    type_name = type(obj).__name__
+    if name == 'model':
+        try:
+            ensemble = obj if isinstance(obj, TreeEnsemble) else compile_ensemble(obj)
+        except (TypeError, ValueError):
+            return None
+        arrays = {key: getattr(ensemble, key if key != 'classes' else 'classes_') for key in TreeEnsemble.ARRAYS}
+        arrays = {key: array for key, array in arrays.items() if array is not None}
+        if arrays['classes'].dtype == object:
+            arrays['classes'] = arrays['classes'].astype(str)
+        return 'tree_ensemble', arrays, {'n_trees': ensemble.n_trees, **ensemble.attributes}
+    if name == 'scaler' and type_name in ('PowerTransformer', 'StandardScaler'):
+        scaler = ArrayScaler.from_sklearn(obj)
+        arrays = {key: getattr(scaler, key) for key in ArrayScaler.ARRAYS if getattr(scaler, key) is not None}
+        return 'scaler', arrays, {'method': scaler.method,
+                                  'feature_names_in': _names_or_none(scaler.feature_names_in_)}
+    if name == 'encoder' and type_name == 'OneHotEncoder':
+        try:
+            encoder = ArrayOneHotEncoder.from_sklearn(obj)
+        except TypeError:
+            return None
+        arrays = {f"categories_{j}": np.asarray(cats, dtype=str if cats.dtype == object else cats.dtype)
+                  for j, cats in enumerate(encoder.categories_)}
+        return 'one_hot', arrays, {'n_columns': len(encoder.categories_), 'drop_idx': encoder.drop_idx,
+                                   'feature_names_in': _names_or_none(encoder.feature_names_in_)}
+    if name == 'target_encoder' and type_name == 'LabelEncoder':
+        classes = np.asarray(obj.classes_)
+        return 'label_encoder', {'classes': classes.astype(str) if classes.dtype == object else classes}, {}
+    if name == 'cluster_model' and hasattr(obj, 'cluster_centers_'):
+        return 'kmeans', {'cluster_centers': np.asarray(obj.cluster_centers_, dtype=np.float64)}, {}
+    if name == 'neighbor_index' and type_name == 'KDTreeIndex':
+        return 'kd_tree', {key: getattr(obj, key) for key in KDTreeIndex.ARRAYS}, obj.attributes
+    if name == 'persona_model' and type_name == 'PersonaModel':
+        return 'persona', obj.arrays(), obj.attributes
+    if name == 'cluster_tables' and type_name == 'ClusterFeatureTables':
+        return 'cluster_tables', obj.arrays(), obj.attributes
+    return None
+
+
+def _write_component(bundle_dir, name, obj):
+    """Write one component's arrays (or pickle) and return its manifest entry."""
+    converted = _component_arrays(name, obj)
+    if converted is None:
+        path = bundle_dir / f"{name}.pkl"
+        with open(path, 'wb') as f:
+            pickle.dump(obj, f)
+        return {'kind': 'pickle', 'type': type(obj).__name__, 'file': path.name}
+    kind, arrays, attributes = converted
+    files = {}
+    for key, array in arrays.items():
+        path = bundle_dir / f"{name}.{key}.npy"
+        np.save(path, np.ascontiguousarray(array), allow_pickle=False)
+        files[key] = {'file': path.name, 'dtype': str(array.dtype), 'shape': list(array.shape)}
+    return {'kind': kind, 'type': type(obj).__name__, 'arrays': files, **attributes}
+
+
+def save_model_bundle(bundle_dir=DEFAULT_BUNDLE_DIR, feature_names=None, fill_values=None, **components):
+    """
+    Write a memory-mappable bundle of the given components.
+
+    Parameters:
+    -----------
+    bundle_dir : str
+        Output directory (created if needed)
+    feature_names : list
+        Model matrix columns (feature_names.json)
+    fill_values : dict, optional
+        Training median of each numerical feature and mode of each
+        categorical one, filled in for missing values before the scaler and
+        encoder (fill_values.json)
+    **components
+        Any of model, scaler, encoder, target_encoder, cluster_model,
+        umap_reducer, neighbor_index, persona_model, cluster_tables. Components without an array form (e.g. a UMAP
+        reducer or an unsupported model type) are stored as pickles.
+
+    Returns:
+    --------
+    The manifest dict
+    """
+    bundle_dir = Path(bundle_dir)
+    bundle_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'feature_names': list(feature_names) if feature_names is not None else None,
+        'fill_values': dict(fill_values) if fill_values is not None else None,
+        'components': {},
+    }
+    for name in BUNDLE_COMPONENTS:
+        obj = components.get(name)
+        if obj is not None:
+            manifest['components'][name] = _write_component(bundle_dir, name, obj)
+
+    with open(bundle_dir / MANIFEST_FILE, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def add_bundle_component(bundle_dir, name, obj):
+    """
+    Add (or replace) one component of an existing bundle, e.g. an index built after training.
+
+    Returns:
+    --------
+    The updated manifest dict
+    """
+    if name not in BUNDLE_COMPONENTS:
+        raise ValueError(f"Unknown bundle component '{name}' (expected one of {BUNDLE_COMPONENTS})")
+    bundle_dir = Path(bundle_dir)
+    manifest = read_manifest(bundle_dir)
+    manifest['components'][name] = _write_component(bundle_dir, name, obj)
+    with open(bundle_dir / MANIFEST_FILE, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# ============================================================================
+# LOAD
+# ============================================================================
+
+def _load_arrays(bundle_dir, spec, mmap):
+    arrays = {}
+    for key, entry in spec['arrays'].items():
+        path = bundle_dir / entry['file']
+        array = np.load(path, mmap_mode='r' if mmap else None, allow_pickle=False)
+        if list(array.shape) != entry['shape'] or str(array.dtype) != entry['dtype']:
+            raise ValueError(f"{entry['file']} is {array.dtype}{list(array.shape)}, "
+                             f"manifest says {entry['dtype']}{entry['shape']}")
+        arrays[key] = array
+    return arrays
+
+
+def _build_component(bundle_dir, spec, mmap):
+    kind = spec['kind']
+    if kind == 'pickle':
+        with open(bundle_dir / spec['file'], 'rb') as f:
+            return pickle.load(f)
+    arrays = _load_arrays(bundle_dir, spec, mmap)
+    if kind == 'tree_ensemble':
+        attributes = {key: spec[key] for key in ('max_depth', 'aggregation', 'link', 'input_dtype', 'sigmoid_scale')}
+        return TreeEnsemble(**arrays, **attributes)
+    if kind == 'scaler':
+        return ArrayScaler(spec['method'], feature_names_in=spec['feature_names_in'], **arrays)
+    if kind == 'one_hot':
+        categories = [arrays[f"categories_{j}"] for j in range(spec['n_columns'])]
+        return ArrayOneHotEncoder(categories, spec['drop_idx'], spec['feature_names_in'])
+    if kind == 'label_encoder':
+        return ArrayLabelEncoder(arrays['classes'])
+    if kind == 'kmeans':
+        return ArrayKMeans(arrays['cluster_centers'])
+    if kind == 'kd_tree':
+        return KDTreeIndex(**arrays, leaf_size=spec['leaf_size'])
+    if kind == 'persona':
+        return PersonaModel.from_arrays(arrays, spec['columns'], spec['n_neighbors'], spec['local_connectivity'],
+                                        spec['leaf_size'])
+    if kind == 'cluster_tables':
+        return ClusterFeatureTables(**arrays, columns=spec['columns'])
+    raise ValueError(f"Unknown component kind '{kind}'")
+
+
+def read_manifest(bundle_dir=DEFAULT_BUNDLE_DIR):
+    """The bundle's manifest.json (raises ArtifactLoadError naming the manifest if unreadable)."""
+    path = Path(bundle_dir) / MANIFEST_FILE
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ArtifactLoadError('manifest', path, e) from e
+    if manifest.get('format_version') != BUNDLE_FORMAT_VERSION:
+        raise ArtifactLoadError('manifest', path, f"unsupported format_version {manifest.get('format_version')}")
+    return manifest
+
+
+def load_model_bundle(bundle_dir=DEFAULT_BUNDLE_DIR, components=None, mmap=True, timings=None):
+    """
+    Load a bundle, memory-mapping its arrays.
+
+    Parameters:
+    -----------
+    bundle_dir : str
+        Directory written by save_model_bundle
+    components : list, optional
+        Components to load (default: all in the manifest)
+    mmap : bool
+        Memory-map the arrays read-only (False reads them into memory)
+    timings : dict, optional
+        Filled with the load time of each component, in seconds
+
+    Returns:
+    --------
+    dict with 'feature_names', 'fill_values' and one entry per loaded component
+
+    Raises:
+    -------
+    ArtifactLoadError naming the component that failed
+    """
+    bundle_dir = Path(bundle_dir)
+    manifest = read_manifest(bundle_dir)
+    loaded = {'feature_names': manifest['feature_names'], 'fill_values': manifest.get('fill_values')}
+    for name, spec in manifest['components'].items():
+        if components is not None and name not in components:
+            continue
+        start = time.perf_counter()
+        try:
+            loaded[name] = _build_component(bundle_dir, spec, mmap)
+        except Exception as e:
+            raise ArtifactLoadError(name, bundle_dir / spec.get('file', ''), e) from e
+        if timings is not None:
+            timings[name] = time.perf_counter() - start
+    if components is not None:
+        missing = [name for name in components if name not in loaded]
+        if missing:
+            raise ArtifactLoadError(missing[0], bundle_dir / MANIFEST_FILE, "not in the bundle")
+    return loaded
@@ -0,0 +1,161 @@
+"""
+Feature build sharded by module presentation across a process pool.
+
+The expensive part of the pipeline is turning the studentVle click log into
+clicks per student x presentation x activity_type. courses.csv lists the
+independent code_module / code_presentation pairs, so every worker loads only
+its own presentation's click rows (a filtered read of the Parquet cache),
+aggregates them and writes the result as one shard file. The shards are then
+concatenated in a fixed order and sorted exactly like the single-process
+groupby, and the per-student summary (which spans a student's presentations)
+runs once on the small reduced tables.
+
+Usage:
+    python parallel_build.py --data-dir . --workers 32 --output features.parquet
+
+    from parallel_build import build_features_parallel
+    features = build_features_parallel(data_dir='.', n_workers=32)
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from data_cache import DEFAULT_CACHE_DIR, OULAD_SCHEMAS, ensure_cache, load_oulad_tables, load_table, pq
+from feature_engineering import PRESENTATION_KEYS, aggregate_student_vle, build_features
+
+# Shard files go to <cache_dir>/shards unless a shard_dir is given
+SHARD_SUBDIR = 'shards'
+
+
+def presentation_shards(courses):
+    """Sorted (code_module, code_presentation) pairs, one shard each."""
+    pairs = courses[['code_module', 'code_presentation']].astype(str).drop_duplicates()
+    return sorted(map(tuple, pairs.to_numpy()))
+
+
+def shard_path(shard_dir, shard):
+    """File holding the click aggregate of one (code_module, code_presentation) shard."""
+    suffix = '.parquet' if pq is not None else '.pkl'
+    return Path(shard_dir) / f"{shard[0]}_{shard[1]}{suffix}"
+
+
+def build_click_shard(shard, data_dir='.', cache_dir=None, shard_dir=None):
+    """
+    Aggregate one presentation's click log and write it to its shard file (runs in a worker).
+
+    Returns:
+    --------
+    dict with the shard, its output path, input click rows and output rows
+    """
+    filters = {'code_module': shard[0], 'code_presentation': shard[1]}
+    student_vle = load_table('studentVle', data_dir=data_dir, cache_dir=cache_dir, filters=filters)
+    vle = load_table('vle', data_dir=data_dir, cache_dir=cache_dir, filters=filters)
+    grouped = aggregate_student_vle(student_vle, vle)
+
+    path = shard_path(shard_dir, shard)
+    if pq is not None:
+        grouped.to_parquet(path, index=False)
+    else:
+        grouped.to_pickle(path)
+    return {'shard': shard, 'path': str(path), 'click_rows': len(student_vle), 'rows': len(grouped)}
+
+
+def _read_shard(path):
+    return pd.read_parquet(path) if str(path).endswith('.parquet') else pd.read_pickle(path)
+
+
+def concat_click_shards(paths):
+    """
+    Concatenate shard files in the given order and sort like the single-process groupby.
+
+    Category dtypes are unified across shards first, so the result has the
+    same dtypes as aggregate_student_vle on the whole log.
+    """
+    frames = [_read_shard(path) for path in paths]
+    if not frames:
+        return pd.DataFrame(columns=PRESENTATION_KEYS + ['activity_type', 'sum', 'count'])
+    for col in ('code_module', 'code_presentation', 'activity_type'):
+        categories = sorted(set().union(*(frame[col].astype(str).unique() for frame in frames)))
+        for frame in frames:
+            frame[col] = pd.Categorical(frame[col].astype(str), categories=categories)
+    grouped = pd.concat(frames, ignore_index=True)
+    return grouped.sort_values(PRESENTATION_KEYS + ['activity_type'], kind='stable').reset_index(drop=True)
+
+
+def build_features_parallel(data_dir='.', cache_dir=None, shard_dir=None, n_workers=None, with_target=False):
+    """
+    build_features with the click-log aggregation sharded by presentation over ``n_workers`` processes.
+
+    Parameters:
+    -----------
+    data_dir : str
+        Directory containing the OULAD CSV files
+    cache_dir : str, optional
+        Directory for the Parquet cache (default: <data_dir>/.oulad_cache)
+    shard_dir : str, optional
+        Where the per-presentation shard files are written (default: <cache_dir>/shards)
+    n_workers : int, optional
+        Worker processes (default: os.cpu_count())
+    with_target : bool
+        Append the final_result column
+
+    Returns:
+    --------
+    Same DataFrame as feature_engineering.build_features
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    cache_dir = Path(cache_dir) if cache_dir is not None else Path(data_dir) / DEFAULT_CACHE_DIR
+    shard_dir = Path(shard_dir) if shard_dir is not None else cache_dir / SHARD_SUBDIR
+    shard_dir.mkdir(parents=True, exist_ok=True)
+
+    # Build / validate the cache once here, not concurrently in every worker
+    if pq is not None:
+        for name in ('studentVle', 'vle'):
+            ensure_cache(name, data_dir=data_dir, cache_dir=cache_dir)
+
+    tables = load_oulad_tables(data_dir=data_dir, cache_dir=cache_dir,
+                               tables=[name for name in OULAD_SCHEMAS if name != 'studentVle'])
+    shards = presentation_shards(tables['courses'])
+
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        results = list(pool.map(
+            build_click_shard, shards,
+            [data_dir] * len(shards), [cache_dir] * len(shards), [shard_dir] * len(shards),
+        ))
+    click_rows = sum(result['click_rows'] for result in results)
+    print(f"✅ {len(shards)} presentation shards, {click_rows:,} click rows, "
+          f"{n_workers} workers: {time.time() - start:.1f}s")
+
+    grouped_student_interaction = concat_click_shards([result['path'] for result in results])
+    return build_features(tables, grouped_student_interaction=grouped_student_interaction, with_target=with_target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the model features with a process pool, one shard per presentation.')
+    parser.add_argument('--data-dir', default='.', help='directory with the OULAD CSV files')
+    parser.add_argument('--cache-dir', default=None, help='Parquet cache directory (default: <data-dir>/.oulad_cache)')
+    parser.add_argument('--shard-dir', default=None, help='per-presentation shard files (default: <cache-dir>/shards)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--output', default='features.parquet', help='output file (.parquet or .csv)')
+    parser.add_argument('--with-target', action='store_true', help='include the final_result column')
+    args = parser.parse_args()
+
+    features = build_features_parallel(
+        data_dir=args.data_dir, cache_dir=args.cache_dir, shard_dir=args.shard_dir,
+        n_workers=args.workers, with_target=args.with_target,
+    )
+    if args.output.endswith('.csv'):
+        features.to_csv(args.output)
+    else:
+        features.to_parquet(args.output)
+    print(f"✅ Features written: {args.output} ({features.shape[0]:,} students x {features.shape[1]} columns)")
+
+
+if __name__ == '__main__':
+    main()
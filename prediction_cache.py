@@ -0,0 +1,218 @@
+"""
+Process-wide prediction cache for the Streamlit apps.
+
+Streamlit reruns the whole script on every widget change, and every session
+(browser tab) runs its own copy of it, so the same sidebar profile is scored
+again and again - in a classroom, dozens of advisors try the same example
+students. PredictionCache memoises the model output per student feature
+vector across reruns and sessions (share one instance through
+st.cache_resource):
+
+- keys are the canonicalised feature values (numerics rounded, NaN/inf
+  normalised, categoricals as strings), optionally snapped to a grid
+  (``quantize``) so nearby slider positions share an entry
+- least-recently-used entries are evicted beyond ``max_entries``
+- entries expire ``ttl_seconds`` after they were computed
+- every lookup carries the model version (inference.artifact_version); a new
+  version empties the cache, so re-saved artifacts never serve stale results
+- hits, misses, evictions and expirations are counted for a diagnostics panel
+
+Usage:
+    from prediction_cache import PredictionCache
+    cache = PredictionCache(max_entries=1024, ttl_seconds=3600, quantize={'score': 1.0})
+    probabilities = cache.get_or_compute(student_features, compute, version=artifact_version('.'))
+    cache.stats()
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+# Entries kept before the least recently used one is evicted
+CACHE_MAX_ENTRIES = 1024
+
+# Seconds an entry is served after it was computed
+CACHE_TTL_SECONDS = 3600
+
+# Numerical features are rounded to this many decimals in the key, so float
+# noise from the feature pipeline does not split identical profiles
+KEY_DECIMALS = 9
+
+
+def _canonical_value(value, step=None):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) or hasattr(value, 'dtype'):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return str(value)
+        if math.isnan(value):
+            return None
+        if math.isinf(value):
+            return value
+        if step:
+            value = round(value / step) * step
+        # + 0.0 turns -0.0 into 0.0
+        return round(value, KEY_DECIMALS) + 0.0
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    return str(value)
+
+
+def quantize_features(features, quantize):
+    """
+    Snap numerical columns to a grid.
+
+    Parameters:
+    -----------
+    features : DataFrame
+    quantize : float or dict
+        One step for every numerical column, or {column: step}
+
+    Returns:
+    --------
+    Copy of features with the quantized columns replaced by their nearest grid value
+    """
+    steps = _steps(features, quantize)
+    if not steps:
+        return features
+    features = features.copy()
+    for col, step in steps.items():
+        features[col] = (features[col].astype('float64') / step).round() * step
+    return features
+
+
+def _steps(features, quantize):
+    if not quantize:
+        return {}
+    if isinstance(quantize, dict):
+        return {col: step for col, step in quantize.items() if step and col in features.columns}
+    numeric = features.select_dtypes('number').columns
+    return {col: quantize for col in numeric}
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU + TTL cache of per-student predictions, invalidated by model version.
+
+    Parameters:
+    -----------
+    max_entries : int
+        Entries kept before the least recently used is evicted
+    ttl_seconds : float or None
+        Seconds an entry stays valid (None: until evicted)
+    quantize : float or dict, optional
+        Grid for numerical features ({column: step}, or one step for all):
+        students whose values round to the same grid point share an entry,
+        and the prediction is computed on the snapped values so the result
+        does not depend on which of them was seen first
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS, quantize=None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.quantize = quantize
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def key(self, features):
+        """Canonical, hashable key for a one-row feature frame."""
+        if len(features) != 1:
+            raise ValueError(f"Expected one student per lookup, got {len(features)} rows")
+        steps = _steps(features, self.quantize)
+        values = features.iloc[0].tolist()
+        return tuple(sorted((col, _canonical_value(value, steps.get(col)))
+                            for col, value in zip(features.columns, values)))
+
+    def _check_version(self, version):
+        # Caller holds the lock
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.version = version
+
+    def get(self, features, version=None):
+        """Cached result for this student and model version, or None (counted as a miss)."""
+        key = self.key(features)
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                    del self._entries[key]
+                    self.expirations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, features, value, version=None):
+        key = self.key(features)
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, features, compute, version=None):
+        """
+        Cached result for a one-row feature frame, computing and storing it on a miss.
+
+        Parameters:
+        -----------
+        features : DataFrame
+            One student (build_student_features output)
+        compute : callable
+            compute(features) -> result, called on the (quantized) features on a miss
+        version : hashable
+            Model version the result belongs to (inference.artifact_version)
+
+        Returns:
+        --------
+        The result; a dict result is returned as a copy, so callers may modify it
+        """
+        value = self.get(features, version)
+        if value is None:
+            # Two sessions missing on the same key at once both compute it;
+            # the model is deterministic, so the second put just refreshes the entry
+            value = compute(quantize_features(features, self.quantize))
+            self.put(features, value, version)
+        return dict(value) if isinstance(value, dict) else value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for the diagnostics panel."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'version': self.version,
+            }
@@ -15,6 +15,7 @@ Usage:
        # - encoder (OneHotEncoder)
        # - original_features (list of feature names)
        # - target_encoder (LabelEncoder for target variable)
+       # - fill_values (training medians / modes, built in the preprocessing cell)
        
        save_model_artifacts(
            model=best_model,  # or your trained model variable
@@ -22,8 +23,11 @@ Usage:
            encoder=encoder,
            feature_names=original_features,
            target_encoder=target_encoder,
+           fill_values=fill_values,
            cluster_model=None,  # optional: your KMeans model if you want cluster predictions
-           umap_reducer=None    # optional: your UMAP model if you want embeddings
+           umap_reducer=None,   # optional: your UMAP model if you want embeddings
+           cluster_features=None,  # optional: the columns UMAP was fitted on (result['features'])
+           cluster_tables=None     # optional: cluster_features.build_cluster_feature_tables(...)
        )
     
     2. Run the Streamlit app:
@@ -34,6 +38,8 @@ import pickle
 import json
 from pathlib import Path
 
+from model_bundle import DEFAULT_BUNDLE_DIR, save_model_bundle
+
 def save_model_artifacts(
     model,
     scaler,
@@ -42,7 +48,11 @@ def save_model_artifacts(
     target_encoder,
     cluster_model=None,
     umap_reducer=None,
-    output_dir="."
+    cluster_features=None,
+    cluster_tables=None,
+    output_dir=".",
+    bundle=True,
+    fill_values=None
 ):
     """
     Save all model artifacts needed for the Streamlit app.
@@ -63,8 +73,21 @@ def save_model_artifacts(
         Trained clustering model for student personas
     umap_reducer : UMAP, optional
         Fitted UMAP reducer for dimensionality reduction
+    cluster_features : list, optional
+        Columns the UMAP reducer was fitted on, in order. With cluster_model
+        and umap_reducer, the bundle also gets the persona model the apps use
+        to assign personas without running UMAP (see persona.py)
+    cluster_tables : ClusterFeatureTables, optional
+        Per-cluster tables for serving the cell 36 cluster-relative features
+        (see cluster_features.py); stored in the bundle only
     output_dir : str
         Directory to save the artifacts
+    bundle : bool
+        Also write the memory-mappable model_bundle/ directory (see model_bundle.py)
+    fill_values : dict, optional
+        Training median of each numerical feature and mode of each categorical
+        one (what the notebook fills missing values with before scaling and
+        encoding); inference fills the same values in
     """
     
     output_path = Path(output_dir)
@@ -97,6 +120,14 @@ def save_model_artifacts(
         json.dump(feature_names, f, indent=2)
     print("✅ Saved feature_names.json")
     
+    # Save the training fill values
+    if fill_values is not None:
+        fill_values = {str(col): value.item() if hasattr(value, 'item') else value
+                       for col, value in dict(fill_values).items()}
+        with open(output_path / 'fill_values.json', 'w') as f:
+            json.dump(fill_values, f, indent=2)
+        print("✅ Saved fill_values.json")
+    
     # Save optional models
     if cluster_model is not None:
         with open(output_path / 'cluster_model.pkl', 'wb') as f:
@@ -108,6 +139,28 @@ def save_model_artifacts(
             pickle.dump(umap_reducer, f)
         print("✅ Saved umap_reducer.pkl")
     
+    # Save the memory-mappable bundle (numeric arrays behind a manifest)
+    if bundle:
+        persona_model = None
+        if cluster_model is not None and umap_reducer is not None and cluster_features is not None:
+            from persona import PersonaModel
+            persona_model = PersonaModel.from_umap(umap_reducer, cluster_model, cluster_features)
+        manifest = save_model_bundle(
+            output_path / DEFAULT_BUNDLE_DIR,
+            feature_names=feature_names,
+            fill_values=fill_values,
+            model=model,
+            scaler=scaler,
+            encoder=encoder,
+            target_encoder=target_encoder,
+            cluster_model=cluster_model,
+            umap_reducer=umap_reducer,
+            persona_model=persona_model,
+            cluster_tables=cluster_tables,
+        )
+        pickled = [name for name, spec in manifest['components'].items() if spec['kind'] == 'pickle']
+        print(f"✅ Saved {DEFAULT_BUNDLE_DIR}/" + (f" (pickled, no array form: {', '.join(pickled)})" if pickled else ""))
+    
     # Save metadata
     metadata = {
         'model_type': type(model).__name__,
@@ -116,7 +169,9 @@ def save_model_artifacts(
         'n_features': len(feature_names),
         'target_classes': target_encoder.classes_.tolist() if hasattr(target_encoder, 'classes_') else None,
         'has_cluster_model': cluster_model is not None,
-        'has_umap_reducer': umap_reducer is not None
+        'has_umap_reducer': umap_reducer is not None,
+        'cluster_features': list(cluster_features) if cluster_features is not None else None,
+        'has_bundle': bundle
     }
     
     with open(output_path / 'metadata.json', 'w') as f:
@@ -131,11 +186,15 @@ def save_model_artifacts(
     print("   - encoder.pkl (categorical encoder)")
     print("   - target_encoder.pkl (target variable encoder)")
     print("   - feature_names.json (feature names)")
+    if fill_values is not None:
+        print("   - fill_values.json (training medians and modes)")
     print("   - metadata.json (model metadata)")
     if cluster_model is not None:
         print("   - cluster_model.pkl (clustering model)")
     if umap_reducer is not None:
         print("   - umap_reducer.pkl (UMAP reducer)")
+    if bundle:
+        print(f"   - {DEFAULT_BUNDLE_DIR}/ (memory-mappable bundle of the above)")
     
     print("\n🚀 You can now run: streamlit run app.py")
 
@@ -159,7 +218,9 @@ if __name__ == "__main__":
         encoder=encoder,  # Your OneHotEncoder
         feature_names=original_features,  # or selected_cluster_features
         target_encoder=target_encoder,  # Your LabelEncoder for final_result
+        fill_values=fill_values,  # Training medians / modes from the preprocessing cell
         cluster_model=kmeans,  # Your best KMeans model from UMAP analysis
-        umap_reducer=umap_reducer  # Your UMAP model
+        umap_reducer=umap_reducer,  # Your UMAP model
+        cluster_features=result['features']  # The columns that UMAP model was fitted on
     )
     """)
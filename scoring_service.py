@@ -0,0 +1,363 @@
+"""
+Standalone HTTP scoring service with request micro-batching.
+
+Loads the artifacts written by save_model.save_model_artifacts once
+(inference.load_inference_core, which memory-maps model_bundle/ when saved)
+and serves predictions over plain HTTP/1.1 built on asyncio streams, with no
+web framework needed. Concurrent requests are
+queued and coalesced into micro-batches of at most ``max_batch_size``
+students, waiting at most ``max_wait_ms`` for a batch to fill. Each batch
+costs one predict_proba call, which runs in a worker thread so the event
+loop keeps accepting requests in the meantime.
+
+Endpoints:
+    POST /predict   JSON body: one feature object or a list of them
+                    (the NUMERICAL_FEATURES and CATEGORICAL_FEATURES keys)
+                    -> {"predictions": [{"predicted_outcome": ..., "probabilities": {...}}, ...]}
+    GET  /metrics   request count, p50/p99 latency (ms), batch count and mean batch size
+    GET  /health    {"status": "ok"}
+
+Usage:
+    python scoring_service.py --artifact-dir . --port 8502 --max-batch-size 64 --max-wait-ms 5
+
+    curl -X POST localhost:8502/predict -d @student.json
+    curl localhost:8502/metrics
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import numpy as np
+import pandas as pd
+
+from inference import load_inference_core
+
+DEFAULT_PORT = 8502
+MAX_BATCH_SIZE = 64
+MAX_WAIT_MS = 5.0
+
+# Latencies kept for the percentiles (most recent requests)
+LATENCY_WINDOW = 10_000
+
+# Largest request body accepted (bytes)
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+
+class LatencyStats:
+    """Rolling window of request latencies with p50/p99 and batch counters."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.latencies_ms = deque(maxlen=window)
+        self.requests = 0
+        self.batches = 0
+        self.batched_rows = 0
+
+    def record_request(self, seconds):
+        self.latencies_ms.append(seconds * 1000)
+        self.requests += 1
+
+    def record_batch(self, size):
+        self.batches += 1
+        self.batched_rows += size
+
+    def summary(self):
+        latencies = np.fromiter(self.latencies_ms, dtype=np.float64)
+        p50, p99 = np.percentile(latencies, [50, 99]) if len(latencies) else (None, None)
+        return {
+            'requests': self.requests,
+            'latency_ms': {
+                'p50': None if p50 is None else round(float(p50), 3),
+                'p99': None if p99 is None else round(float(p99), 3),
+                'window': len(latencies),
+            },
+            'batches': self.batches,
+            'mean_batch_size': round(self.batched_rows / self.batches, 2) if self.batches else None,
+        }
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrently submitted feature rows into batched predict_proba calls.
+
+    Parameters:
+    -----------
+    core : InferenceCore
+    max_batch_size : int
+        Most students scored in one predict_proba call (a single larger
+        request is still scored whole, on its own)
+    max_wait_ms : float
+        How long the first request of a batch waits for others to join
+    max_concurrent_batches : int
+        Batches scored at the same time (one per inference thread); while
+        all are busy, new requests queue up and form the next, larger batch
+    executor : Executor, optional
+        Where predict_proba runs (default: max_concurrent_batches threads)
+    stats : LatencyStats, optional
+    """
+
+    def __init__(self, core, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 max_concurrent_batches=1, executor=None, stats=None):
+        self.core = core
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrent_batches = max_concurrent_batches
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_concurrent_batches)
+        self.stats = stats or LatencyStats()
+        self._queue = asyncio.Queue()
+        self._carry = None
+        self._scoring = set()
+
+    async def submit(self, rows):
+        """Queue a request's feature rows and wait for their predictions."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((rows, future))
+        return await future
+
+    async def _next_item(self, timeout=None):
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        if timeout is None:
+            return await self._queue.get()
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    async def _collect_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._next_item()]
+        size = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - loop.time()
+            try:
+                item = self._queue.get_nowait() if remaining <= 0 else await self._next_item(remaining)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if size + len(item[0]) > self.max_batch_size:
+                self._carry = item
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch, size
+
+    async def _score(self, batch, size, slots):
+        """Score one batch off the event loop and resolve its waiting requests."""
+        try:
+            frame = pd.DataFrame.from_records([row for rows, _ in batch for row in rows])
+            probabilities = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.core.predict_proba, frame
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            slots.release()
+        self.stats.record_batch(size)
+
+        labels = np.asarray(self.core.classes, dtype=object)[probabilities.argmax(axis=1)]
+        offset = 0
+        for rows, future in batch:
+            predictions = [
+                {
+                    'predicted_outcome': labels[i],
+                    'probabilities': dict(zip(self.core.classes, probabilities[i].tolist())),
+                }
+                for i in range(offset, offset + len(rows))
+            ]
+            offset += len(rows)
+            if not future.done():
+                future.set_result(predictions)
+
+    async def run(self):
+        """Batching loop: wait for a free scoring slot, collect a batch, hand it to a scoring task."""
+        slots = asyncio.Semaphore(self.max_concurrent_batches)
+        while True:
+            await slots.acquire()
+            batch, size = await self._collect_batch()
+            task = asyncio.ensure_future(self._score(batch, size, slots))
+            self._scoring.add(task)
+            task.add_done_callback(self._scoring.discard)
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and not math.isfinite(value))
+
+
+def parse_feature_payload(body, numerical_columns, categorical_columns, fill_values=None):
+    """
+    Feature rows from a /predict request body.
+
+    Rows are validated here, per request, so one bad request cannot fail
+    the micro-batch it would have joined. A feature may be null (or NaN /
+    Infinity) only if it has a training fill value (InferenceCore.fill_values).
+
+    Raises:
+    -------
+    ValueError if the body is not a feature object / list of feature objects,
+    a row lacks a feature, a numerical feature is not a number (or null), or
+    a feature is null with no fill value to replace it
+    """
+    payload = json.loads(body)
+    rows = payload if isinstance(payload, list) else [payload]
+    if not rows or not all(isinstance(row, dict) for row in rows):
+        raise ValueError("Expected a feature object or a non-empty list of feature objects")
+    for i, row in enumerate(rows):
+        missing = [col for col in numerical_columns + categorical_columns if col not in row]
+        if missing:
+            raise ValueError(f"Row {i} is missing features: {missing}")
+        not_numbers = [
+            col for col in numerical_columns
+            if row[col] is not None and (isinstance(row[col], bool) or not isinstance(row[col], (int, float)))
+        ]
+        if not_numbers:
+            raise ValueError(f"Row {i} has non-numeric values for: {not_numbers}")
+        unfilled = [
+            col for col in numerical_columns + categorical_columns
+            if _is_missing(row[col]) and col not in (fill_values or {})
+        ]
+        if unfilled:
+            raise ValueError(f"Row {i} has missing values with no training fill value for: {unfilled}")
+    return rows
+
+
+async def _read_request(reader):
+    """(method, path, headers, body) of the next request on the connection, or None when it closes."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise ValueError(f"Request body over {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b''
+    return method, path.split('?', 1)[0], headers, body
+
+
+def _write_response(writer, status, payload, keep_alive):
+    body = json.dumps(payload).encode()
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode('latin-1') + body)
+
+
+class ScoringService:
+    """
+    HTTP front end of a MicroBatcher.
+
+    Parameters:
+    -----------
+    core : InferenceCore
+    max_batch_size : int
+    max_wait_ms : float
+    inference_threads : int
+        Threads running predict_proba, i.e. batches scored at the same time
+    """
+
+    def __init__(self, core, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, inference_threads=1):
+        self.core = core
+        self.stats = LatencyStats()
+        self.batcher = MicroBatcher(
+            core, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+            max_concurrent_batches=inference_threads, stats=self.stats,
+        )
+        self.inference_threads = inference_threads
+
+    async def dispatch(self, method, path, body):
+        """(HTTPStatus, JSON payload) for one request."""
+        if path == '/predict' and method == 'POST':
+            start = time.perf_counter()
+            try:
+                rows = parse_feature_payload(body, self.core.numerical_columns, self.core.categorical_columns,
+                                             self.core.fill_values)
+            except ValueError as e:  # includes JSONDecodeError
+                return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+            try:
+                predictions = await self.batcher.submit(rows)
+            except ValueError as e:
+                return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+            except Exception as e:
+                return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(e).__name__}: {e}"}
+            self.stats.record_request(time.perf_counter() - start)
+            return HTTPStatus.OK, {'predictions': predictions}
+        if path == '/metrics' and method == 'GET':
+            return HTTPStatus.OK, self.stats.summary()
+        if path == '/health' and method == 'GET':
+            return HTTPStatus.OK, {'status': 'ok'}
+        return HTTPStatus.NOT_FOUND, {'error': f"No route for {method} {path}"}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except ValueError as e:
+                    _write_response(writer, HTTPStatus.BAD_REQUEST, {'error': str(e)}, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self.dispatch(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT):
+        """Run the batching loop and the HTTP server until cancelled."""
+        batching = asyncio.ensure_future(self.batcher.run())
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        print(f"✅ Scoring service on http://{host}:{port} "
+              f"(max batch {self.batcher.max_batch_size}, max wait {self.batcher.max_wait * 1000:g} ms, "
+              f"{self.inference_threads} inference thread(s))")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batching.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve model predictions over HTTP with request micro-batching.')
+    parser.add_argument('--artifact-dir', default='.', help='directory with model_bundle/ or model.pkl, scaler.pkl, encoder.pkl, feature_names.json')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE, help='most students per predict_proba call')
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS, help='how long a batch waits to fill')
+    parser.add_argument('--inference-threads', type=int, default=1, help='threads running predict_proba')
+    args = parser.parse_args()
+
+    core = load_inference_core(args.artifact_dir)
+    service = ScoringService(core, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                             inference_threads=args.inference_threads)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n👋 Scoring service stopped")
+
+
+if __name__ == '__main__':
+    main()
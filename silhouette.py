@@ -0,0 +1,216 @@
+"""
+Silhouette scores for large cohorts: exact in bounded memory, or estimated from a stratified sample.
+
+silhouette_score needs the distance from every student to every other one,
+which is quadratic in the number of students. Two evaluators replace it:
+
+- exact_silhouette: the same value, with distances computed for a block of
+  rows at a time (DISTANCE_BLOCK_BYTES) and summed per cluster straight
+  away, so memory stays bounded however many students there are. Time is
+  still quadratic.
+- sampled_silhouette: the exact silhouette of a stratified sample of
+  students (each compared against every student, not just the sample),
+  with clusters as strata. The stratified mean estimates the full-cohort
+  score without bias, and the reported interval comes from its standard
+  error. Time is linear in the number of students.
+
+evaluate_silhouette picks the sampled mode above SAMPLE_ABOVE_ROWS students;
+umap_sweep uses it for every k.
+
+Usage:
+    from silhouette import evaluate_silhouette
+    report = evaluate_silhouette(embedding, labels)
+    report['silhouette'], report['ci_low'], report['ci_high']
+"""
+
+import numpy as np
+
+# Distance block held in memory at a time
+DISTANCE_BLOCK_BYTES = 64 * 1024 ** 2
+
+# evaluate_silhouette switches to the sampled estimate above this many rows
+SAMPLE_ABOVE_ROWS = 20_000
+
+# Students drawn for the sampled estimate, and the least drawn from any cluster
+SAMPLE_SIZE = 5_000
+MIN_PER_CLUSTER = 2
+
+CONFIDENCE = 0.95
+
+
+def _normal_quantile(confidence):
+    """Two-sided standard normal quantile (1.96 for 0.95)."""
+    from statistics import NormalDist
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def silhouette_samples_blocked(X, labels, rows=None, block_bytes=DISTANCE_BLOCK_BYTES):
+    """
+    Silhouette coefficient of ``rows`` (default: every row) against the whole data set.
+
+    Matches sklearn's silhouette_samples (euclidean): 0 for students alone in
+    their cluster.
+
+    Parameters:
+    -----------
+    X : array (n_rows, n_dims)
+    labels : array (n_rows,)
+    rows : array of int, optional
+        Rows to score
+    block_bytes : int
+        Size of the distance block computed at once
+
+    Returns:
+    --------
+    array (len(rows),)
+    """
+    X = np.asarray(X, dtype=np.float64)
+    _, codes = np.unique(np.asarray(labels), return_inverse=True)
+    n_rows = len(X)
+    counts = np.bincount(codes).astype(np.float64)
+    if not 2 <= len(counts) <= n_rows - 1:
+        raise ValueError(f"Number of labels is {len(counts)}. Valid values are 2 to n_samples - 1 (inclusive)")
+    rows = np.arange(n_rows) if rows is None else np.asarray(rows)
+
+    members = np.zeros((n_rows, len(counts)))
+    members[np.arange(n_rows), codes] = 1.0
+    squared_norms = (X ** 2).sum(axis=1)
+    block = max(1, int(block_bytes // (8 * n_rows)))
+
+    scores = np.empty(len(rows))
+    for start in range(0, len(rows), block):
+        batch = rows[start:start + block]
+        positions = np.arange(len(batch))
+        distances = squared_norms[batch, None] + squared_norms[None, :] - 2 * (X[batch] @ X.T)
+        np.maximum(distances, 0, out=distances)
+        distances[positions, batch] = 0.0
+        np.sqrt(distances, out=distances)
+        # Summed distance to each cluster
+        totals = distances @ members
+
+        own = codes[batch]
+        own_size = counts[own] - 1
+        intra = totals[positions, own] / np.maximum(own_size, 1)
+        totals[positions, own] = np.inf
+        inter = (totals / counts).min(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            batch_scores = (inter - intra) / np.maximum(intra, inter)
+        scores[start:start + len(batch)] = np.where(own_size > 0, np.nan_to_num(batch_scores), 0.0)
+    return scores
+
+
+def exact_silhouette(X, labels, block_bytes=DISTANCE_BLOCK_BYTES):
+    """Mean silhouette over every row (silhouette_score), in blocks of ``block_bytes``."""
+    return float(silhouette_samples_blocked(X, labels, block_bytes=block_bytes).mean())
+
+
+def stratified_sample(labels, sample_size, random_state=None, min_per_cluster=MIN_PER_CLUSTER):
+    """
+    Rows drawn from each cluster in proportion to its size.
+
+    Returns:
+    --------
+    dict mapping cluster label -> sorted row numbers
+    """
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(random_state)
+    clusters, codes, counts = np.unique(labels, return_inverse=True, return_counts=True)
+
+    # Proportional allocation, largest remainders first, at least min_per_cluster each
+    quota = counts * sample_size / len(labels)
+    allocation = np.floor(quota).astype(int)
+    leftover = sample_size - allocation.sum()
+    if leftover > 0:
+        allocation[np.argsort(allocation - quota, kind='stable')[:leftover]] += 1
+    allocation = np.minimum(np.maximum(allocation, min_per_cluster), counts)
+
+    return {
+        cluster: np.sort(rng.choice(np.flatnonzero(codes == i), size=allocation[i], replace=False))
+        for i, cluster in enumerate(clusters)
+    }
+
+
+def sampled_silhouette(X, labels, sample_size=SAMPLE_SIZE, random_state=None, confidence=CONFIDENCE,
+                       block_bytes=DISTANCE_BLOCK_BYTES):
+    """
+    Stratified estimate of the mean silhouette with a confidence interval.
+
+    Parameters:
+    -----------
+    X : array (n_rows, n_dims)
+    labels : array (n_rows,)
+    sample_size : int
+        Students to score (each against all n_rows)
+    random_state : int, optional
+    confidence : float
+        Coverage of the reported interval
+
+    Returns:
+    --------
+    dict with silhouette (the estimate), std_error, ci_low, ci_high,
+    confidence, sample_size, rows and mode ('sampled')
+    """
+    labels = np.asarray(labels)
+    n_rows = len(labels)
+    strata = stratified_sample(labels, min(sample_size, n_rows), random_state=random_state)
+    rows = np.concatenate(list(strata.values()))
+    scores = silhouette_samples_blocked(X, labels, rows=rows, block_bytes=block_bytes)
+
+    estimate, variance, offset = 0.0, 0.0, 0
+    for cluster, members in strata.items():
+        stratum = scores[offset:offset + len(members)]
+        offset += len(members)
+        weight = (labels == cluster).sum() / n_rows
+        estimate += weight * stratum.mean()
+        if len(stratum) > 1:
+            # Finite population correction: a fully sampled cluster adds no uncertainty
+            fraction = len(stratum) / (labels == cluster).sum()
+            variance += weight ** 2 * (1 - fraction) * stratum.var(ddof=1) / len(stratum)
+
+    std_error = float(np.sqrt(variance))
+    margin = _normal_quantile(confidence) * std_error
+    return {
+        'silhouette': float(estimate),
+        'std_error': std_error,
+        'ci_low': float(estimate - margin),
+        'ci_high': float(estimate + margin),
+        'confidence': confidence,
+        'sample_size': len(rows),
+        'rows': n_rows,
+        'mode': 'sampled',
+    }
+
+
+def evaluate_silhouette(X, labels, mode='auto', sample_above=SAMPLE_ABOVE_ROWS, sample_size=SAMPLE_SIZE,
+                        random_state=None, confidence=CONFIDENCE, block_bytes=DISTANCE_BLOCK_BYTES):
+    """
+    Mean silhouette, exact or sampled.
+
+    Parameters:
+    -----------
+    mode : str
+        'exact', 'sampled', or 'auto' (sampled above ``sample_above`` rows)
+
+    Returns:
+    --------
+    dict with the keys of sampled_silhouette; an exact score has std_error 0
+    and an interval of just the score
+    """
+    if mode not in ('auto', 'exact', 'sampled'):
+        raise ValueError(f"Unknown silhouette mode '{mode}'. Expected 'auto', 'exact' or 'sampled'")
+    n_rows = len(labels)
+    if mode == 'sampled' or (mode == 'auto' and n_rows > sample_above):
+        return sampled_silhouette(X, labels, sample_size=sample_size, random_state=random_state,
+                                  confidence=confidence, block_bytes=block_bytes)
+
+    score = exact_silhouette(X, labels, block_bytes=block_bytes)
+    return {
+        'silhouette': score,
+        'std_error': 0.0,
+        'ci_low': score,
+        'ci_high': score,
+        'confidence': confidence,
+        'sample_size': n_rows,
+        'rows': n_rows,
+        'mode': 'exact',
+    }
@@ -0,0 +1,191 @@
+"""
+Cold-start instrumentation and background warm-up for the Streamlit apps.
+
+A freshly started server process pays for its heavy imports (plotly, the
+model library pulled in by unpickling) and for loading the model artifacts.
+Done on demand, all of it lands on the first user to press Predict. The apps
+instead start an ArtifactWarmer on their first script run: a daemon thread
+that imports the deferred modules, loads the artifacts
+(inference.load_inference_core) and scores one placeholder student, while
+the page renders and the user fills in the form. The readiness indicator
+reads ArtifactWarmer.status.
+
+Every step is timed into a process-wide StartupReport (STARTUP), broken
+down by import, artifact and warm-up; the apps show it in their
+diagnostics panel.
+
+Usage:
+    python startup.py --artifact-dir .                # measure a cold start in a fresh process
+
+    from startup import STARTUP, ArtifactWarmer
+    warmer = ArtifactWarmer('.').start()
+    warmer.status                                     # 'loading', 'ready' or 'failed'
+    core = warmer.result()                            # waits for the load; re-raises its error
+    print(STARTUP.format())
+"""
+
+import argparse
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Imported by the apps at the top of the script (needed for the first render)
+APP_IMPORTS = ('streamlit', 'numpy', 'pandas', 'feature_engineering')
+
+# Only needed once a prediction is shown; imported by the warm-up thread
+DEFERRED_IMPORTS = ('plotly.graph_objects', 'plotly.express')
+
+
+class StartupReport:
+    """Thread-safe record of timed startup steps: (kind, name, seconds)."""
+
+    def __init__(self):
+        self.steps = []
+        self._lock = threading.Lock()
+
+    def record(self, kind, name, seconds):
+        with self._lock:
+            self.steps.append((kind, name, seconds))
+
+    @contextmanager
+    def measure(self, kind, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(kind, name, time.perf_counter() - start)
+
+    def import_module(self, name):
+        """Import a module, timing it unless this process has already imported it."""
+        if name in sys.modules:
+            return sys.modules[name]
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        self.record('import', name, time.perf_counter() - start)
+        return module
+
+    def total(self, kind=None):
+        with self._lock:
+            return sum(seconds for step_kind, _, seconds in self.steps if kind is None or step_kind == kind)
+
+    def rows(self):
+        """Steps as dicts (kind, name, seconds), in the order they finished."""
+        with self._lock:
+            return [{'kind': kind, 'name': name, 'seconds': seconds} for kind, name, seconds in self.steps]
+
+    def format(self):
+        rows = self.rows()
+        width = max([len(row['name']) for row in rows] + [10])
+        lines = [f"{row['kind']:<8} {row['name']:<{width}} {row['seconds'] * 1000:>9.1f} ms" for row in rows]
+        for kind in ('import', 'artifact', 'warm-up'):
+            lines.append(f"{'total':<8} {kind:<{width}} {self.total(kind) * 1000:>9.1f} ms")
+        return '\n'.join(lines)
+
+
+# Process-wide report: module globals live once per server process
+STARTUP = StartupReport()
+
+
+class ArtifactWarmer:
+    """
+    Loads the inference core in a background thread.
+
+    Parameters:
+    -----------
+    artifact_dir : str
+        Directory with model_bundle/ or the pickles from save_model.py
+    imports : tuple
+        Modules to import first (DEFERRED_IMPORTS: the charts shown with a prediction)
+    report : StartupReport
+        Where the import, artifact and warm-up times go
+    """
+
+    def __init__(self, artifact_dir='.', imports=DEFERRED_IMPORTS, report=STARTUP):
+        self.artifact_dir = artifact_dir
+        self.imports = imports
+        self.report = report
+        self.seconds = None
+        self._core = None
+        self._error = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='artifact-warmer', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            for name in self.imports:
+                try:
+                    self.report.import_module(name)
+                except ImportError:
+                    # Not installed here: the app reports it when it needs the module
+                    pass
+            inference = self.report.import_module('inference')
+            timings = {}
+            try:
+                self._core = inference.load_inference_core(self.artifact_dir, timings=timings)
+            finally:
+                for component, seconds in timings.items():
+                    self.report.record('artifact', component, seconds)
+            with self.report.measure('warm-up', 'first prediction'):
+                self._core.warm_up()
+        except Exception as e:
+            self._error = e
+        finally:
+            self.seconds = time.perf_counter() - start
+            self._done.set()
+
+    @property
+    def status(self):
+        if self._thread is None:
+            return 'not started'
+        if not self._done.is_set():
+            return 'loading'
+        return 'failed' if self._error is not None else 'ready'
+
+    def result(self, timeout=None):
+        """
+        The loaded InferenceCore, waiting up to ``timeout`` seconds (None: until loaded).
+
+        Raises the load error (ArtifactLoadError, ValueError, ...) if loading
+        failed, TimeoutError if it is still running.
+        """
+        self.start()
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Model artifacts still loading after {timeout}s")
+        if self._error is not None:
+            raise self._error
+        return self._core
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure a cold start: app imports, artifact loading and the first prediction.')
+    parser.add_argument('--artifact-dir', default='.', help='directory with model_bundle/ or the pickles from save_model.py')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for name in APP_IMPORTS:
+        try:
+            STARTUP.import_module(name)
+        except ImportError:
+            print(f"⚠️ {name} is not installed; skipped")
+    warmer = ArtifactWarmer(args.artifact_dir, imports=DEFERRED_IMPORTS)
+    try:
+        warmer.result()
+        print(f"✅ Model ready after {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        print(f"❌ Model failed to load: {e}")
+
+    print("\n📊 Startup time by step:")
+    print(STARTUP.format())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,407 @@
+"""
+Cached, parallel UMAP + KMeans sweep over the notebook's feature sets.
+
+Final.ipynb runs perform_umap_analysis for every entry of feature_sets one
+after another: a UMAP fit, then KMeans(n_init=10) and silhouette_score for
+each k. run_umap_sweep does the same work across a process pool and keeps
+every result on disk. Above silhouette.SAMPLE_ABOVE_ROWS students the
+silhouette is a stratified-sample estimate with a confidence interval
+instead of the quadratic exact score (silhouette.py):
+
+    <cache_dir>/<key>/manifest.json        features, UMAP parameters, data checksum
+    <cache_dir>/<key>/embedding.npy        UMAP embedding
+    <cache_dir>/<key>/umap_reducer.pkl     fitted reducer
+    <cache_dir>/<key>/kmeans_k<k>_seed<s>_init<n>[_sample<m>].npz   labels, silhouette, inertia
+
+The key is a hash of the feature list, the UMAP parameters, the seed and a
+checksum of the (median-filled) input rows, so a feature set whose data and
+parameters have not changed is never fitted again, and only the k values
+without a stored result are clustered. Feature-set fits and the k values of
+each embedding are fanned out over the same pool; a set's k values start as
+soon as its embedding is available.
+
+Usage:
+    python umap_sweep.py --features features.parquet --workers 4
+
+    from umap_sweep import run_umap_sweep
+    results = run_umap_sweep(final_data, feature_sets)   # same dicts as perform_umap_analysis
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_cache import frame_checksum
+from silhouette import SAMPLE_ABOVE_ROWS, SAMPLE_SIZE, evaluate_silhouette
+
+# Bump this when the cached layout or the fitting procedure changes
+SWEEP_CACHE_VERSION = 1
+
+DEFAULT_SWEEP_DIR = '.umap_sweep'
+
+# perform_umap_analysis defaults
+K_RANGE = range(2, 9)
+UMAP_PARAMS = {'n_neighbors': 15, 'min_dist': 0.1, 'n_components': 2}
+RANDOM_STATE = 42
+KMEANS_N_INIT = 10
+
+# The notebook's feature sets (cell 27), used by the command line
+DEFAULT_FEATURE_SETS = {
+    "1. Current (Fixed)": [
+        'assessment_engagement_score', 'weighted_engagement', 'engagement_trend',
+        'learning_pace', 'activity_diversity', 'engagement_cv',
+    ],
+    "2. Performance Focus": [
+        'score', 'score_per_weight', 'score_trend', 'score_momentum',
+        'submission_timeliness', 'banked_assessment_ratio', 'learning_pace',
+    ],
+    "3. Behavioral Patterns": [
+        'num_of_prev_attempts', 'studied_credits', 'days_since_registration',
+        'performance_by_registration', 'submission_timeliness', 'banked_assessment_ratio',
+    ],
+    "4. Comprehensive Mixed": [
+        'assessment_engagement_score', 'score', 'learning_pace', 'activity_diversity',
+        'submission_timeliness', 'num_of_prev_attempts', 'score_trend', 'engagement_cv',
+    ],
+}
+
+MANIFEST_FILE = 'manifest.json'
+EMBEDDING_FILE = 'embedding.npy'
+REDUCER_FILE = 'umap_reducer.pkl'
+
+
+def prepare_umap_input(data, features):
+    """The rows perform_umap_analysis embeds: the feature columns with missing values filled by the median."""
+    X = data[list(features)].copy()
+    if X.isnull().any().any():
+        X = X.fillna(X.median())
+    return X
+
+
+def embedding_key(features, umap_params, random_state, data_sha256):
+    """Cache key of one UMAP fit (the feature set's name is not part of it)."""
+    payload = {
+        'cache_version': SWEEP_CACHE_VERSION,
+        'features': list(features),
+        'umap_params': dict(sorted(umap_params.items())),
+        'random_state': random_state,
+        'data_sha256': data_sha256,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:20]
+
+
+def kmeans_file(k, random_state, n_init, sample_size=None):
+    suffix = f"_sample{sample_size}" if sample_size else ''
+    return f"kmeans_k{k}_seed{random_state}_init{n_init}{suffix}.npz"
+
+
+def _write_json(path, payload):
+    tmp_path = Path(f'{path}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_manifest(embedding_dir):
+    try:
+        with open(Path(embedding_dir) / MANIFEST_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def embedding_is_cached(embedding_dir):
+    """A fit is complete once its manifest exists (it is written last)."""
+    manifest = _read_manifest(embedding_dir)
+    return (manifest is not None and manifest.get('cache_version') == SWEEP_CACHE_VERSION
+            and (Path(embedding_dir) / EMBEDDING_FILE).exists())
+
+
+def fit_embedding(X, umap_params, random_state, embedding_dir, features, data_sha256):
+    """
+    Fit UMAP on ``X`` and store the embedding and reducer in ``embedding_dir`` (runs in a worker).
+
+    Returns:
+    --------
+    dict with the embedding directory, rows and fit seconds
+    """
+    import umap
+
+    embedding_dir = Path(embedding_dir)
+    embedding_dir.mkdir(parents=True, exist_ok=True)
+    start = time.time()
+    reducer = umap.UMAP(**umap_params, random_state=random_state, verbose=False)
+    embedding = reducer.fit_transform(X)
+    seconds = time.time() - start
+
+    tmp_path = embedding_dir / f'{EMBEDDING_FILE}.tmp.npy'
+    np.save(tmp_path, np.asarray(embedding))
+    os.replace(tmp_path, embedding_dir / EMBEDDING_FILE)
+    tmp_path = embedding_dir / f'{REDUCER_FILE}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(reducer, f)
+    os.replace(tmp_path, embedding_dir / REDUCER_FILE)
+    _write_json(embedding_dir / MANIFEST_FILE, {
+        'cache_version': SWEEP_CACHE_VERSION,
+        'features': list(features),
+        'umap_params': umap_params,
+        'random_state': random_state,
+        'data_sha256': data_sha256,
+        'rows': len(embedding),
+        'fit_seconds': seconds,
+    })
+    return {'embedding_dir': str(embedding_dir), 'rows': len(embedding), 'seconds': seconds}
+
+
+def cluster_embedding(embedding_dir, k, random_state, n_init, sample_size=None):
+    """
+    KMeans with ``k`` clusters and its silhouette score on a stored embedding (runs in a worker).
+
+    The silhouette is exact (computed in blocks), or with ``sample_size``
+    estimated from that many students, stratified by cluster.
+
+    Returns:
+    --------
+    dict with the embedding directory, k and seconds
+    """
+    from sklearn.cluster import KMeans
+
+    embedding_dir = Path(embedding_dir)
+    embedding = np.load(embedding_dir / EMBEDDING_FILE)
+    start = time.time()
+    kmeans = KMeans(n_clusters=k, random_state=random_state, n_init=n_init)
+    labels = kmeans.fit_predict(embedding)
+    silhouette = evaluate_silhouette(embedding, labels, mode='sampled' if sample_size else 'exact',
+                                     sample_size=sample_size, random_state=random_state)
+
+    path = embedding_dir / kmeans_file(k, random_state, n_init, sample_size)
+    tmp_path = Path(f'{path}.tmp.npz')
+    np.savez(tmp_path, labels=labels, silhouette=silhouette['silhouette'], ci_low=silhouette['ci_low'],
+             ci_high=silhouette['ci_high'], inertia=kmeans.inertia_)
+    os.replace(tmp_path, path)
+    return {'embedding_dir': str(embedding_dir), 'k': k, 'seconds': time.time() - start}
+
+
+def _init_worker(threads):
+    # Several workers share the cores: keep each one's BLAS / OpenMP pools to its share
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:  # pragma: no cover - installed with scikit-learn
+        return
+    threadpool_limits(limits=threads)
+
+
+def _load_result(name, features, embedding_dir, k_range, random_state, n_init, sample_size, load_reducer):
+    """perform_umap_analysis' result dict from the cached files."""
+    embedding = np.load(embedding_dir / EMBEDDING_FILE)
+    silhouette_scores, intervals, inertias, labels = [], [], [], {}
+    for k in k_range:
+        with np.load(embedding_dir / kmeans_file(k, random_state, n_init, sample_size)) as stored:
+            silhouette_scores.append(float(stored['silhouette']))
+            # Exact results cached before intervals were stored have none
+            if 'ci_low' in stored.files:
+                intervals.append((float(stored['ci_low']), float(stored['ci_high'])))
+            else:
+                intervals.append((silhouette_scores[-1], silhouette_scores[-1]))
+            inertias.append(float(stored['inertia']))
+            labels[k] = stored['labels']
+
+    # Same choice as the notebook: the first k with the highest silhouette
+    best_k, best_silhouette = 2, -1
+    for k, score in zip(k_range, silhouette_scores):
+        if score > best_silhouette:
+            best_k, best_silhouette = k, score
+
+    umap_reducer = None
+    if load_reducer:
+        with open(embedding_dir / REDUCER_FILE, 'rb') as f:
+            umap_reducer = pickle.load(f)
+    return {
+        'embedding': embedding,
+        'best_k': best_k,
+        'best_silhouette': best_silhouette,
+        'best_labels': labels.get(best_k),
+        'silhouette_scores': silhouette_scores,
+        'silhouette_intervals': intervals,
+        'silhouette_mode': 'sampled' if sample_size else 'exact',
+        'inertias': inertias,
+        'k_range': k_range,
+        'features': list(features),
+        'name': name,
+        'umap_reducer': umap_reducer,
+        'cache_key': embedding_dir.name,
+    }
+
+
+def run_umap_sweep(data, feature_sets, cache_dir=DEFAULT_SWEEP_DIR, k_range=K_RANGE, umap_params=None,
+                   random_state=RANDOM_STATE, n_init=KMEANS_N_INIT, n_workers=None, load_reducers=True,
+                   silhouette_sample_above=SAMPLE_ABOVE_ROWS, silhouette_sample_size=SAMPLE_SIZE):
+    """
+    perform_umap_analysis for every feature set, in parallel and cached on disk.
+
+    Parameters:
+    -----------
+    data : DataFrame
+        Students with the feature columns (final_data)
+    feature_sets : dict
+        Name -> list of feature columns
+    cache_dir : str
+        Where embeddings and KMeans results are kept (see the module docstring)
+    k_range : range
+        KMeans cluster counts to try
+    umap_params : dict, optional
+        n_neighbors, min_dist, n_components, ... (default: UMAP_PARAMS)
+    random_state : int
+        Seed for UMAP and KMeans
+    n_init : int
+        KMeans restarts
+    n_workers : int, optional
+        Worker processes (default: os.cpu_count())
+    load_reducers : bool
+        Load each fitted UMAP reducer into the results (needed by save_model_artifacts)
+    silhouette_sample_above : int, optional
+        Estimate the silhouette from a stratified sample when there are more
+        students than this (None: always exact)
+    silhouette_sample_size : int
+        Students in that sample
+
+    Returns:
+    --------
+    dict mapping feature-set name -> the dict perform_umap_analysis returns,
+    plus 'cache_key', 'silhouette_mode' and 'silhouette_intervals' (one
+    (low, high) 95% interval per k; just the score when exact). A feature set whose fit fails is reported and left out,
+    as in the notebook loop.
+    """
+    umap_params = dict(UMAP_PARAMS if umap_params is None else umap_params)
+    k_range = range(k_range.start, k_range.stop, k_range.step) if isinstance(k_range, range) else list(k_range)
+    n_workers = n_workers or os.cpu_count() or 1
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    sample_size = None
+    if silhouette_sample_above is not None and len(data) > silhouette_sample_above:
+        sample_size = min(silhouette_sample_size, len(data))
+        print(f"📏 {len(data):,} students: silhouette estimated from a stratified sample of {sample_size:,}")
+
+    # Which fits and which k values are still missing
+    embedding_dirs, inputs = {}, {}
+    for name, features in feature_sets.items():
+        missing = [col for col in features if col not in data.columns]
+        if missing:
+            print(f"❌ Error analyzing {name}: missing columns {missing}")
+            continue
+        X = prepare_umap_input(data, features)
+        data_sha256 = frame_checksum(X)
+        embedding_dir = cache_dir / embedding_key(features, umap_params, random_state, data_sha256)
+        embedding_dirs[name] = embedding_dir
+        if not embedding_is_cached(embedding_dir):
+            # Two feature sets with the same columns and data share one fit
+            inputs.setdefault(embedding_dir, (X, features, data_sha256))
+
+    def missing_k(embedding_dir):
+        return [k for k in k_range
+                if not (embedding_dir / kmeans_file(k, random_state, n_init, sample_size)).exists()]
+
+    unique_dirs = list(dict.fromkeys(embedding_dirs.values()))
+    n_cached = sum(1 for embedding_dir in unique_dirs if embedding_dir not in inputs)
+    print(f"🗺️  {len(unique_dirs)} UMAP embeddings: {n_cached} cached, {len(inputs)} to fit "
+          f"({n_workers} workers)")
+
+    failed = {}
+    n_clustered = 0
+    start = time.time()
+    if inputs or any(missing_k(embedding_dir) for embedding_dir in unique_dirs):
+        threads = max(1, (os.cpu_count() or 1) // n_workers)
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(threads,)) as pool:
+            pending = {}
+
+            def submit_clusters(embedding_dir):
+                for k in missing_k(embedding_dir):
+                    future = pool.submit(cluster_embedding, str(embedding_dir), k, random_state, n_init, sample_size)
+                    pending[future] = embedding_dir
+
+            for embedding_dir, (X, features, data_sha256) in inputs.items():
+                future = pool.submit(fit_embedding, X, umap_params, random_state, str(embedding_dir),
+                                     features, data_sha256)
+                pending[future] = embedding_dir
+            for embedding_dir in unique_dirs:
+                if embedding_dir not in inputs:
+                    submit_clusters(embedding_dir)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    embedding_dir = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        failed[embedding_dir] = e
+                        continue
+                    if 'k' in result:
+                        n_clustered += 1
+                    else:
+                        print(f"✅ UMAP fitted on {result['rows']:,} rows in {result['seconds']:.1f}s")
+                        submit_clusters(embedding_dir)
+    print(f"🎯 {n_clustered} KMeans fits, {time.time() - start:.1f}s")
+
+    results = {}
+    for name, embedding_dir in embedding_dirs.items():
+        if embedding_dir in failed:
+            print(f"❌ Error analyzing {name}: {failed[embedding_dir]}")
+            continue
+        results[name] = result = _load_result(name, feature_sets[name], embedding_dir, k_range, random_state,
+                                              n_init, sample_size, load_reducers)
+        best_low, best_high = result['silhouette_intervals'][list(result['k_range']).index(result['best_k'])]
+        interval = f" (95% CI {best_low:.3f}-{best_high:.3f})" if sample_size else ''
+        print(f"🏆 {name}: k={result['best_k']}, Silhouette={result['best_silhouette']:.3f}{interval}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='UMAP + KMeans for each feature set, cached and in parallel.')
+    parser.add_argument('--features', required=True, help='features file from parallel_build.py (.parquet or .csv)')
+    parser.add_argument('--feature-sets', default=None,
+                        help='JSON file mapping name -> feature columns (default: the notebook\'s four sets)')
+    parser.add_argument('--cache-dir', default=DEFAULT_SWEEP_DIR, help='embedding and KMeans result cache')
+    parser.add_argument('--k-min', type=int, default=K_RANGE.start, help='smallest k')
+    parser.add_argument('--k-max', type=int, default=K_RANGE.stop - 1, help='largest k')
+    parser.add_argument('--n-neighbors', type=int, default=UMAP_PARAMS['n_neighbors'], help='UMAP n_neighbors')
+    parser.add_argument('--min-dist', type=float, default=UMAP_PARAMS['min_dist'], help='UMAP min_dist')
+    parser.add_argument('--seed', type=int, default=RANDOM_STATE, help='UMAP and KMeans random_state')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--silhouette-sample-above', type=int, default=SAMPLE_ABOVE_ROWS,
+                        help='estimate the silhouette from a sample above this many students (0: always exact)')
+    parser.add_argument('--silhouette-sample-size', type=int, default=SAMPLE_SIZE, help='students in that sample')
+    args = parser.parse_args()
+
+    data = pd.read_csv(args.features, index_col=0) if args.features.endswith('.csv') else pd.read_parquet(args.features)
+    feature_sets = DEFAULT_FEATURE_SETS
+    if args.feature_sets:
+        with open(args.feature_sets) as f:
+            feature_sets = json.load(f)
+
+    umap_params = dict(UMAP_PARAMS, n_neighbors=args.n_neighbors, min_dist=args.min_dist)
+    results = run_umap_sweep(data, feature_sets, cache_dir=args.cache_dir, k_range=range(args.k_min, args.k_max + 1),
+                             umap_params=umap_params, random_state=args.seed, n_workers=args.workers,
+                             load_reducers=False, silhouette_sample_above=args.silhouette_sample_above or None,
+                             silhouette_sample_size=args.silhouette_sample_size)
+
+    comparison = pd.DataFrame([{
+        'Feature Set': name,
+        'Num Features': len(result['features']),
+        'Best K': result['best_k'],
+        'Best Silhouette': result['best_silhouette'],
+    } for name, result in results.items()])
+    if len(comparison):
+        print(comparison.sort_values('Best Silhouette', ascending=False).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()